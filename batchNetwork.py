@@ -0,0 +1,180 @@
+import numpy as np
+import neat
+
+def clampedExp(z):
+    return np.exp(np.clip(z, -60.0, 60.0))
+
+def invActivation(z):
+    with np.errstate(divide="ignore", over="ignore"):
+        inverse = 1.0 / z
+    return np.where(np.isfinite(inverse), inverse, 0.0)
+
+# NumPy versions of neat's activation functions, applied to every car at once
+numpyActivations = {
+    "sigmoid": lambda z: 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    "tanh": lambda z: np.tanh(np.clip(2.5 * z, -60.0, 60.0)),
+    "sin": lambda z: np.sin(np.clip(5.0 * z, -60.0, 60.0)),
+    "gauss": lambda z: np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2),
+    "relu": lambda z: np.maximum(z, 0.0),
+    "softplus": lambda z: 0.2 * np.log1p(clampedExp(5.0 * z)),
+    "identity": lambda z: z,
+    "clamped": lambda z: np.clip(z, -1.0, 1.0),
+    "inv": invActivation,
+    "log": lambda z: np.log(np.maximum(z, 1e-7)),
+    "exp": clampedExp,
+    "abs": np.abs,
+    "hat": lambda z: np.maximum(0.0, 1.0 - np.abs(z)),
+    "square": np.square,
+    "cube": lambda z: z ** 3
+}
+
+class BatchNetwork:
+    """
+    Evaluates the feed forward networks of a whole generation at once.
+    Every node is put in a layer one deeper than the deepest node it reads from, and the layers of all the networks
+    are stacked into arrays padded to the largest network. Each layer is then one gather and one weighted sum over
+    every car, and each activation function in it is one NumPy call, so the Python work per frame grows with the
+    depth of the networks instead of the number of cars. The outputs match FeedForwardNetwork.activate to floating
+    point tolerance, since the sums are taken in a different order. Only the sum aggregation is supported, since the
+    padded links add zeros.
+    """
+
+    def __init__(self, genomes, config):
+        """
+        Compiles the networks of the genomes into stacked arrays.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs.
+            config: NEAT configuration.
+        """
+        unsupported = [name for name in config.genome_config.aggregation_options if name != "sum"]
+        if unsupported:
+            raise ValueError(f"Networks are evaluated in batches, which only supports the sum aggregation, not {', '.join(unsupported)}")
+        sumAggregation = config.genome_config.aggregation_function_defs.get("sum")
+        networks = [neat.nn.FeedForwardNetwork.create(genome, config) for _, genome in genomes]
+        inputKeys = config.genome_config.input_keys
+        outputKeys = config.genome_config.output_keys
+        activationNames = {config.genome_config.activation_defs.get(name): name for name in config.genome_config.activation_defs.functions}
+
+        self.numInputs = len(inputKeys)
+        numSlots = max([len(net.node_evals) for net in networks] + [1])
+
+        # Padded links read a column that stays 0 with a weight of 0, padded nodes write to a column nothing reads
+        self.zeroColumn = self.numInputs + numSlots
+        self.numColumns = self.zeroColumn + 2
+        discardColumn = self.zeroColumn + 1
+
+        # Every node of every network as (row, layer, column, links, bias, response, activation)
+        nodes = []
+        self.activations = []
+        self.outputColumns = np.full((len(networks), len(outputKeys)), self.zeroColumn, dtype=np.int64)
+        for row, net in enumerate(networks):
+            columns = {key: column for column, key in enumerate(inputKeys)}
+            layers = {key: 0 for key in inputKeys}
+            for slot, (node, activation, aggregation, bias, response, links) in enumerate(net.node_evals):
+                if aggregation is not sumAggregation:
+                    raise ValueError(f"Node {node} of genome {genomes[row][0]} doesn't sum its inputs, which is the only aggregation evaluated in batches")
+                columns[node] = self.numInputs + slot
+                layers[node] = 1 + max([layers[inputNode] for inputNode, _ in links] + [0])
+                if activation not in self.activations:
+                    self.activations.append(activation)
+                links = [(columns[inputNode], weight) for inputNode, weight in links]
+                nodes.append((row, layers[node], columns[node], links, bias, response, self.activations.index(activation)))
+            for output, key in enumerate(outputKeys):
+                if key in columns:
+                    self.outputColumns[row, output] = columns[key]
+
+        # neat's activations work on single floats, user defined ones without a NumPy version are vectorized
+        self.activationFunctions = [numpyActivations.get(activationNames.get(activation), np.vectorize(activation, otypes=[np.float64]))
+                                    for activation in self.activations]
+
+        self.selectedRows = None
+        self.selectedLayers = None
+        numLayers = max([layer for _, layer, *_ in nodes] + [0])
+        self.layers = []
+        for layer in range(1, numLayers + 1):
+            layerNodes = [node for node in nodes if node[1] == layer]
+            width = np.bincount([row for row, *_ in layerNodes], minlength=len(networks)).max()
+            maxLinks = max([len(links) for *_, links, _, _, _ in layerNodes] + [1])
+
+            linkSources = np.full((len(networks), width, maxLinks), self.zeroColumn, dtype=np.int64)
+            linkWeights = np.zeros((len(networks), width, maxLinks))
+            bias = np.zeros((len(networks), width))
+            response = np.zeros((len(networks), width))
+            activationIDs = np.zeros((len(networks), width), dtype=np.int64)
+            targetColumns = np.full((len(networks), width), discardColumn, dtype=np.int64)
+            filled = np.zeros(len(networks), dtype=np.int64)
+            for row, _, column, links, nodeBias, nodeResponse, activationID in layerNodes:
+                position = filled[row]
+                filled[row] += 1
+                for link, (source, weight) in enumerate(links):
+                    linkSources[row, position, link] = source
+                    linkWeights[row, position, link] = weight
+                bias[row, position] = nodeBias
+                response[row, position] = nodeResponse
+                activationIDs[row, position] = activationID
+                targetColumns[row, position] = column
+            self.layers.append((linkSources, linkWeights, bias, response, activationIDs, targetColumns))
+
+    def selectRows(self, rows):
+        """
+        Gathers every layer's arrays for some of the genomes, with the links and nodes as indices into the flattened
+        values of those genomes. Cars only stop now and then, so the last selection is kept and reused.
+
+        Args:
+            rows: Integer array of the positions of the genomes.
+
+        Returns:
+            List of (sources, weights, bias, response, activations, targets) for every layer, where activations is
+            a list of (activation function, boolean mask of the nodes that use it or None for every node).
+        """
+        if self.selectedRows is not None and np.array_equal(rows, self.selectedRows):
+            return self.selectedLayers
+
+        rowOffsets = (np.arange(len(rows)) * self.numColumns)[:, np.newaxis]
+        self.selectedLayers = []
+        for linkSources, linkWeights, bias, response, activationIDs, targetColumns in self.layers:
+            ids = activationIDs[rows]
+            activations = [(activation, ids == activationID) for activationID, activation in enumerate(self.activationFunctions) if (ids == activationID).any()]
+            if len(activations) == 1:
+                activations = [(activations[0][0], None)]
+            self.selectedLayers.append((
+                linkSources[rows] + rowOffsets[:, :, np.newaxis],
+                linkWeights[rows],
+                bias[rows],
+                response[rows],
+                activations,
+                (targetColumns[rows] + rowOffsets).ravel()
+            ))
+        self.selectedRows = rows.copy()
+        return self.selectedLayers
+
+    def activate(self, inputs, rows):
+        """
+        Evaluates the networks of some of the genomes.
+
+        Args:
+            inputs: Array of shape (M, numInputs) with the inputs of each network.
+            rows: Positions of the M genomes in the list the networks were compiled from.
+
+        Returns:
+            Array of shape (M, numOutputs) with the outputs of each network.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return np.zeros((0, self.outputColumns.shape[1]))
+        values = np.zeros((len(rows), self.numColumns))
+        values[:, :self.numInputs] = inputs
+        flatValues = values.ravel()
+
+        for sources, weights, bias, response, activations, targets in self.selectRows(rows):
+            z = bias + response * np.einsum("mkl,mkl->mk", flatValues[sources], weights)
+            if activations[0][1] is None:
+                activated = activations[0][0](z)
+            else:
+                activated = np.empty_like(z)
+                for activation, usesActivation in activations:
+                    activated[usesActivation] = activation(z[usesActivation])
+            flatValues[targets] = activated.ravel()
+
+        return values[np.arange(len(rows))[:, np.newaxis], self.outputColumns[rows]]
@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import statistics
+import pygame
+import neat
+import numpy as np
+from car import loadCarImage, cacheRotations
+from track import loadTrack
+from simulation import Simulation, EvaluationPolicy
+from fleet import CarFleet, integrators
+from profiler import StageTimer
+from replay import fitnessDigest
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+#====================================================================================================
+# Benchmark Parameters
+benchmarkTracks = ["images/easyTest.png", "images/hardTest.png"]
+configFile = "configFiles/config.txt"
+simulationTimestep = 1 / 80  # Same as the headless timestep in main.py
+physicsIntegrator = "euler"
+
+# The integrator error is measured by driving random inputs with the chosen integrator and with euler at the
+# reference timestep, holding every input for one step of the chosen timestep
+referenceTimestep = 1 / 80
+errorCars = 500
+errorSeconds = 3
+#====================================================================================================
+
+class ReproductionTimer(neat.reporting.BaseReporter):
+    """
+    Times the part of every generation NEAT spends on reproduction and speciation, which happens between
+    post_evaluate and end_generation.
+    """
+
+    def __init__(self):
+        self.seconds = 0
+        self.start = None
+
+    def post_evaluate(self, config, population, species, best_genome):
+        self.start = time.perf_counter()
+
+    def end_generation(self, config, population, species_set):
+        if self.start is not None:
+            self.seconds += time.perf_counter() - self.start
+            self.start = None
+
+def peakMemoryMB():
+    """
+    Returns:
+        Peak resident memory of the process in megabytes, or None where it can't be read.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024  # bytes on macOS, kilobytes on Linux
+
+def lapStatistics(lapTimes):
+    """
+    Summarizes the lap times completed during a benchmark.
+
+    Args:
+        lapTimes: List of lap times in simulated seconds.
+
+    Returns:
+        Dictionary with the count, best, mean and median lap time.
+    """
+    if not lapTimes:
+        return {"count": 0, "best": None, "mean": None, "median": None}
+    return {
+        "count": len(lapTimes),
+        "best": min(lapTimes),
+        "mean": statistics.fmean(lapTimes),
+        "median": statistics.median(lapTimes)
+    }
+
+def referenceStepsPerStep(timestep):
+    """
+    Args:
+        timestep: Simulated seconds per step of the integrator being measured.
+
+    Returns:
+        Number of reference timesteps in one step, or None if the timestep isn't a multiple of the reference timestep.
+    """
+    referenceSteps = round(timestep / referenceTimestep)
+    if referenceSteps < 1 or not math.isclose(referenceSteps * referenceTimestep, timestep):
+        return None
+    return referenceSteps
+
+def integratorError(integrator, timestep, seed):
+    """
+    Measures how far an integrator's cars drift from euler at the reference timestep. Both fleets get the same
+    random throttle and steering, so the difference is the integration error alone and not a network reacting to
+    it. The chosen timestep must be a multiple of the reference timestep.
+
+    Args:
+        integrator: Name of the integrator being measured.
+        timestep: Simulated seconds per step of the integrator being measured.
+        seed: Seed for the random inputs.
+
+    Returns:
+        Dictionary with the largest and mean position error in pixels and the largest heading error in degrees
+        at the end of every step.
+    """
+    referenceSteps = referenceStepsPerStep(timestep)
+    if referenceSteps is None:
+        raise ValueError(f"Timestep {timestep} is not a multiple of the reference timestep {referenceTimestep}")
+
+    generator = np.random.default_rng(seed)
+    fleet = CarFleet(errorCars, 0, 0, integrator)
+    reference = CarFleet(errorCars, 0, 0, "euler")
+    rows = np.arange(errorCars)
+    positionErrors = []
+    headingErrors = []
+    for _ in range(round(errorSeconds / timestep)):
+        throttle = generator.uniform(0, 1, errorCars)
+        steering = generator.uniform(-1, 1, errorCars)
+        for carFleet, dt, steps in ((fleet, timestep, 1), (reference, referenceTimestep, referenceSteps)):
+            for _ in range(steps):
+                carFleet.throttlePosition[rows] = throttle
+                carFleet.currentWheelAngle[rows] = steering * carFleet.maxWheelAngle[rows]
+                carFleet.advance(dt, rows)
+        positionErrors.append(np.hypot(fleet.carX - reference.carX, fleet.carY - reference.carY))
+        headingErrors.append(np.abs(np.angle(np.exp(1j * (fleet.carAngle - reference.carAngle)))))
+
+    positionErrors = np.concatenate(positionErrors)
+    return {
+        "integrator": integrator,
+        "timestep": timestep,
+        "referenceTimestep": referenceTimestep,
+        "maxPositionError": float(positionErrors.max()),
+        "meanPositionError": float(positionErrors.mean()),
+        "maxHeadingErrorDegrees": math.degrees(float(np.max(headingErrors)))
+    }
+
+def runBenchmark(trackPath, generations, seed, networkPath=None, timestep=simulationTimestep, integrator=physicsIntegrator, policy=None):
+    """
+    Trains a Best Time population headless on a track and measures how fast each part of the training runs.
+    Unlike main.py no lap record bonuses are added, so the fitness digests are only comparable between benchmarks.
+
+    Args:
+        trackPath: Path to the track image or compiled track.
+        generations: Number of generations to simulate.
+        seed: Seed for the random module NEAT uses.
+        networkPath: Optional checkpoint to start from instead of a new population.
+        timestep: Simulated seconds per step.
+        integrator: Name of the fleet integrator that moves the cars.
+        policy: Optional EvaluationPolicy for stopping cars and generations early.
+
+    Returns:
+        Dictionary of the measurements.
+    """
+    pygame.display.set_mode((1, 1))
+    track = loadTrack(trackPath)
+    carImage = loadCarImage("images/f1CarRed.png")
+    cacheRotations(carImage)
+
+    config = neat.config.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        configFile
+    )
+    random.seed(seed)
+    if networkPath is not None:
+        population = neat.Checkpointer.restore_checkpoint(networkPath)
+        random.seed(seed)  # Restoring a checkpoint also restores the random state it was saved with
+    else:
+        population = neat.Population(config)
+    reproductionTimer = ReproductionTimer()
+    population.add_reporter(reproductionTimer)
+
+    timer = StageTimer()
+    carSteps = 0
+    simulationSeconds = 0
+    simulatedSeconds = 0
+    lapTimes = []
+    digests = []
+
+    def evalGenomes(genomes, config):
+        nonlocal carSteps, simulationSeconds, simulatedSeconds
+        simulation = Simulation(genomes, config, track, carImage, (1.0, 1.0, 1.0, 1.0), timer, integrator, policy)
+        timeLimit = (30 * population.generation) / (19 + population.generation) + 3
+
+        start = time.perf_counter()
+        while simulation.running(timeLimit):
+            carSteps += simulation.alive()
+            timer.start()
+            for car, genome, lapTime in simulation.step(timestep):
+                lapTimes.append(lapTime)
+        simulation.finish(timeLimit, timestep)
+        simulationSeconds += time.perf_counter() - start
+        simulatedSeconds += simulation.time
+        digests.append(fitnessDigest(dict(genomes)))
+
+    start = time.perf_counter()
+    population.run(evalGenomes, generations)
+    totalSeconds = time.perf_counter() - start
+
+    stageSeconds = dict(timer.totals)
+    stageSeconds["reproduction"] = reproductionTimer.seconds
+    return {
+        "generations": len(digests),
+        "totalSeconds": totalSeconds,
+        "simulationSeconds": simulationSeconds,
+        "carSteps": carSteps,
+        "carStepsPerSecond": carSteps / simulationSeconds if simulationSeconds else None,
+        "simulatedSecondsPerGeneration": simulatedSeconds / len(digests) if digests else None,
+        "bestFitness": population.best_genome.fitness,
+        "stageSeconds": stageSeconds,
+        "lapTimes": lapStatistics(lapTimes),
+        "fitnessDigests": digests
+    }
+
+def printResults(trackPath, results):
+    """
+    Prints a summary of a track's benchmark.
+
+    Args:
+        trackPath: Path to the track image or compiled track.
+        results: Dictionary returned by runBenchmark.
+    """
+    print(f"{trackPath}: {results['generations']} generations in {results['totalSeconds']:.2f}s")
+    print(f"{'Car steps per second:':>24} {results['carStepsPerSecond'] or 0:,.0f}")
+    print(f"{'Simulated seconds:':>24} {results['simulatedSecondsPerGeneration'] or 0:.2f} per generation")
+    for stage, seconds in results["stageSeconds"].items():
+        print(f"{stage + ':':>24} {seconds:.3f}s")
+    laps = results["lapTimes"]
+    if laps["count"]:
+        print(f"{'Laps:':>24} {laps['count']}  Best: {laps['best']:.2f}  Mean: {laps['mean']:.2f}  Median: {laps['median']:.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the training throughput of the simulation")
+    parser.add_argument("--generations", type=int, default=5, help="number of generations to simulate on each track")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random module NEAT uses")
+    parser.add_argument("--network", help="checkpoint to start every track from (ex. checkpoints/129-6.43)")
+    parser.add_argument("--tracks", nargs="+", default=benchmarkTracks, help="track images to benchmark")
+    parser.add_argument("--timestep", type=float, default=simulationTimestep, help="simulated seconds per step")
+    parser.add_argument("--integrator", choices=integrators, default=physicsIntegrator, help="how the cars are moved between steps")
+    parser.add_argument("--finishAfterLaps", type=int, help="take a car off the track once it completes this many laps")
+    parser.add_argument("--stallSeconds", type=float, help="stop a car that doesn't move 100 pixels in this many seconds")
+    parser.add_argument("--endAfterFinishers", type=int, help="end a generation once this many cars have finished")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file the results are written to")
+    args = parser.parse_args()
+    if referenceStepsPerStep(args.timestep) is None:
+        parser.error(f"--timestep must be a multiple of the reference timestep {referenceTimestep:g} (ex. 0.025 or 0.05)")
+
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    pygame.init()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "network": args.network,
+        "timestep": args.timestep,
+        "integrator": args.integrator,
+        "tracks": {}
+    }
+    policy = None
+    if args.finishAfterLaps is not None or args.stallSeconds is not None:
+        policy = EvaluationPolicy(args.finishAfterLaps, args.stallSeconds, finishersToEnd=args.endAfterFinishers)
+        results["policy"] = vars(policy)
+    for trackPath in args.tracks:
+        results["tracks"][trackPath] = runBenchmark(trackPath, args.generations, args.seed, args.network, args.timestep, args.integrator, policy)
+        printResults(trackPath, results["tracks"][trackPath])
+
+    error = results["integratorError"] = integratorError(args.integrator, args.timestep, args.seed)
+    print(f"{args.integrator} at {args.timestep:g}s vs euler at {referenceTimestep:g}s over {errorSeconds}s: "
+          f"max {error['maxPositionError']:.2f}px, mean {error['meanPositionError']:.2f}px, heading {error['maxHeadingErrorDegrees']:.2f} degrees")
+    results["peakMemoryMB"] = peakMemoryMB()
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=4)
+    if results["peakMemoryMB"] is not None:
+        print(f"Peak memory: {results['peakMemoryMB']:.1f} MB")
+    print(f"Results written to {args.output}")
+
+    pygame.quit()
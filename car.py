@@ -1,12 +1,90 @@
 import pygame
 import math
+import numpy as np
+from fleet import CarFleet
+
+headingBins = 720  # Number of headings each car image is pre-rotated to
+rotationCache = {}  # Car image -> list of (rotated image, rotated mask) for every heading bin
+
+def loadCarImage(path):
+    """
+    Loads a car image scaled to the size cars are drawn at.
+
+    Args:
+        path: Path to the image file.
+
+    Returns:
+        Pygame surface of the car.
+    """
+    return pygame.transform.scale(pygame.image.load(path), (50, 25))
+
+def cacheRotations(carImage):
+    """
+    Pre-rotates a car image to every heading bin and builds the collision mask of each rotation.
+    Every car with the same image shares these, so no car has to rotate its image or build a mask during a frame.
+
+    Args:
+        carImage: Pygame surface of the car.
+
+    Returns:
+        List of (rotated image, rotated mask) indexed by heading bin.
+    """
+    if carImage not in rotationCache:
+        rotations = []
+        for headingBin in range(headingBins):
+            rotatedCarImage = pygame.transform.rotate(carImage, headingBin * 360 / headingBins)
+            rotations.append((rotatedCarImage, pygame.mask.from_surface(rotatedCarImage)))
+        rotationCache[carImage] = rotations
+    return rotationCache[carImage]
+
+def fleetAttribute(name):
+    """
+    Creates a property that reads and writes the car's row of a CarFleet array.
+
+    Args:
+        name: Name of the CarFleet array.
+
+    Returns:
+        The property.
+    """
+    def getter(self):
+        return getattr(self.fleet, name).item(self.row)
+
+    def setter(self, value):
+        getattr(self.fleet, name)[self.row] = value
+
+    return property(getter, setter)
 
 class Car:
     """
     Represents a car in the F1 simulation.
+    Its physical state lives in one row of a CarFleet so the simulation can advance every car at once.
     """
 
-    def __init__(self, x, y, carColor):
+    # Position and movement
+    carX = fleetAttribute("carX")
+    carY = fleetAttribute("carY")
+    carAngle = fleetAttribute("carAngle")  # Angle in relation to the screen (radians)
+    currentWheelAngle = fleetAttribute("currentWheelAngle")
+    maxWheelAngle = fleetAttribute("maxWheelAngle")
+
+    # Physics properties
+    mass = fleetAttribute("mass")  # lbs
+    coefficientOfFriction = fleetAttribute("coefficientOfFriction")
+    downforceNewtons = fleetAttribute("downforceNewtons")
+    wheelBase = fleetAttribute("wheelBase")  # ft
+
+    # Kinematic properties
+    velocity = fleetAttribute("velocity")  # ft/s
+    minimunVelocity = fleetAttribute("minimunVelocity")
+    maxVelocityAchieved = fleetAttribute("maxVelocityAchieved")
+    maxVelocity = fleetAttribute("maxVelocity")  # ft/s
+    passedMin = fleetAttribute("passedMin")
+    deceleration = fleetAttribute("deceleration")  # ft/s^2
+    acceleration = fleetAttribute("acceleration")  # ft/s^2
+    throttlePosition = fleetAttribute("throttlePosition")  # 0-1 scale
+
+    def __init__(self, x, y, carColor, fleet=None, row=0):
         """
         Initializes the car with position (x, y) and color.
 
@@ -14,25 +92,30 @@ class Car:
             x: Initial x-coordinate.
             y: Initial y-coordinate.
             carColor: Pygame surface representing the car's image.
+            fleet: CarFleet holding the car's physical state, a fleet of one car is created if not given.
+            row: The car's row in the fleet.
         """
         # Load the car
         self.f1CarImage = carColor
         self.genomeID = None
 
+        # Physical state
+        if fleet is None:
+            fleet = CarFleet(1, x, y)
+        self.fleet = fleet
+        self.row = row
+        self.rows = np.array([row])
+
         # Status flags
         self.crashed = False
+        self.crashTime = None  # Simulated time at the start of the step the car crashed in
         self.hitFinishLine = True
         self.leftFinishLine = False
         self.lapStart = 0
         self.totalLaps = []
         self.completedLap = False
-
-        # Position and movement
-        self.carX = x
-        self.carY = y
-        self.carAngle = 0  # Angle in relation to the screen (radians)
-        self.currentWheelAngle = 0
-        self.maxWheelAngle = math.radians(20)
+        self.finished = False  # Set when an EvaluationPolicy takes the car off the track after its laps
+        self.finishTime = None
 
         # Sensor readings
         self.frontCast = 0
@@ -43,27 +126,6 @@ class Car:
         self.left45AngleCast = 0
         self.right45AngleCast = 0
 
-        # Physics properties
-        self.mass = 1760  # lbs
-        self.coefficientOfFriction = 1.8
-        self.downforce = 4500  # lbs
-        self.downforceNewtons = self.downforce * 4.44822  # Convert to Newtons
-        self.wheelBase = 8  # ft
-
-        # Kinematic properties
-        self.velocity = 0  # ft/s
-        self.minimunVelocity = 200
-        self.maxVelocityAchieved = 0
-        self.maxVelocity = 330 * 1.3  # ft/s (~225 mph)
-        self.passedMin = False
-
-        self.torque = 1000  # lb-ft
-        self.brakingPower = 30000  # Reflects braking forces of 4-5 Gs
-        self.wheelRadius = 1.2  # ft
-        self.deceleration = self.brakingPower / (self.mass * self.wheelRadius) * 100  # ft/s^2
-        self.acceleration = self.torque / (self.mass * self.wheelRadius) * 1000  # ft/s^2
-        self.throttlePosition = 0.5  # 0-1 scale
-
     def updateVelocity(self, dt):
         """
         Updates the car's velocity based on throttle position and time delta.
@@ -71,29 +133,7 @@ class Car:
         Args:
             dt: Delta time since last frame.
         """
-        if self.throttlePosition > 0.5:
-            throttleValue = (self.throttlePosition - 0.5) * 3
-            self.velocity = min(self.velocity + self.acceleration * dt * throttleValue, self.maxVelocity)
-        elif self.throttlePosition < 0.5:
-            brakeValue = (0.5 - self.throttlePosition) * 2
-            self.velocity = max(self.velocity - self.deceleration * dt * brakeValue, 0)
-
-        if self.passedMin:
-            self.velocity = max(self.velocity, self.minimunVelocity)
-        else:
-            self.velocity = max(self.velocity, self.maxVelocityAchieved)
-            if self.velocity > self.minimunVelocity:
-                self.passedMin = True
-
-        self.maxWheelAngle = self.calculateMaxSteeringAngle()
-        if self.currentWheelAngle < 0:
-            self.currentWheelAngle = max(-self.maxWheelAngle, self.currentWheelAngle)
-        else:
-            self.currentWheelAngle = min(self.maxWheelAngle, self.currentWheelAngle)
-
-        if self.velocity > self.maxVelocityAchieved:
-            self.maxVelocityAchieved = self.velocity
-
+        self.fleet.updateVelocity(dt, self.rows)
 
     def calculateMaxLateralAcceleration(self):
         """
@@ -102,10 +142,7 @@ class Car:
         Returns:
             Lateral acceleration in m/s^2.
         """
-        massKG = self.mass * 0.453592  # Convert lbs to kg
-        g = 9.81  # Gravitational acceleration in m/s^2
-        lateralAcceleration = (self.coefficientOfFriction * g) + (self.downforceNewtons / (massKG * 0.075))
-        return lateralAcceleration  # m/s^2
+        return self.fleet.calculateMaxLateralAcceleration(self.rows).item()
 
     def calculateTurningRadius(self):
         """
@@ -114,14 +151,7 @@ class Car:
         Returns:
             Turning radius in meters.
         """
-        maxLateralAcceleration = self.calculateMaxLateralAcceleration()
-        velocityMeterSecond = self.velocity * 0.3048  # Convert ft/s to m/s
-
-        if maxLateralAcceleration > 0:
-            turningRadius = (velocityMeterSecond ** 2) / maxLateralAcceleration
-            return turningRadius  # meters
-        else:
-            return float('inf')
+        return self.fleet.calculateTurningRadius(self.rows).item()
 
     def calculateMaxSteeringAngle(self):
         """
@@ -130,12 +160,7 @@ class Car:
         Returns:
             Maximum steering angle in radians.
         """
-        turningRadius = self.calculateTurningRadius()
-        if turningRadius == 0:
-            return self.maxWheelAngle
-
-        steeringAngleRadians = math.atan(self.wheelBase / (turningRadius / 0.3048))  # Convert radius to ft
-        return min(steeringAngleRadians, math.radians(20))
+        return self.fleet.calculateMaxSteeringAngle(self.rows).item()
 
     def updateCarPosition(self, dt):
         """
@@ -144,19 +169,17 @@ class Car:
         Args:
             dt: Delta time since last frame.
         """
-        self.updateVelocity(dt)
-
-        if self.velocity > 0 and self.currentWheelAngle != 0:
-            turningRadius = self.wheelBase / math.tan(self.currentWheelAngle)
-            angularVelocity = self.velocity / turningRadius
-        else:
-            angularVelocity = 0
+        self.fleet.updateCarPosition(dt, self.rows)
 
-        if angularVelocity != 0:
-            self.carAngle += angularVelocity * dt
+    def rotatedCar(self):
+        """
+        Looks up the car's image and collision mask rotated to the closest heading bin.
 
-        self.carX += self.velocity * math.cos(self.carAngle) * dt
-        self.carY += self.velocity * math.sin(self.carAngle) * dt
+        Returns:
+            Tuple of the rotated image and its mask.
+        """
+        headingBin = round(-math.degrees(self.carAngle) * headingBins / 360) % headingBins
+        return cacheRotations(self.f1CarImage)[headingBin]
 
     def displayCar(self, screen):
         """
@@ -165,7 +188,7 @@ class Car:
         Args:
             screen: The pygame surface to draw on.
         """
-        rotatedCarImage = pygame.transform.rotate(self.f1CarImage, -math.degrees(self.carAngle))
+        rotatedCarImage, _ = self.rotatedCar()
         rotatedRect = rotatedCarImage.get_rect(center=(self.carX, self.carY))
         screen.blit(rotatedCarImage, rotatedRect.topleft)
 
@@ -232,6 +255,7 @@ class Car:
     def castLines(self, screen, pixelArray):
         """
         Casts multiple lines (sensors) from the car in different directions.
+        The simulation casts the sensors of every car at once with sensors.castRays, which returns the same distances.
 
         Args:
             screen: The pygame surface to use.
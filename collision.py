@@ -0,0 +1,210 @@
+import numpy as np
+from car import cacheRotations, headingBins
+from track import maskToGrid
+
+footprintCache = {}  # Car image -> Footprints
+
+def roundHalfAway(values):
+    """
+    Rounds coordinates the way pygame does when a rect is centered on them, with halves rounded away from zero.
+
+    Args:
+        values: Array of floats.
+
+    Returns:
+        Integer array of the rounded values.
+    """
+    whole = np.trunc(values)
+    return (whole + np.where(np.abs(values - whole) >= 0.5, np.sign(values), 0)).astype(np.int64)
+
+class Footprints:
+    """
+    The pixels a car's collision mask covers at every heading bin, stored as horizontal runs of pixels offset from
+    the pixel its rotated image is centered on. A run is checked against a grid with one lookup in the grid's row
+    prefix sums, so the footprints of many cars are checked in one array operation of about 80 lookups per car
+    instead of one per pixel.
+    """
+
+    def __init__(self, carImage):
+        """
+        Builds the footprint of every pre-rotated mask of a car image.
+
+        Args:
+            carImage: Pygame surface of the car.
+        """
+        offsetsX = []
+        offsetsY = []
+        runsY = []
+        runsStartX = []
+        runsEndX = []
+        for rotatedCarImage, carMask in cacheRotations(carImage):
+            maskGrid = maskToGrid(carMask)
+            pixelsX, pixelsY = np.nonzero(maskGrid)
+            # A rect centered on a pixel starts half its size before it
+            centerX = rotatedCarImage.get_width() // 2
+            centerY = rotatedCarImage.get_height() // 2
+            offsetsX.append(pixelsX - centerX)
+            offsetsY.append(pixelsY - centerY)
+
+            # Runs start where a row turns on and end where it turns off
+            padded = np.zeros((maskGrid.shape[0] + 2, maskGrid.shape[1]), dtype=np.int8)
+            padded[1:-1] = maskGrid
+            startX, startY = np.nonzero(np.diff(padded, axis=0).T == 1)[::-1]
+            endX, endY = np.nonzero(np.diff(padded, axis=0).T == -1)[::-1]
+            runsY.append(startY - centerY)
+            runsStartX.append(startX - centerX)
+            runsEndX.append(endX - centerX)  # One past the last pixel of the run
+
+        self.counts = np.array([len(binRuns) for binRuns in runsY], dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+        self.runsY = np.concatenate(runsY).astype(np.int64)
+        self.runsStartX = np.concatenate(runsStartX).astype(np.int64)
+        self.runsEndX = np.concatenate(runsEndX).astype(np.int64)
+
+        # Bounding box of each footprint and the farthest chessboard distance of any of its pixels
+        self.minX = np.array([binOffsets.min(initial=0) for binOffsets in offsetsX])
+        self.maxX = np.array([binOffsets.max(initial=0) for binOffsets in offsetsX])
+        self.minY = np.array([binOffsets.min(initial=0) for binOffsets in offsetsY])
+        self.maxY = np.array([binOffsets.max(initial=0) for binOffsets in offsetsY])
+        self.radius = np.maximum(np.maximum(-self.minX, self.maxX), np.maximum(-self.minY, self.maxY))
+
+    def boxesClear(self, areaSums, centerX, centerY, headingBin):
+        """
+        Checks which footprints' bounding boxes hold no set pixel of a grid. A footprint whose box is clear can't
+        overlap the grid, which takes 4 lookups to rule out instead of one per run.
+
+        Args:
+            areaSums: Summed area table of the grid from track.summedAreaTable.
+            centerX, centerY: Integer arrays of the pixels the footprints are centered on.
+            headingBin: Integer array of the heading bin of each footprint.
+
+        Returns:
+            Boolean array that is True for every footprint whose bounding box is clear.
+        """
+        width = areaSums.shape[0] - 1
+        height = areaSums.shape[1] - 1
+        left = np.clip(centerX + self.minX[headingBin], 0, width)
+        right = np.clip(centerX + self.maxX[headingBin] + 1, 0, width)
+        top = np.clip(centerY + self.minY[headingBin], 0, height)
+        bottom = np.clip(centerY + self.maxY[headingBin] + 1, 0, height)
+        return areaSums[right, bottom] - areaSums[left, bottom] - areaSums[right, top] + areaSums[left, top] == 0
+
+    def overlaps(self, rowSums, centerX, centerY, headingBin):
+        """
+        Checks which footprints cover a set pixel of a grid. Pixels outside the grid never count, like
+        pygame.mask.Mask.overlap.
+
+        Args:
+            rowSums: Row prefix sums of the grid from track.rowPrefixSums.
+            centerX, centerY: Integer arrays of the pixels the footprints are centered on.
+            headingBin: Integer array of the heading bin of each footprint.
+
+        Returns:
+            Boolean array that is True for every footprint that covers a set pixel.
+        """
+        counts = self.counts[headingBin]
+        total = counts.sum()
+        if total == 0:
+            return np.zeros(len(headingBin), dtype=bool)
+
+        # Lay out the runs of every footprint one after another
+        owner = np.repeat(np.arange(len(headingBin)), counts)
+        run = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(self.starts[headingBin], counts)
+        runY = centerY[owner] + self.runsY[run]
+        width = rowSums.shape[0] - 1
+        runStartX = np.clip(centerX[owner] + self.runsStartX[run], 0, width)
+        runEndX = np.clip(centerX[owner] + self.runsEndX[run], 0, width)
+
+        onGrid = (runY >= 0) & (runY < rowSums.shape[1])
+        runY = runY[onGrid]
+        covered = rowSums[runEndX[onGrid], runY] > rowSums[runStartX[onGrid], runY]
+        hits = np.zeros(len(headingBin), dtype=bool)
+        hits[owner[onGrid][covered]] = True
+        return hits
+
+def headingBinOf(carAngle):
+    """
+    Returns:
+        Integer array of the heading bin of every angle, the same bin Car.rotatedCar uses.
+    """
+    return np.round(-np.degrees(carAngle) * headingBins / 360).astype(np.int64) % headingBins
+
+def getFootprints(carImage):
+    """
+    Returns:
+        The Footprints of a car image, built the first time it is needed.
+    """
+    if carImage not in footprintCache:
+        footprintCache[carImage] = Footprints(carImage)
+    return footprintCache[carImage]
+
+def checkFleetCollisions(track, footprints, carX, carY, carAngle, previousX=None, previousY=None, previousAngle=None):
+    """
+    Checks many cars against the walls and the finish line at once. The results are the same as calling
+    checkCollisionWithWhitePixels and checkCollisionWithFinishLine for each car, but only the cars close enough to a
+    wall or the finish line have their footprint looked up.
+    If the cars' previous poses are given, a car also crashes if it passed through a wall on its way from the
+    previous pose, so a fast car can't skip over a wall thinner than the distance it moves in a step.
+
+    Args:
+        track: The track being driven.
+        footprints: Footprints of the cars' image.
+        carX, carY: Arrays of the cars' positions.
+        carAngle: Array of the cars' headings in radians.
+        previousX, previousY: Optional arrays of the cars' positions before the step.
+        previousAngle: Optional array of the cars' headings before the step.
+
+    Returns:
+        Tuple of boolean arrays: which cars crashed and which cars touch the finish line.
+    """
+    outOfBoundsRowSums, outOfBoundsAreaSums, outOfBoundsField, finishLineRowSums, finishLineBox = track.collisionGrids()
+    headingBin = headingBinOf(carAngle)
+    centerX = roundHalfAway(carX)
+    centerY = roundHalfAway(carY)
+
+    crashed = (carX > track.width) | (carX < 0) | (carY > track.height) | (carY < 0)
+
+    # A car farther from every wall than the farthest pixel of its footprint can't overlap one
+    onTrack = (centerX >= 0) & (centerX < track.width) & (centerY >= 0) & (centerY < track.height)
+    clearance = np.zeros(len(carX), dtype=np.int64)
+    clearance[onTrack] = outOfBoundsField[centerX[onTrack], centerY[onTrack]]
+    nearWall = np.nonzero(clearance <= footprints.radius[headingBin])[0]
+    nearWall = nearWall[~footprints.boxesClear(outOfBoundsAreaSums, centerX[nearWall], centerY[nearWall], headingBin[nearWall])]
+    crashed[nearWall] |= footprints.overlaps(outOfBoundsRowSums, centerX[nearWall], centerY[nearWall], headingBin[nearWall])
+
+    if previousX is not None:
+        # Cars that moved more than a pixel are checked at every pixel along the way, unless even the far end of the
+        # move leaves them clear of every wall
+        travel = np.ceil(np.maximum(np.abs(carX - previousX), np.abs(carY - previousY))).astype(np.int64)
+        swept = np.nonzero(~crashed & (travel > 1) & (clearance <= footprints.radius.max() + travel))[0]
+        if len(swept):
+            samples = travel[swept] - 1
+            owner = np.repeat(swept, samples)
+            fraction = (np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples) + 1) / travel[owner]
+            sampleX = previousX[owner] + (carX[owner] - previousX[owner]) * fraction
+            sampleY = previousY[owner] + (carY[owner] - previousY[owner]) * fraction
+            sampleAngle = previousAngle[owner] + (carAngle[owner] - previousAngle[owner]) * fraction
+            sampleCenterX = roundHalfAway(sampleX)
+            sampleCenterY = roundHalfAway(sampleY)
+            sampleBin = headingBinOf(sampleAngle)
+
+            # Only the samples close to a wall need their footprint looked up
+            sampleOnTrack = (sampleCenterX >= 0) & (sampleCenterX < track.width) & (sampleCenterY >= 0) & (sampleCenterY < track.height)
+            sampleClearance = np.zeros(len(owner), dtype=np.int64)
+            sampleClearance[sampleOnTrack] = outOfBoundsField[sampleCenterX[sampleOnTrack], sampleCenterY[sampleOnTrack]]
+            near = np.nonzero(sampleClearance <= footprints.radius[sampleBin])[0]
+            near = near[~footprints.boxesClear(outOfBoundsAreaSums, sampleCenterX[near], sampleCenterY[near], sampleBin[near])]
+            hits = footprints.overlaps(outOfBoundsRowSums, sampleCenterX[near], sampleCenterY[near], sampleBin[near])
+            crashed[owner[near][hits]] = True
+
+    # Only cars whose footprint's bounding box reaches the finish line's can touch it
+    hitFinishLine = np.zeros(len(carX), dtype=bool)
+    if finishLineBox is not None:
+        left, top, right, bottom = finishLineBox
+        nearFinishLine = (
+            (centerX + footprints.maxX[headingBin] >= left) & (centerX + footprints.minX[headingBin] <= right) &
+            (centerY + footprints.maxY[headingBin] >= top) & (centerY + footprints.minY[headingBin] <= bottom)
+        )
+        hitFinishLine[nearFinishLine] = footprints.overlaps(finishLineRowSums, centerX[nearFinishLine], centerY[nearFinishLine], headingBin[nearFinishLine])
+
+    return crashed, hitFinishLine
@@ -83,6 +83,23 @@ class RacingConfig():
         self.headToHeadMode = False
         self.window.destroy()
 
+class HeadlessConfig():
+    '''Holds the same settings as RacingConfig for runs where no window can be opened'''
+    def __init__(self, headToHeadMode, existingTrackPath, existingNetworkPath=None):
+        self.headToHeadMode = headToHeadMode
+
+        # Every multiplier is left at its default of 1.0
+        self.accelerationMult = self.accelerationMultRed = self.accelerationMultGreen = 1.0
+        self.decelerationMult = self.decelerationMultRed = self.decelerationMultGreen = 1.0
+        self.downforceMult = self.downforceMultRed = self.downforceMultGreen = 1.0
+        self.maxSpeedMult = self.maxSpeedMultRed = self.maxSpeedMultGreen = 1.0
+
+        # Headless runs can't draw a track, so one must always be loaded
+        self.usingExistingTrack = True
+        self.existingTrackPath = existingTrackPath
+        self.usingExistingNetwork = existingNetworkPath is not None
+        self.existingNetworkPath = existingNetworkPath
+
 class StartPage():
     def __init__(self, root, window):
         self.frame = tk.Frame(window)
@@ -0,0 +1,101 @@
+import hashlib
+from collections import OrderedDict
+
+def genomeKey(genome):
+    """
+    Hashes everything about a genome that changes how its car drives: its enabled connections and their weights and
+    every node's bias, response, activation and aggregation. Copies of a genome, like the elites NEAT carries into
+    the next generation, get the same key.
+
+    Args:
+        genome: The genome.
+
+    Returns:
+        Hex digest of the genome's structure.
+    """
+    parts = []
+    for key, connection in sorted(genome.connections.items()):
+        if connection.enabled:
+            parts.append(f"c{key}:{float(connection.weight).hex()}")
+    for key, node in sorted(genome.nodes.items()):
+        parts.append(f"n{key}:{float(node.bias).hex()}:{float(node.response).hex()}:{node.activation}:{node.aggregation}")
+    return hashlib.sha256(";".join(parts).encode()).hexdigest()
+
+def trackFingerprint(track):
+    """
+    Returns:
+        Hex digest of a track's walls, lap and start position, so results on a track that was edited are never
+        reused.
+    """
+    digest = hashlib.sha256()
+    digest.update(track.wallGrid.tobytes())
+    digest.update(track.progressField.tobytes())  # Depends on where the finish line is
+    digest.update(repr((track.startX, track.startY)).encode())
+    return digest.hexdigest()
+
+class FitnessCache:
+    """
+    Remembers the state a genome's car reached on a track in a headless evaluation, so an unchanged genome isn't
+    simulated from the start again under the same conditions. Keeps at most maxSize states and drops the least
+    recently used. The time limit grows every generation, so it isn't part of the conditions: a car that crashed or
+    finished before the new limit keeps its result, and a car still driving at the old limit carries on from its
+    state until the new one instead of driving the laps it already drove again.
+    """
+
+    def __init__(self, maxSize=10000):
+        """
+        Args:
+            maxSize: Most states kept.
+        """
+        self.maxSize = maxSize
+        self.states = OrderedDict()  # (context, genome key) -> state returned by simulateGenomes
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, context, key, timeLimit):
+        """
+        Looks up a state and counts the hit or miss.
+
+        Args:
+            context: Hashable description of the track and conditions besides the time limit.
+            key: Genome key from genomeKey.
+            timeLimit: Simulated seconds the generation lasts.
+
+        Returns:
+            State for simulateGenomes to carry the car on from, or None if there is none that gives the result of
+            simulating it from the start. A state saved at a longer limit only does if the car stopped before this one.
+        """
+        state = self.states.get((context, key))
+        if state is not None and state["timeLimit"] > timeLimit:
+            car = state["car"]
+            stoppedBefore = (car["crashed"] and car["crashTime"] < timeLimit) or (car["finished"] and car["finishTime"] <= timeLimit)
+            if not stoppedBefore:
+                state = None
+        if state is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.states.move_to_end((context, key))
+        return state
+
+    def put(self, context, key, state):
+        """
+        Stores a state, dropping the least recently used one if the cache is full.
+
+        Args:
+            context: Hashable description of the track and conditions besides the time limit.
+            key: Genome key from genomeKey.
+            state: State of the genome's car returned by simulateGenomes.
+        """
+        self.states[(context, key)] = state
+        self.states.move_to_end((context, key))
+        while len(self.states) > self.maxSize:
+            self.states.popitem(last=False)
+
+    def hitRate(self):
+        """
+        Returns:
+            Fraction of the lookups that were hits, or 0 before the first lookup.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0
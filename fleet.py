@@ -0,0 +1,226 @@
+import math
+import numpy as np
+
+# Unit conversions and limits shared by every car
+lbsToKG = 0.453592
+ftToMeters = 0.3048
+gravity = 9.81  # m/s^2
+maxSteeringAngle = math.radians(20)
+
+# Integrators that move the cars between steps. Euler turns a car then moves it in a straight line, which is only
+# accurate for small steps. Arc moves it along the exact circle it drives at its speed and wheel angle, and splits
+# steps with tight turns into substeps so the speed and steering limits are updated along the way.
+integrators = ("euler", "arc")
+maxSubstepHeading = math.radians(3)  # Most a car's heading changes in one arc substep
+
+class CarFleet:
+    """
+    Holds the physical state of many cars in arrays, one row per car, so the whole population advances in one
+    vectorized step. Each Car is a view over one row.
+    """
+
+    def __init__(self, numCars, x, y, integrator="euler"):
+        """
+        Initializes every car at position (x, y) with the default physics.
+
+        Args:
+            numCars: Number of cars in the fleet.
+            x: Initial x-coordinate.
+            y: Initial y-coordinate.
+            integrator: Name of the integrator in integrators that moves the cars.
+        """
+        if integrator not in integrators:
+            raise ValueError(f"Unknown integrator {integrator!r}, expected one of {', '.join(integrators)}")
+        self.integrator = integrator
+
+        # Position and movement
+        self.carX = np.full(numCars, x, dtype=np.float64)
+        self.carY = np.full(numCars, y, dtype=np.float64)
+        self.carAngle = np.zeros(numCars)  # Angle in relation to the screen (radians)
+        self.currentWheelAngle = np.zeros(numCars)
+        self.maxWheelAngle = np.full(numCars, maxSteeringAngle)
+
+        # Physics properties
+        mass = 1760  # lbs
+        downforce = 4500  # lbs
+        self.mass = np.full(numCars, mass, dtype=np.float64)
+        self.coefficientOfFriction = np.full(numCars, 1.8)
+        self.downforceNewtons = np.full(numCars, downforce * 4.44822)  # Convert to Newtons
+        self.wheelBase = np.full(numCars, 8.0)  # ft
+
+        # Kinematic properties
+        self.velocity = np.zeros(numCars)  # ft/s
+        self.minimunVelocity = np.full(numCars, 200.0)
+        self.maxVelocityAchieved = np.zeros(numCars)
+        self.maxVelocity = np.full(numCars, 330 * 1.3)  # ft/s (~225 mph)
+        self.passedMin = np.zeros(numCars, dtype=bool)
+
+        torque = 1000  # lb-ft
+        brakingPower = 30000  # Reflects braking forces of 4-5 Gs
+        wheelRadius = 1.2  # ft
+        self.deceleration = np.full(numCars, brakingPower / (mass * wheelRadius) * 100)  # ft/s^2
+        self.acceleration = np.full(numCars, torque / (mass * wheelRadius) * 1000)  # ft/s^2
+        self.throttlePosition = np.full(numCars, 0.5)  # 0-1 scale
+
+    def calculateMaxLateralAcceleration(self, rows):
+        """
+        Calculates the maximum lateral acceleration before losing traction.
+
+        Args:
+            rows: Indices of the cars to calculate.
+
+        Returns:
+            Lateral acceleration in m/s^2.
+        """
+        massKG = self.mass[rows] * lbsToKG
+        return (self.coefficientOfFriction[rows] * gravity) + (self.downforceNewtons[rows] / (massKG * 0.075))
+
+    def calculateTurningRadius(self, rows):
+        """
+        Calculates the turning radius based on current velocity and lateral acceleration.
+
+        Args:
+            rows: Indices of the cars to calculate.
+
+        Returns:
+            Turning radius in meters.
+        """
+        maxLateralAcceleration = self.calculateMaxLateralAcceleration(rows)
+        velocityMeterSecond = self.velocity[rows] * ftToMeters
+
+        turningRadius = np.full(len(maxLateralAcceleration), np.inf)
+        hasTraction = maxLateralAcceleration > 0
+        turningRadius[hasTraction] = (velocityMeterSecond[hasTraction] ** 2) / maxLateralAcceleration[hasTraction]
+        return turningRadius
+
+    def calculateMaxSteeringAngle(self, rows):
+        """
+        Calculates the maximum steering angle before losing traction.
+
+        Args:
+            rows: Indices of the cars to calculate.
+
+        Returns:
+            Maximum steering angle in radians.
+        """
+        turningRadius = self.calculateTurningRadius(rows)
+        steeringAngle = self.maxWheelAngle[rows].copy()
+
+        # A stopped car keeps its current limit
+        moving = turningRadius != 0
+        steeringAngle[moving] = np.minimum(
+            np.arctan(self.wheelBase[rows][moving] / (turningRadius[moving] / ftToMeters)),  # Convert radius to ft
+            maxSteeringAngle
+        )
+        return steeringAngle
+
+    def updateVelocity(self, dt, rows):
+        """
+        Updates the cars' velocity based on throttle position and time delta.
+
+        Args:
+            dt: Delta time since last frame.
+            rows: Indices of the cars to update.
+        """
+        velocity = self.velocity[rows]
+        throttlePosition = self.throttlePosition[rows]
+
+        accelerating = throttlePosition > 0.5
+        throttleValue = (throttlePosition[accelerating] - 0.5) * 3
+        velocity[accelerating] = np.minimum(velocity[accelerating] + self.acceleration[rows][accelerating] * dt * throttleValue, self.maxVelocity[rows][accelerating])
+
+        braking = throttlePosition < 0.5
+        brakeValue = (0.5 - throttlePosition[braking]) * 2
+        velocity[braking] = np.maximum(velocity[braking] - self.deceleration[rows][braking] * dt * brakeValue, 0)
+
+        # Once past the minimum velocity a car can't drop below it, before that it can't slow down at all
+        passedMin = self.passedMin[rows]
+        velocity = np.where(passedMin, np.maximum(velocity, self.minimunVelocity[rows]), np.maximum(velocity, self.maxVelocityAchieved[rows]))
+        self.passedMin[rows] = passedMin | (velocity > self.minimunVelocity[rows])
+        self.velocity[rows] = velocity
+
+        maxWheelAngle = self.calculateMaxSteeringAngle(rows)
+        self.maxWheelAngle[rows] = maxWheelAngle
+        currentWheelAngle = self.currentWheelAngle[rows]
+        self.currentWheelAngle[rows] = np.where(currentWheelAngle < 0, np.maximum(-maxWheelAngle, currentWheelAngle), np.minimum(maxWheelAngle, currentWheelAngle))
+
+        self.maxVelocityAchieved[rows] = np.maximum(self.maxVelocityAchieved[rows], velocity)
+
+    def calculateAngularVelocity(self, rows):
+        """
+        Calculates how fast the cars turn at their current velocity and wheel angle.
+
+        Args:
+            rows: Indices of the cars to calculate.
+
+        Returns:
+            Angular velocity in radians per second.
+        """
+        velocity = self.velocity[rows]
+        currentWheelAngle = self.currentWheelAngle[rows]
+
+        turning = (velocity > 0) & (currentWheelAngle != 0)
+        angularVelocity = np.zeros(len(velocity))
+        turningRadius = self.wheelBase[rows][turning] / np.tan(currentWheelAngle[turning])
+        angularVelocity[turning] = velocity[turning] / turningRadius
+        return angularVelocity
+
+    def updateCarPosition(self, dt, rows):
+        """
+        Updates the cars' position based on velocity, steering angle, and time delta.
+
+        Args:
+            dt: Delta time since last frame.
+            rows: Indices of the cars to update.
+        """
+        self.updateVelocity(dt, rows)
+
+        velocity = self.velocity[rows]
+        angularVelocity = self.calculateAngularVelocity(rows)
+
+        if self.integrator == "arc":
+            # Follow the arc the car drives, its chord points halfway between the start and end headings
+            carAngle = self.carAngle[rows]
+            turn = angularVelocity * dt
+            chord = velocity * dt * np.sinc(turn / (2 * np.pi))
+            self.carX[rows] += chord * np.cos(carAngle + turn / 2)
+            self.carY[rows] += chord * np.sin(carAngle + turn / 2)
+            self.carAngle[rows] = carAngle + turn
+            return
+
+        carAngle = self.carAngle[rows] + angularVelocity * dt
+        self.carAngle[rows] = carAngle
+
+        self.carX[rows] += velocity * np.cos(carAngle) * dt
+        self.carY[rows] += velocity * np.sin(carAngle) * dt
+
+    def advance(self, dt, rows):
+        """
+        Advances the cars by one simulation step after their throttle and wheel angle have been set.
+        The arc integrator splits the step of a car that would turn more than maxSubstepHeading into equal substeps.
+        Each substep keeps the wheel at the same fraction of the steering limit, as if the inputs were set again at
+        every substep, so large steps stay accurate in tight corners.
+
+        Args:
+            dt: Delta time since last frame.
+            rows: Indices of the cars to advance.
+        """
+        if self.integrator == "euler":
+            self.updateVelocity(dt, rows)
+            self.updateCarPosition(dt, rows)
+            return
+
+        headingChange = np.abs(self.calculateAngularVelocity(rows)) * dt
+        substeps = np.maximum(np.ceil(headingChange / maxSubstepHeading), 1).astype(np.int64)
+        maxWheelAngle = self.maxWheelAngle[rows]
+        steering = np.divide(self.currentWheelAngle[rows], maxWheelAngle, out=np.zeros(len(rows)), where=maxWheelAngle > 0)
+
+        # Cars with the same number of substeps advance together
+        for count in np.unique(substeps).tolist():
+            inGroup = substeps == count
+            group = rows[inGroup]
+            for substep in range(count):
+                if substep > 0:
+                    self.currentWheelAngle[group] = steering[inGroup] * self.maxWheelAngle[group]
+                self.updateVelocity(dt / count, group)
+                self.updateCarPosition(dt / count, group)
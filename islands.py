@@ -0,0 +1,216 @@
+import multiprocessing
+import queue
+from itertools import count
+import neat
+
+class Island:
+    """
+    One of several populations that evolve in their own processes and pass their best genomes around a ring.
+    """
+
+    def __init__(self, index, inbox, outbox, reports, interval, migrants):
+        """
+        Args:
+            index: Position of the island in the ring.
+            inbox: Queue the previous island sends its migrants to.
+            outbox: Queue of the next island.
+            reports: Queue the island sends its records to the parent process through.
+            interval: Generations between migrations.
+            migrants: Genomes sent to the next island every migration.
+        """
+        self.index = index
+        self.inbox = inbox
+        self.outbox = outbox
+        self.reports = reports
+        self.interval = interval
+        self.migrants = migrants
+        self.previousStopped = False  # Set once the previous island has stopped, so no more migrants will come
+
+    def receive(self):
+        """
+        Waits for the previous island's migrants. The parent process sends None in their place once the previous
+        island has stopped, and the wait also ends if the parent process is gone.
+
+        Returns:
+            List of the migrant genomes, or None if the previous island has stopped.
+        """
+        while not self.previousStopped:
+            try:
+                immigrants = self.inbox.get(timeout=1)
+            except queue.Empty:
+                parent = multiprocessing.parent_process()
+                if parent is not None and not parent.is_alive():
+                    self.previousStopped = True
+                continue
+            if immigrants is not None:
+                return immigrants
+            self.previousStopped = True
+            print(f"Island {self.index}: the previous island has stopped, evolving on without migrants")
+        return None
+
+class MigrationReporter(neat.reporting.BaseReporter):
+    """
+    Connects an island's population to the ring. After every generation it reports the island's records to the parent
+    process, and every interval generations it sends its best genomes to the next island and swaps its newest
+    offspring for the genomes the previous island sent.
+    """
+
+    def __init__(self, island, population, favorites, records):
+        """
+        Args:
+            island: The Island the population evolves on.
+            population: The island's neat.Population.
+            favorites: Function returning a list of genomes sent before the fittest ones, like the fastest genome.
+            records: Function returning the picklable records reported to the parent process.
+        """
+        self.island = island
+        self.population = population
+        self.favorites = favorites
+        self.records = records
+        self.generation = 0
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def migrating(self):
+        """
+        Returns:
+            Boolean indicating if the island migrates after this generation.
+        """
+        return (self.generation + 1) % self.island.interval == 0
+
+    def post_evaluate(self, config, population, species, best_genome):
+        self.island.reports.put((self.island.index, self.generation, self.records()))
+        if not self.migrating():
+            return
+
+        emigrants = []
+        for genome in [genome for genome in self.favorites() if genome is not None] + sorted(population.values(), key=lambda genome: genome.fitness, reverse=True):
+            if len(emigrants) == self.island.migrants:
+                break
+            if all(genome is not emigrant for emigrant in emigrants):
+                emigrants.append(genome)
+        self.island.outbox.put(emigrants)  # Pickled, so the genomes are copies
+
+    def end_generation(self, config, population, species_set):
+        if not self.migrating():
+            return
+
+        immigrants = self.island.receive()
+        if immigrants is None:
+            return
+        for key in sorted(population)[len(population) - len(immigrants):]:
+            del population[key]
+        for genome in immigrants:
+            immigrant = renumberGenome(genome, config.genome_config, next(self.population.reproduction.genome_indexer))
+            population[immigrant.key] = immigrant
+            self.population.reproduction.ancestors[immigrant.key] = tuple()
+        species_set.speciate(config, population, self.generation)
+
+def renumberGenome(genome, genomeConfig, key):
+    """
+    Gives a genome from another island a new key and new ids for its hidden nodes, so they can't clash with the
+    hidden nodes this island's genomes were given.
+
+    Args:
+        genome: The genome from the other island.
+        genomeConfig: This island's genome configuration, which hands out the node ids.
+        key: New key of the genome.
+
+    Returns:
+        The genome, renumbered in place.
+    """
+    # The ids come straight from this island's counter, the genome's own hidden ids may already be past it
+    if genomeConfig.node_indexer is None:
+        genomeConfig.node_indexer = count(max(genome.nodes) + 1)
+    nodeIds = {}
+    for nodeId in sorted(genome.nodes):
+        if nodeId not in genomeConfig.output_keys:
+            nodeIds[nodeId] = next(genomeConfig.node_indexer)
+
+    nodes = {}
+    for nodeId, node in genome.nodes.items():
+        node.key = nodeIds.get(nodeId, nodeId)
+        nodes[node.key] = node
+    connections = {}
+    for (inputId, outputId), connection in genome.connections.items():
+        connection.key = (nodeIds.get(inputId, inputId), nodeIds.get(outputId, outputId))
+        connections[connection.key] = connection
+
+    genome.key = key
+    genome.nodes = nodes
+    genome.connections = connections
+    genome.fitness = None
+    return genome
+
+def startIslands(numIslands, target, interval, migrants):
+    """
+    Forks a process for every island, connected in a ring by queues. Forking gives every island the parent's track
+    and settings without pickling them.
+
+    Args:
+        numIslands: Number of islands.
+        target: Function run in every island's process with its Island.
+        interval: Generations between migrations.
+        migrants: Genomes each island sends to the next one every migration.
+
+    Returns:
+        Tuple of the list of processes, the queue the islands report through and every island's inbox.
+    """
+    context = multiprocessing.get_context("fork")
+    reports = context.Queue()
+    inboxes = [context.Queue() for _ in range(numIslands)]
+    processes = []
+    for index in range(numIslands):
+        island = Island(index, inboxes[index], inboxes[(index + 1) % numIslands], reports, interval, migrants)
+        process = context.Process(target=islandProcess, args=(target, island))
+        process.start()
+        processes.append(process)
+    return processes, reports, inboxes
+
+def islandProcess(target, island):
+    """
+    Runs an island in its own process.
+
+    Args:
+        target: Function run with the Island.
+        island: The Island.
+    """
+    # Migrants the next island never reads once it has stopped mustn't keep this process from exiting
+    island.outbox.cancel_join_thread()
+    target(island)
+
+def collectReports(processes, reports, inboxes):
+    """
+    Yields the islands' reports until every island has finished. When an island stops early, like when it reaches
+    the fitness threshold, the next island is told so it stops waiting for its migrants. If an island fails, the
+    others are stopped.
+
+    Args:
+        processes: List of the islands' processes.
+        reports: Queue the islands report through.
+        inboxes: List of every island's inbox.
+
+    Yields:
+        Tuple of (island index, generation, records).
+    """
+    stopped = set()
+    while True:
+        try:
+            yield reports.get(timeout=1)
+            continue
+        except queue.Empty:
+            pass
+        for index, process in enumerate(processes):
+            if process.exitcode == 0 and index not in stopped:
+                stopped.add(index)
+                inboxes[(index + 1) % len(processes)].put(None)
+        failed = [process for process in processes if process.exitcode not in (None, 0)]
+        if failed:
+            for process in processes:
+                process.terminate()
+            raise RuntimeError(f"Island {processes.index(failed[0])} failed with exit code {failed[0].exitcode}")
+        if all(process.exitcode is not None for process in processes):
+            for process in processes:
+                process.join()
+            return
@@ -1,10 +1,26 @@
+import os
 import sys
+import time
+import heapq
+import argparse
+import functools
+import multiprocessing
 import pygame
 import math
 import random
 import neat
 from configWindow import *
-from car import Car
+from car import loadCarImage, cacheRotations
+from track import Track, loadCompiledTrack, loadTrack
+from simulation import Simulation, EvaluationPolicy
+from fleet import integrators
+from parallel import ParallelEvaluator, simulateGenomes
+from fitnessCache import FitnessCache, genomeKey, trackFingerprint
+from islands import MigrationReporter, startIslands, collectReports
+from steadyState import SteadyStateEvolver
+from replay import DigestReporter
+from snapshots import SnapshotWriter, loadSnapshot
+from profiler import StageTimer
 
 #====================================================================================================
 # Configuration Parameters
@@ -12,28 +28,74 @@ capturingCheckpoints = False
 captureLastGeneration = False
 
 checkpointFrequency = 50
+snapshotPath = None  # File a compact snapshot of every changed genome is appended to in the background, None disables it
+snapshotFrequency = 1  # Generations between snapshots
 numberOfGenerationsSimulated = 200
+
+# Headless mode never opens a window and advances the simulation in fixed steps as fast as possible
+headless = False
+simulationTimestep = 1 / 80  # Simulated seconds per step in headless mode
+physicsIntegrator = "euler"  # "euler" or "arc", arc follows each car's exact turning circle so the timestep can be raised to about 1 / 20
+numberOfWorkers = 1  # Worker processes that share the evaluation of a generation in headless mode
+fitnessCacheSize = None  # Car states kept so unchanged genomes carry on from the last generation in headless Best Time mode, None disables it
+trainingTrackPaths = []  # Tracks every genome is scored on besides the track being driven in headless Best Time mode
+trackFitness = "mean"  # How a genome's fitness on every track is combined, "mean" or "worst"
+steadyState = False  # Breed from a rolling pool as batches come back instead of waiting for whole generations in headless Best Time mode
+steadyStateBatch = 25  # Genomes simulated together in a steady state batch
+
+# Islands evolve separate populations in their own processes in headless Best Time mode and pass their best genomes around a ring
+numberOfIslands = 1
+migrationInterval = 10  # Generations between migrations
+islandMigrants = 2  # Genomes each island sends to the next one every migration, starting with its fastest genome
+islandConfigFiles = []  # NEAT configuration of every island in turn, the Best Time configuration if empty
+
+# Evaluation policies stop cars before the time limit, the fitness of a car still driving well is projected to the limit
+lapsToFinish = None  # Laps after which a car is finished and stops driving
+stallSeconds = None  # Seconds a car has to move stallDistance pixels in before it is stopped
+stallDistance = 100
+finishersToEnd = None  # Finished cars after which the generation ends, needs lapsToFinish
+evaluationPolicy = None
+
+# Seeding a run fixes every random number generator and the simulated timestep, so two runs with the same seed are identical
+randomSeed = None
+recordDigestPath = None  # File the fitness digest of every generation is written to
+verifyDigestPath = None  # File of digests from an earlier run that every generation must match
+
+# Profiling times every stage of each frame and shows the rolling times below the best lap
+profiling = False
+profileTraceDirectory = None  # Directory a CSV of every frame's stage times is written to after each generation
+
+# Watch mode simulates in fixed timesteps as fast as possible and only redraws the window now and then
+watchMode = False
+renderFPS = 30  # Most redraws per second in watch mode, or None to redraw every renderEvery steps instead
+renderEvery = 10
+spotlightCars = None  # If set, only the fastest genome and this many of the fittest cars of each team are drawn
+leaderboardSize = 5  # Cars shown on the live leaderboard of who has driven farthest around the track, 0 hides it
 #====================================================================================================
 # CAR COLOR OPTIONS
-redCar = pygame.transform.scale(pygame.image.load("images/f1CarRed.png"), (50, 25))
-blueCar = pygame.transform.scale(pygame.image.load("images/f1CarBlue.png"), (50, 25))
-greenCar = pygame.transform.scale(pygame.image.load("images/f1CarGreen.png"), (50, 25))
-yellowCar = pygame.transform.scale(pygame.image.load("images/f1CarYellow.png"), (50, 25))
+redCar = loadCarImage("images/f1CarRed.png")
+blueCar = loadCarImage("images/f1CarBlue.png")
+greenCar = loadCarImage("images/f1CarGreen.png")
+yellowCar = loadCarImage("images/f1CarYellow.png")
 carOptions = [redCar, blueCar, greenCar, yellowCar]
+for carOption in carOptions:
+    cacheRotations(carOption)
+track = None  # Track being driven, updated in place when it is edited during training
+trainingTracks = []
+parallelEvaluator = None
+fitnessCache = None
+lapBonuses = []  # (genome, bonus) for every record set during the generation being evaluated
+carColors = random.Random()  # Kept apart from the random module so the colors drawn never change how NEAT evolves
+stageTimer = None  # StageTimer shared by every frame when profiling
+profileTexts = []
+renderStep = 0
+lastRenderTime = 0
 #====================================================================================================
 
 def createMasks():
-    global trackMaskSurface, pixelArray, outOfBoundsMask, finishLineMask
+    global track
     # Creating the masks
-    trackMaskSurface = userTrack.convert_alpha()
-    pixelArray = pygame.surfarray.array2d(trackMaskSurface)
-
-    outOfBoundsMask = pygame.mask.from_threshold(
-        trackMaskSurface, (255, 255, 255, 255), (1, 1, 1, 255)
-    )
-    finishLineMask = pygame.mask.from_threshold(
-        trackMaskSurface, (144, 238, 144, 255), (1, 1, 1, 255)
-    )
+    track = Track(userTrack, initialCarX, initialCarY)
 
 def drawCircle(screen, color, start, end, radius):
     """
@@ -45,92 +107,380 @@ def drawCircle(screen, color, start, end, radius):
         start: Starting point (x, y).
         end: Ending point (x, y).
         radius: Radius of the circles.
+
+    Returns:
+        Pygame rect holding every pixel that was drawn, or None if nothing was.
     """
     dx = end[0] - start[0]
     dy = end[1] - start[1]
     distance = math.hypot(dx, dy)
 
+    drawnRect = None
     for i in range(int(distance)):
         x = int(start[0] + dx * (i / distance))
         y = int(start[1] + dy * (i / distance))
-        pygame.draw.circle(screen, color, (x, y), radius)
+        circleRect = pygame.draw.circle(screen, color, (x, y), radius)
+        drawnRect = circleRect if drawnRect is None else drawnRect.union(circleRect)
+    return drawnRect
 
-def checkCollisionWithWhitePixels(car):
+def drawFinishLine(x, y, width, height, numBoxes):
     """
-    Checks if the car has collided with white pixels (off-track areas).
+    Draws a checkered finish line.
 
     Args:
-        car: The car object.
+        x, y: Position of the finish line.
+        width, height: Dimensions of the finish line.
+        numBoxes: Number of columns in the finish line.
+    """
+    boxWidth = width // numBoxes
+    for col in range(numBoxes):
+        for row in range(0, height, 5):
+            color = darkGreen if (col + row // 5) % 2 == 0 else lightGreen
+            pygame.draw.rect(screen, color, pygame.Rect(x + col * boxWidth, y + row, boxWidth, 5))
+
+def seedRandom():
+    """
+    Seeds the random module NEAT uses for mutation and reproduction, if the run has a seed.
+    """
+    if randomSeed is not None:
+        random.seed(randomSeed)
+
+def fixedTimestep():
+    """
+    Returns:
+        Boolean indicating if the simulation advances in fixed simulated timesteps instead of the frame time.
     """
-    angle_degrees = -math.degrees(car.carAngle)
-    rotatedCarImage = pygame.transform.rotate(car.f1CarImage, angle_degrees)
-    rotatedCarRect = rotatedCarImage.get_rect(center=(car.carX, car.carY))
-    carMask = pygame.mask.from_surface(rotatedCarImage)
-    offsetX = rotatedCarRect.left
-    offsetY = rotatedCarRect.top
-    overlap = outOfBoundsMask.overlap(carMask, (offsetX, offsetY))
+    return headless or watchMode or randomSeed is not None
 
-    if overlap or car.carX > screenWidth or car.carX < 0 or car.carY > screenHeight or car.carY < 0:
-        car.crashed = True
+def renderDue():
+    """
+    Returns:
+        Boolean indicating if the window should be redrawn this step. Outside watch mode every step is drawn.
+    """
+    global renderStep, lastRenderTime
+
+    if not watchMode:
+        return True
+    renderStep += 1
+    now = time.perf_counter()
+    if renderFPS is not None:
+        due = now - lastRenderTime >= 1 / renderFPS
+    else:
+        due = renderStep % renderEvery == 0
+    if due:
+        lastRenderTime = now
+    return due
 
-def checkCollisionWithFinishLine(car):
+def carsToDraw(cars):
     """
-    Checks if the car has crossed the finish line.
+    Picks the cars of a team that are drawn. In spotlight mode only the fittest cars are drawn.
 
     Args:
-        car: The car object.
+        cars: List of (car, genome) pairs.
 
     Returns:
-        Boolean indicating if the car has hit the finish line.
-    """
-    angle_degrees = -math.degrees(car.carAngle)
-    rotatedCarImage = pygame.transform.rotate(car.f1CarImage, angle_degrees)
-    rotatedCarRect = rotatedCarImage.get_rect(center=(car.carX, car.carY))
-    carMask = pygame.mask.from_surface(rotatedCarImage)
-    offsetX = rotatedCarRect.left
-    offsetY = rotatedCarRect.top
-    overlap = finishLineMask.overlap(carMask, (offsetX, offsetY))
-    if overlap:
-        car.hitFinishLine = True
-    else:
-        car.hitFinishLine = False
-    return car.hitFinishLine
+        List of the cars that are still driving and should be drawn.
+    """
+    liveCars = [(car, genome) for car, genome in cars if not car.crashed and not car.finished]
+    if spotlightCars is not None:
+        liveCars = heapq.nlargest(spotlightCars, liveCars, key=lambda pair: pair[1].fitness)
+    return [car for car, _ in liveCars]
 
-def drawFinishLine(x, y, width, height, numBoxes):
+def drawProfile(x, y):
     """
-    Draws a checkered finish line.
+    Draws the average, median and 95th percentile time of every stage over the recent frames.
+    The text is only rendered again every 20 frames so drawing it costs almost nothing.
 
     Args:
-        x, y: Position of the finish line.
-        width, height: Dimensions of the finish line.
-        numBoxes: Number of columns in the finish line.
+        x, y: Position of the first line.
     """
-    boxWidth = width // numBoxes
-    for col in range(numBoxes):
-        for row in range(0, height, 5):
-            color = darkGreen if (col + row // 5) % 2 == 0 else lightGreen
-            pygame.draw.rect(screen, color, pygame.Rect(x + col * boxWidth, y + row, boxWidth, 5))
+    global profileTexts
 
-def fitness(genome, car, dt):
+    if stageTimer.frameCount % 20 == 0 or not profileTexts:
+        profileTexts = [font.render(f"{'Stage (ms)':>15} {'Avg':>6} {'P50':>6} {'P95':>6}", True, (0, 0, 0))]
+        for stage, (mean, median, percentile) in stageTimer.summary().items():
+            profileTexts.append(font.render(f"{stage:>15} {mean:6.2f} {median:6.2f} {percentile:6.2f}", True, (0, 0, 0)))
+
+    for text in profileTexts:
+        screen.blit(text, (x, y))
+        y += text.get_height() + 2
+
+def drawLeaderboard(simulations, right, y):
     """
-    Calculates and updates the fitness of a genome based on the car's performance.
-    From extensive testing, this simple fitness function seems to promote the fastest lap times because the main contributing factor are its lap times themselves. 
-    However, the velocity bonus is needed so the cars are promoted to completed their first lap fast or else the ones that complete the first lap will go slowly and then 
-    they will breed only slow cars giving an endless cycle. The other is a simple survival bonus needed because withtout it, the cars run into a wall endlessly or until one luckily 
-    turns the corner. 
+    Draws the cars that have driven farthest around the track, with their lap and how far into it they are.
 
     Args:
-        genome: The genome being evaluated.
-        car: The car object.
-        dt: Delta time since last frame.
+        simulations: Simulations whose cars are ranked together.
+        right, y: Position of the top right corner.
     """
+    leaders = heapq.nlargest(
+        leaderboardSize,
+        (leader for simulation in simulations for leader in simulation.leaderboard(leaderboardSize)),
+        key=lambda leader: leader[2]
+    )
+    for place, (car, _, progress, wrongWay) in enumerate(leaders, 1):
+        status = "Crashed" if car.crashed else "Finished" if car.finished else "Wrong way" if wrongWay else ""
+        text = font.render(
+            f"{place}. {car.genomeID:<6} Lap {int(progress) + 1:<2} {progress % 1:4.0%} {status:>9}",
+            True,
+            (200, 0, 0) if wrongWay and not car.crashed else (0, 0, 0)
+        )
+        screen.blit(text, (right - text.get_width(), y))
+        y += text.get_height() + 2
 
-    genome.fitness += car.velocity * dt * 0.01
-    genome.fitness += 10
+def reportProfile(generation):
+    """
+    Writes the generation's trace and, when headless, prints the stage times since nothing is drawn.
 
-    if car.completedLap:
-        genome.fitness += 10000 / car.totalLaps[-1]
-        car.completedLap = False
+    Args:
+        generation: Generation that was just evaluated.
+    """
+    if stageTimer is None:
+        return
+    if profileTraceDirectory is not None:
+        os.makedirs(profileTraceDirectory, exist_ok=True)
+        stageTimer.writeTrace(os.path.join(profileTraceDirectory, f"generation-{generation}.csv"))
+    if headless:
+        for stage, (mean, median, percentile) in stageTimer.summary().items():
+            print(f"{stage:>15}  Avg: {mean:.2f}ms  P50: {median:.2f}ms  P95: {percentile:.2f}ms")
+
+def handleEvents():
+    """
+    Handles the pygame events raised while a generation is being evaluated.
+    """
+    global timeAddition
+
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            sys.exit()
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if plusButtonRect.collidepoint(event.pos):
+                timeAddition += 1
+                print("plus 1   Total:", timeAddition)
+            if minusButtonRect.collidepoint(event.pos):
+                timeAddition -= 1
+                print("edit 1   Total:", timeAddition)
+            if editButtonRect.collidepoint(event.pos):
+                if not drawingEvent():
+                    pygame.quit()
+                    sys.exit()
+                print("edit")
+
+def recordLap(genome, genomeID, laps):
+    """
+    Records a lap completed in Best Time mode and rewards the genome if it set a new best lap or best first lap.
+    The rewards are added by applyLapBonuses once the generation has been simulated.
+
+    Args:
+        genome: The genome credited with the lap.
+        genomeID: ID shown for the lap.
+        laps: Every lap time the car has completed so far, ending with this lap.
+
+    Returns:
+        Boolean indicating if the lap set a new record.
+    """
+    global bestLap, bestLapText, bestFirstLap, bestFirstLapText, fastestGenome
+
+    lapTime = laps[-1]
+    newRecord = False
+    print(f"Lap: {len(laps)} Time: {lapTime:.2f} Average: {sum(laps) / len(laps):.2f}")
+    if lapTime < bestLap[0]:
+        newRecord = True
+        bestLap = (lapTime, population.generation, genomeID)
+        fastestGenome = genome
+        lapBonuses.append((genome, 5000))
+        print(f"Best Lap: {bestLap[0]:.2f} Generation: {bestLap[1]} Genome ID: {bestLap[2]}")
+        bestLapText = font.render(
+            f"{'Best Lap:':>15} {bestLap[0]:<6.2f}  Generation: {bestLap[1]:<4}  Genome ID: {bestLap[2]:<8}",
+            True, 
+            (0, 0, 0)
+        )
+    if len(laps) == 1 and lapTime < bestFirstLap[0]:
+        newRecord = True
+        bestFirstLap = (lapTime, population.generation, genomeID)
+        lapBonuses.append((genome, 2000))
+        print(f"Best First Lap: {bestFirstLap[0]:.2f} Generation: {bestFirstLap[1]} Genome ID: {bestFirstLap[2]}")
+        bestFirstLapText = font.render(
+            f"{'Best First Lap:':>15} {bestFirstLap[0]:<6.2f}  Generation: {bestFirstLap[1]:<4}  Genome ID: {bestFirstLap[2]:<8}",
+            True, 
+            (0, 0, 0)
+        )
+    return newRecord
+
+def applyLapBonuses():
+    """
+    Adds the rewards recorded by recordLap to the genomes in the order the records were set. Adding them after the
+    driving fitness, instead of part way through it, gives the same fitness whether the generation was simulated in
+    one process or on the worker pool.
+    """
+    for genome, bonus in lapBonuses:
+        genome.fitness += bonus
+    lapBonuses.clear()
+
+def creditFastestGenome(genomes, fastest):
+    """
+    Moves the fitness earned by the first car to the fastest genome of the earlier generations, which the first car
+    drives for.
+
+    Args:
+        genomes: List of genomes that were evaluated.
+        fastest: The fastest genome when the generation started, or None.
+    """
+    if fastest is not None and fastest is not genomes[0][1]:
+        fastest.fitness += genomes[0][1].fitness
+        genomes[0][1].fitness = 0
+
+def generationTimeLimit(generation):
+    """
+    Args:
+        generation: Number of the generation being evaluated.
+
+    Returns:
+        Simulated seconds the generation lasts, which grows with the generations and the time added with the buttons.
+    """
+    return (30 * generation) / (19 + generation) + 3 + timeAddition
+
+def simulateOnTracks(genomes, config, timeLimit, multipliers, trackStates=None):
+    """
+    Simulates genomes headless on the track and every training track, on the worker pool if there is one, and sets
+    each genome's fitness to the mean or worst of its fitness on every track.
+
+    Args:
+        genomes: List of (genome_id, genome) pairs to evaluate.
+        config: NEAT configuration.
+        timeLimit: Simulated seconds the generation lasts.
+        multipliers: (acceleration, deceleration, downforce, max speed) multipliers applied to every car.
+        trackStates: Optional list with the states the genomes' cars carry on from on every track, as simulateGenomes
+            takes them.
+
+    Returns:
+        Tuple of a list of (step, index, lapTime) for every lap completed on the track being driven, where index is
+        the genome's position in genomes, and a list with the state of each genome's car on every track.
+    """
+    drivenTracks = [track] + trainingTracks
+    if trackStates is None:
+        trackStates = [None] * len(drivenTracks)
+    if parallelEvaluator is not None:
+        trackResults = parallelEvaluator.evaluateTracks(genomes, config, timeLimit, simulationTimestep, physicsIntegrator, evaluationPolicy, trackStates)
+    else:
+        trackResults = []
+        positions = {genome_id: position for position, (genome_id, _) in enumerate(genomes)}
+        for drivenTrack, states in zip(drivenTracks, trackStates):
+            fitnesses, genomeLaps, endStates = simulateGenomes(genomes, config, drivenTrack, carOptions[0], multipliers, timeLimit, simulationTimestep, physicsIntegrator, evaluationPolicy, stageTimer, states)
+            trackResults.append((fitnesses, [(step, positions[genome_id], lapTime) for step, genome_id, lapTime in genomeLaps], endStates))
+
+    for idx, (_, genome) in enumerate(genomes):
+        trackFitnesses = [fitnesses[idx] for fitnesses, _, _ in trackResults]
+        genome.fitness = min(trackFitnesses) if trackFitness == "worst" else sum(trackFitnesses) / len(trackFitnesses)
+    return trackResults[0][1], [endStates for _, _, endStates in trackResults]
+
+def evalGenomesHeadless(genomes, config):
+    """
+    Evaluates each genome in the population headless, on the worker pool if there is one and on every training track, then records the laps on the track in the order they were completed.
+    Genomes with a state in the fitness cache carry on from it instead of driving from the start again, and copies of another genome in the population aren't simulated again.
+
+    Args:
+        genomes: List of genomes to evaluate.
+        config: NEAT configuration.
+    """
+    timeLimit = generationTimeLimit(population.generation)
+    multipliers = (
+        racingConfigWindow.accelerationMult,
+        racingConfigWindow.decelerationMult,
+        racingConfigWindow.downforceMult,
+        racingConfigWindow.maxSpeedMult
+    )
+
+    # Ending the generation after enough finishers makes every car's result depend on the others, so nothing is reused then
+    useCache = fitnessCache is not None and (evaluationPolicy is None or evaluationPolicy.finishersToEnd is None)
+    if not useCache:
+        laps, _ = simulateOnTracks(genomes, config, timeLimit, multipliers)
+    else:
+        conditions = (multipliers, simulationTimestep, physicsIntegrator, tuple(sorted(vars(evaluationPolicy).items())) if evaluationPolicy is not None else None)
+        contexts = [(trackFingerprint(drivenTrack), conditions) for drivenTrack in [track] + trainingTracks]
+        keys = [genomeKey(genome) for _, genome in genomes]
+        firstWithKey = {}
+        simulated = []  # Indices of the genomes that are simulated
+        copies = []  # (index, index of the genome it is a copy of)
+        for idx, key in enumerate(keys):
+            if key in firstWithKey:
+                copies.append((idx, firstWithKey[key]))
+            else:
+                firstWithKey[key] = idx
+                simulated.append(idx)
+        trackStates = [[fitnessCache.get(context, keys[idx], timeLimit) for idx in simulated] for context in contexts]
+
+        simulatedLaps, endStates = simulateOnTracks([genomes[idx] for idx in simulated], config, timeLimit, multipliers, trackStates)
+        for context, states in zip(contexts, endStates):
+            for idx, state in zip(simulated, states):
+                fitnessCache.put(context, keys[idx], state)
+
+        # Copies get the results of the genome they copy, with its laps completed alongside it
+        laps = [(step, simulated[position], lapTime) for step, position, lapTime in simulatedLaps]
+        lapsByGenome = {idx: [] for idx in simulated}
+        for step, idx, lapTime in laps:
+            lapsByGenome[idx].append((step, lapTime))
+        for idx, original in copies:
+            genomes[idx][1].fitness = genomes[original][1].fitness
+            laps.extend((step, idx, lapTime) for step, lapTime in lapsByGenome[original])
+        laps.sort()
+
+        carriedOn = sum(state is not None for states in trackStates for state in states)
+        print(f"Fitness cache: {carriedOn} of {len(simulated) * len(contexts)} cars carried on from an earlier generation, {len(copies)} copies not simulated, "
+              f"{fitnessCache.hitRate():.1%} hit rate, {len(fitnessCache.states)} states stored")
+
+    # The first car drives for the fastest genome, as in evalGenomesBestTime
+    creditedGenomes = [genome for _, genome in genomes]
+    if fastestGenome is not None:
+        creditedGenomes[0] = fastestGenome
+    creditFastestGenome(genomes, fastestGenome)
+
+    carLaps = [[] for _ in genomes]
+    for _, idx, lapTime in laps:
+        carLaps[idx].append(lapTime)
+        recordLap(creditedGenomes[idx], genomes[idx][0], carLaps[idx])
+    applyLapBonuses()
+
+def submitBatch(genomes):
+    """
+    Starts simulating a steady state batch headless, on the worker pool if there is one.
+
+    Args:
+        genomes: List of (genome_id, genome) pairs to evaluate.
+
+    Returns:
+        Function that waits for and returns the tuple simulateGenomes returns.
+    """
+    timeLimit = generationTimeLimit(population.generation)
+    if parallelEvaluator is not None:
+        return parallelEvaluator.submit(genomes, population.config, timeLimit, simulationTimestep, physicsIntegrator, evaluationPolicy)
+    multipliers = (
+        racingConfigWindow.accelerationMult,
+        racingConfigWindow.decelerationMult,
+        racingConfigWindow.downforceMult,
+        racingConfigWindow.maxSpeedMult
+    )
+    return functools.partial(simulateGenomes, genomes, population.config, track, carOptions[0], multipliers, timeLimit, simulationTimestep, physicsIntegrator, evaluationPolicy, stageTimer)
+
+def scoreBatch(genomes, result):
+    """
+    Sets the fitness of a steady state batch and records its laps in the order they were completed.
+
+    Args:
+        genomes: List of (genome_id, genome) pairs that were evaluated.
+        result: Tuple returned by simulateGenomes for the batch.
+    """
+    fitnesses, laps, _ = result
+    for (_, genome), genomeFitness in zip(genomes, fitnesses):
+        genome.fitness = genomeFitness
+
+    genomesById = dict(genomes)
+    carLaps = {genome_id: [] for genome_id, _ in genomes}
+    for _, genome_id, lapTime in laps:
+        carLaps[genome_id].append(lapTime)
+        recordLap(genomesById[genome_id], genome_id, carLaps[genome_id])
+    applyLapBonuses()
 
 def evalGenomesBestTime(genomes, config):
     """
@@ -142,54 +492,63 @@ def evalGenomesBestTime(genomes, config):
         genomes: List of genomes to evaluate.
         config: NEAT configuration.
     """
-    global font, bestLap, bestLapText, bestFirstLap, bestFirstLapText, population, fastestGenome, initialCarX, initialCarY, timeAddition
+    global population, fastestGenome, timeAddition
 
-    # Initialize cars and networks
-    cars = []
-    alive = 0
-    networks = []
-    for genome_id, genome in genomes:
-        genome.fitness = 0
-        car = Car(initialCarX, initialCarY, random.choice(carOptions[:3]))
-        car.genomeID = genome_id
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
-        cars.append((car, genome))
-        car.lapStart = pygame.time.get_ticks() / 1000
-        alive += 1
-        networks.append(net)
-
-        car.acceleration *= racingConfigWindow.accelerationMult
-        car.deceleration *= racingConfigWindow.decelerationMult
-        car.downforceNewtons *= racingConfigWindow.downforceMult
-        car.maxVelocity *= racingConfigWindow.maxSpeedMult
+    if headless and (parallelEvaluator is not None or fitnessCache is not None or trainingTracks):
+        evalGenomesHeadless(genomes, config)
+        return
 
-    if fastestGenome is not None:
-        cars[0] = (cars[0][0], fastestGenome)
-        cars[0][0].f1CarImage = carOptions[3]
+    # Initialize cars and networks
+    simulation = Simulation(genomes, config, track, carOptions[0], (
+        racingConfigWindow.accelerationMult,
+        racingConfigWindow.decelerationMult,
+        racingConfigWindow.downforceMult,
+        racingConfigWindow.maxSpeedMult
+    ), stageTimer, physicsIntegrator, evaluationPolicy)
+    if not headless:
+        for car, _ in simulation.cars:
+            car.f1CarImage = carColors.choice(carOptions[:3])
+
+    # The first car drives for the fastest genome so far
+    startingFastestGenome = fastestGenome
+    if startingFastestGenome is not None:
+        simulation.cars[0][0].f1CarImage = carOptions[3]
 
     clock = pygame.time.Clock()
-    startTime = pygame.time.get_ticks()
 
     # Simulation loop
-    while any(not car.crashed for car, _ in cars) and (pygame.time.get_ticks() - startTime) / 1000 < (30 * population.generation) / (19 + population.generation) + 3 + timeAddition:
-        dt = clock.tick(80) / 1000  # Frame time
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if plusButtonRect.collidepoint(event.pos):
-                    timeAddition += 1
-                    print("plus 1   Total:", timeAddition)
-                if minusButtonRect.collidepoint(event.pos):
-                    timeAddition -= 1
-                    print("edit 1   Total:", timeAddition)
-                if editButtonRect.collidepoint(event.pos):
-                    if not drawingEvent():
-                        pygame.quit()
-                        sys.exit()
-                    print("edit")
+    while simulation.running(generationTimeLimit(population.generation)):
+        if stageTimer is not None:
+            stageTimer.start()
+        render = not headless and renderDue()
+        if headless:
+            dt = simulationTimestep
+        else:
+            if not watchMode:
+                dt = clock.tick(80) / 1000  # Frame time
+                if stageTimer is not None:
+                    stageTimer.mark("wait")
+            if fixedTimestep():
+                dt = simulationTimestep
+            if render:
+                handleEvents()
+                simulation.track = track
+                if stageTimer is not None:
+                    stageTimer.mark("events")
+
+        # Update each car and record the laps completed during this step
+        for car, genome, lapTime in simulation.step(dt):
+            if car is simulation.cars[0][0] and startingFastestGenome is not None:
+                genome = startingFastestGenome
+            if recordLap(genome, car.genomeID, car.totalLaps):
+                car.f1CarImage = carOptions[3]
+        if stageTimer is not None:
+            stageTimer.mark("laps")
+
+        if not render:
+            if stageTimer is not None:
+                stageTimer.endFrame()
+            continue
 
         screen.blit(userTrack, (0, 0))
         screen.blit(bestLapText, (10, 3))
@@ -197,157 +556,153 @@ def evalGenomesBestTime(genomes, config):
         screen.blit(editButton, (editButtonX, editButtonY))
         screen.blit(minusButton, (minusButtonX, minusButtonY))
         screen.blit(plusButton, (plusButtonX, plusButtonY))
-        
-
-        # Update and draw each car
-        for idx, (car, genome) in enumerate(cars):
-            if not car.crashed:
-                car.castLines(screen, pixelArray)
-
-                inputs = [
-                    car.frontCast,
-                    car.leftCast,
-                    car.rightCast,
-                    car.left30AngleCast,
-                    car.right30AngleCast,
-                    car.left45AngleCast,
-                    car.right45AngleCast,
-                    car.velocity,
-                    car.maxWheelAngle,
-                    car.currentWheelAngle
-                ]
-
-                output = networks[idx].activate(inputs)
-
-                # Initial acceleration and steering limitations
-                if (pygame.time.get_ticks() - startTime) / 1000 < 2:
-                    car.throttlePosition = 0.55
-                    car.currentWheelAngle = (output[1] * 2 - 1) * car.maxWheelAngle * 0.2
-                else:
-                    car.throttlePosition = output[0]
-                    car.currentWheelAngle = (output[1] * 2 - 1) * car.maxWheelAngle
-
-                # Update car
-                car.updateVelocity(dt)
-                car.updateCarPosition(dt)
-                car.displayCar(screen)
-
-                # Check for collisions
-                checkCollisionWithWhitePixels(car)
-                if car.crashed:
-                    alive -= 1
-
-                # Check for finish line crossing
-                if math.cos(car.carAngle) > 0 and checkCollisionWithFinishLine(car) and car.leftFinishLine and pygame.time.get_ticks() / 1000 - car.lapStart  >= 2:
-                    lapTime = pygame.time.get_ticks() / 1000 - car.lapStart
-                    car.totalLaps.append(lapTime)
-                    car.lapStart = pygame.time.get_ticks() / 1000
-                    car.leftFinishLine = False
-                    car.completedLap = True  # Set the flag
-
-                    print(f"Lap: {len(car.totalLaps)} Time: {lapTime:.2f} Average: {sum(car.totalLaps) / len(car.totalLaps):.2f}")
-                    if lapTime < bestLap[0]:
-                        car.f1CarImage = carOptions[3]
-                        bestLap = (lapTime, population.generation, car.genomeID)
-                        fastestGenome = genome
-                        genome.fitness += 5000
-                        print(f"Best Lap: {bestLap[0]:.2f} Generation: {bestLap[1]} Genome ID: {bestLap[2]}")
-                        bestLapText = font.render(
-                            f"{'Best Lap:':>15} {bestLap[0]:<6.2f}  Generation: {bestLap[1]:<4}  Genome ID: {bestLap[2]:<8}",
-                            True, 
-                            (0, 0, 0)
-                        )
-                    if len(car.totalLaps) == 1 and lapTime < bestFirstLap[0]:
-                        car.f1CarImage = carOptions[3]
-                        bestFirstLap = (lapTime, population.generation, car.genomeID)
-                        genome.fitness += 2000
-                        print(f"Best First Lap: {bestFirstLap[0]:.2f} Generation: {bestFirstLap[1]} Genome ID: {bestFirstLap[2]}")
-                        bestFirstLapText = font.render(
-                            f"{'Best First Lap:':>15} {bestFirstLap[0]:<6.2f}  Generation: {bestFirstLap[1]:<4}  Genome ID: {bestFirstLap[2]:<8}",
-                            True, 
-                            (0, 0, 0)
-                        )
-
-                if not car.hitFinishLine and not car.leftFinishLine:
-                    car.leftFinishLine = True
-
-                # Calculate fitness
-                fitness(genome, car, dt)
+
+        # Draw each car
+        for car in carsToDraw(simulation.cars):
+            car.displayCar(screen)
 
         # Display the fastest on top of the others so it can always be seen
-        if fastestGenome is not None and not cars[0][0].crashed:
-            cars[0][0].displayCar(screen)
+        if fastestGenome is not None and not simulation.cars[0][0].crashed and not simulation.cars[0][0].finished:
+            simulation.cars[0][0].displayCar(screen)
+        if leaderboardSize:
+            drawLeaderboard([simulation], screen.get_width() - 10, editButtonY + editButton.get_height() + 10)
+        if stageTimer is not None:
+            drawProfile(10, 3 + 2 * (bestLapText.get_height() + 5))
+            stageTimer.mark("draw")
         pygame.display.flip()
+        if stageTimer is not None:
+            stageTimer.mark("flip")
+            stageTimer.endFrame()
+
+    simulation.finish(generationTimeLimit(population.generation), simulationTimestep if fixedTimestep() else None)
+    creditFastestGenome(genomes, startingFastestGenome)
+    applyLapBonuses()
+    reportProfile(population.generation)
+    print("Number of cars survived:", simulation.alive())
+
+def headToHeadMultipliers():
+    """
+    Returns:
+        Tuple of the Red and the Green team's (acceleration, deceleration, downforce, max speed) multipliers.
+    """
+    return (
+        (
+            racingConfigWindow.accelerationMultRed,
+            racingConfigWindow.decelerationMultRed,
+            racingConfigWindow.downforceMultRed,
+            racingConfigWindow.maxSpeedMultRed
+        ),
+        (
+            racingConfigWindow.accelerationMultGreen,
+            racingConfigWindow.decelerationMultGreen,
+            racingConfigWindow.downforceMultGreen,
+            racingConfigWindow.maxSpeedMultGreen
+        )
+    )
+
+def recordHeadToHeadLap(team, genome, genomeID, laps):
+    """
+    Records a lap completed in Head-to-Head mode and rewards the genome if it set a new best lap for its team.
+    The reward is added by applyLapBonuses once the generation has been simulated.
+
+    Args:
+        team: "Red" or "Green".
+        genome: The genome that drove the lap.
+        genomeID: ID shown for the lap.
+        laps: Every lap time the car has completed so far, ending with this lap.
+    """
+    global bestLapRed, bestLapGreen, bestLapRedText, bestLapGreenText
+
+    lapTime = laps[-1]
+    print(f"Lap: {len(laps)} Time: {lapTime:.2f} Average: {sum(laps) / len(laps):.2f}")
+    if lapTime >= (bestLapRed if team == "Red" else bestLapGreen)[0]:
+        return
+    teamBestLap = (lapTime, (populationRed if team == "Red" else populationGreen).generation, genomeID)
+    lapBonuses.append((genome, 5000))
+    print(f"Best Lap: {teamBestLap[0]:.2f} Generation: {teamBestLap[1]} Genome ID: {teamBestLap[2]}")
+    teamBestLapText = font.render(
+        f"{'Best Lap:':>15} {teamBestLap[0]:<6.2f}  Generation: {teamBestLap[1]:<4}  Genome ID: {teamBestLap[2]:<8}",
+        True, 
+        (111, 0, 39) if team == "Red" else (2, 106, 55)
+    )
+    if team == "Red":
+        bestLapRed, bestLapRedText = teamBestLap, teamBestLapText
+    else:
+        bestLapGreen, bestLapGreenText = teamBestLap, teamBestLapText
+
+def evalGenomesHeadToHeadParallel(genomesRed, genomesGreen, config):
+    """
+    Evaluates both teams headless on the worker pool at the same time, then replays their laps in the order a single
+    process would have completed them, Red's before Green's within a step.
+
+    Args:
+        genomesRed: List of the Red team's genomes to evaluate.
+        genomesGreen: List of the Green team's genomes to evaluate.
+        config: NEAT configuration.
+    """
+    timeLimit = generationTimeLimit(populationRed.generation)
+    (lapsRed, _), (lapsGreen, _) = parallelEvaluator.evaluateTeams(
+        [genomesRed, genomesGreen], config, timeLimit, simulationTimestep, physicsIntegrator, evaluationPolicy
+    )
 
-    print("Number of cars survived:", alive)
+    laps = sorted([(step, 0, idx, lapTime) for step, idx, lapTime in lapsRed] + [(step, 1, idx, lapTime) for step, idx, lapTime in lapsGreen])
+    carLaps = ([[] for _ in genomesRed], [[] for _ in genomesGreen])
+    for _, team, idx, lapTime in laps:
+        genome_id, genome = (genomesRed, genomesGreen)[team][idx]
+        carLaps[team][idx].append(lapTime)
+        recordHeadToHeadLap(("Red", "Green")[team], genome, genome_id, carLaps[team][idx])
+    applyLapBonuses()
 
 def evalGenomesHeadToHead(genomesRed, genomesGreen, config):
     """
     Evaluates genomes for both the Red and Green teams, displays them on the same track.
     """
-    global screen, bestLapRed, bestLapGreen, bestLapRedText, bestLapGreenText, font, populationRed, populationGreen, timeAddition
+    global screen, font, populationRed, populationGreen, timeAddition
+
+    if headless and parallelEvaluator is not None:
+        evalGenomesHeadToHeadParallel(genomesRed, genomesGreen, config)
+        return
 
     # Initialize Red and Green team cars
-    carsRed = []
-    carsGreen = []
-    networksRed = []
-    networksGreen = []
-
-    # Initialize cars for Red team
-    for genome_id, genome in genomesRed:
-        genome.fitness = 0
-        car = Car(initialCarX, initialCarY, carOptions[0])  # Red car
-        car.genomeID = genome_id
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
-        carsRed.append((car, genome))
-        networksRed.append(net)
-        car.lapStart = pygame.time.get_ticks() / 1000
-
-        car.acceleration *= racingConfigWindow.accelerationMultRed
-        car.deceleration *= racingConfigWindow.decelerationMultRed
-        car.downforceNewtons *= racingConfigWindow.downforceMultRed
-        car.maxVelocity *= racingConfigWindow.maxSpeedMultRed
-
-    # Initialize cars for Green team
-    for genome_id, genome in genomesGreen:
-        genome.fitness = 0
-        car = Car(initialCarX, initialCarY, carOptions[2])  # Green car
-        car.genomeID = genome_id
-        net = neat.nn.FeedForwardNetwork.create(genome, config)
-        carsGreen.append((car, genome))
-        networksGreen.append(net)
-        car.lapStart = pygame.time.get_ticks() / 1000
-
-        car.acceleration *= racingConfigWindow.accelerationMultGreen
-        car.deceleration *= racingConfigWindow.decelerationMultGreen
-        car.downforceNewtons *= racingConfigWindow.downforceMultGreen
-        car.maxVelocity *= racingConfigWindow.maxSpeedMultGreen
+    multipliersRed, multipliersGreen = headToHeadMultipliers()
+    simulationRed = Simulation(genomesRed, config, track, carOptions[0], multipliersRed, stageTimer, physicsIntegrator, evaluationPolicy)
+    simulationGreen = Simulation(genomesGreen, config, track, carOptions[2], multipliersGreen, stageTimer, physicsIntegrator, evaluationPolicy)
 
     clock = pygame.time.Clock()
-    startTime = pygame.time.get_ticks()
 
     # Simulation loop
-    while any(not car.crashed for car, _ in carsRed + carsGreen) and (pygame.time.get_ticks() - startTime) / 1000 < (30 * populationRed.generation) / (19 + populationRed.generation) + 3 + timeAddition:
-        dt = clock.tick(60) / 1000  # Frame time
-
-        # Handle Pygame events
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if plusButtonRect.collidepoint(event.pos):
-                    timeAddition += 1
-                    print("plus 1   Total:", timeAddition)
-                if minusButtonRect.collidepoint(event.pos):
-                    timeAddition -= 1
-                    print("edit 1   Total:", timeAddition)
-                if editButtonRect.collidepoint(event.pos):
-                    if not drawingEvent():
-                        pygame.quit()
-                        sys.exit()
-                    print("edit")
+    while simulationRed.running(generationTimeLimit(populationRed.generation)) or simulationGreen.running(generationTimeLimit(populationRed.generation)):
+        if stageTimer is not None:
+            stageTimer.start()
+        render = not headless and renderDue()
+        if headless:
+            dt = simulationTimestep
+        else:
+            if not watchMode:
+                dt = clock.tick(60) / 1000  # Frame time
+                if stageTimer is not None:
+                    stageTimer.mark("wait")
+            if fixedTimestep():
+                dt = simulationTimestep
+            if render:
+                handleEvents()
+                simulationRed.track = simulationGreen.track = track
+                if stageTimer is not None:
+                    stageTimer.mark("events")
+
+        # Simulate each team until it is done, so a team's result doesn't depend on how long the other one drives
+        for team, simulation in (("Red", simulationRed), ("Green", simulationGreen)):
+            if not simulation.running(generationTimeLimit(populationRed.generation)):
+                continue
+            for car, genome, lapTime in simulation.step(dt):
+                recordHeadToHeadLap(team, genome, car.genomeID, car.totalLaps)
+            if stageTimer is not None:
+                stageTimer.mark("laps")
+
+        if not render:
+            if stageTimer is not None:
+                stageTimer.endFrame()
+            continue
 
         # Clear the screen and display the track
         screen.blit(userTrack, (0, 0))
@@ -357,133 +712,33 @@ def evalGenomesHeadToHead(genomesRed, genomesGreen, config):
         screen.blit(minusButton, (minusButtonX, minusButtonY))
         screen.blit(plusButton, (plusButtonX, plusButtonY))
 
-        # Simulate Red team
-        for idx, (car, genome) in enumerate(carsRed):
-            if not car.crashed:
-                car.castLines(screen, pixelArray)
-
-                inputs = [
-                    car.frontCast,
-                    car.leftCast,
-                    car.rightCast,
-                    car.left30AngleCast,
-                    car.right30AngleCast,
-                    car.left45AngleCast,
-                    car.right45AngleCast,
-                    car.velocity,
-                    car.maxWheelAngle,
-                    car.currentWheelAngle
-                ]
-                output = networksRed[idx].activate(inputs)
-
-                # Initial acceleration and steering limitations
-                if (pygame.time.get_ticks() - startTime) / 1000 < 2:
-                    car.throttlePosition = 0.55
-                    car.currentWheelAngle = (output[1] * 2 - 1) * car.maxWheelAngle * 0.2
-                else:
-                    car.throttlePosition = output[0]
-                    car.currentWheelAngle = (output[1] * 2 - 1) * car.maxWheelAngle
-
-                # Update car
-                car.updateVelocity(dt)
-                car.updateCarPosition(dt)
-                car.displayCar(screen)
-
-                # Check for collisions
-                checkCollisionWithWhitePixels(car)
-
-                # Check for finish line crossing
-                if math.cos(car.carAngle) > 0 and checkCollisionWithFinishLine(car) and car.leftFinishLine and pygame.time.get_ticks() / 1000 - car.lapStart  >= 2:
-                    lapTime = pygame.time.get_ticks() / 1000 - car.lapStart
-                    car.totalLaps.append(lapTime)
-                    car.lapStart = pygame.time.get_ticks() / 1000
-                    car.leftFinishLine = False
-                    car.completedLap = True  # Set the flag
-
-                    print(f"Lap: {len(car.totalLaps)} Time: {lapTime:.2f} Average: {sum(car.totalLaps) / len(car.totalLaps):.2f}")
-                    if lapTime < bestLapRed[0]:
-                        bestLapRed = (lapTime, populationRed.generation, car.genomeID)
-                        genome.fitness += 5000
-                        print(f"Best Lap: {bestLapRed[0]:.2f} Generation: {bestLapRed[1]} Genome ID: {bestLapRed[2]}")
-                        bestLapRedText = font.render(
-                            f"{'Best Lap:':>15} {bestLapRed[0]:<6.2f}  Generation: {bestLapRed[1]:<4}  Genome ID: {bestLapRed[2]:<8}",
-                            True, 
-                            (111, 0, 39)
-                        )
-
-                if not car.hitFinishLine and not car.leftFinishLine:
-                    car.leftFinishLine = True
-
-                # Calculate fitness
-                fitness(genome, car, dt)
-
-        # Simulate Green team
-        for idx, (car, genome) in enumerate(carsGreen):
-            if not car.crashed:
-                car.castLines(screen, pixelArray)
-                inputs = [
-                    car.frontCast,
-                    car.leftCast,
-                    car.rightCast,
-                    car.left30AngleCast,
-                    car.right30AngleCast,
-                    car.left45AngleCast,
-                    car.right45AngleCast,
-                    car.velocity,
-                    car.maxWheelAngle,
-                    car.currentWheelAngle
-                ]
-                output = networksGreen[idx].activate(inputs)
-
-                # Initial acceleration and steering limitations
-                if (pygame.time.get_ticks() - startTime) / 1000 < 2:
-                    car.throttlePosition = 0.55
-                    car.currentWheelAngle = (output[1] * 2 - 1) * car.maxWheelAngle * 0.2
-                else:
-                    car.throttlePosition = output[0]
-                    car.currentWheelAngle = (output[1] * 2 - 1) * car.maxWheelAngle
-
-                # Update car
-                car.updateVelocity(dt)
-                car.updateCarPosition(dt)
-                car.displayCar(screen)
-
-
-                # Check for collisions
-                checkCollisionWithWhitePixels(car)
-
-                # Check for finish line crossing
-                if math.cos(car.carAngle) > 0 and checkCollisionWithFinishLine(car) and car.leftFinishLine and pygame.time.get_ticks() / 1000 - car.lapStart  >= 2:
-                    lapTime = pygame.time.get_ticks() / 1000 - car.lapStart
-                    car.totalLaps.append(lapTime)
-                    car.lapStart = pygame.time.get_ticks() / 1000
-                    car.leftFinishLine = False
-                    car.completedLap = True  # Set the flag
-
-                    print(f"Lap: {len(car.totalLaps)} Time: {lapTime:.2f} Average: {sum(car.totalLaps) / len(car.totalLaps):.2f}")
-                    if lapTime < bestLapGreen[0]:
-                        bestLapGreen = (lapTime, populationGreen.generation, car.genomeID)
-                        genome.fitness += 5000
-                        print(f"Best Lap: {bestLapGreen[0]:.2f} Generation: {bestLapGreen[1]} Genome ID: {bestLapGreen[2]}")
-                        bestLapGreenText = font.render(
-                            f"{'Best Lap:':>15} {bestLapGreen[0]:<6.2f}  Generation: {bestLapGreen[1]:<4}  Genome ID: {bestLapGreen[2]:<8}",
-                            True, 
-                            (2, 106, 55)
-                        )
-
-                if not car.hitFinishLine and not car.leftFinishLine:
-                    car.leftFinishLine = True
-
-                # Calculate fitness
-                fitness(genome, car, dt)
-
+        # Draw both teams
+        for car in carsToDraw(simulationRed.cars) + carsToDraw(simulationGreen.cars):
+            car.displayCar(screen)
+        if leaderboardSize:
+            drawLeaderboard([simulationRed, simulationGreen], screen.get_width() - 10, editButtonY + editButton.get_height() + 10)
+        if stageTimer is not None:
+            drawProfile(10, 3 + 2 * (bestLapRedText.get_height() + 5))
+            stageTimer.mark("draw")
 
         # Update the display
         pygame.display.flip()
+        if stageTimer is not None:
+            stageTimer.mark("flip")
+            stageTimer.endFrame()
+
+    stepTime = simulationTimestep if fixedTimestep() else None
+    simulationRed.finish(generationTimeLimit(populationRed.generation), stepTime)
+    simulationGreen.finish(generationTimeLimit(populationRed.generation), stepTime)
+    applyLapBonuses()
+    reportProfile(populationRed.generation)
 
-def runNeatBestTime():
+def runNeatBestTime(island=None):
     """
     Runs the NEAT algorithm with the provided configuration.
+
+    Args:
+        island: Optional Island the population evolves on, when it is one of several islands.
     """
     config = neat.config.Config(
         neat.DefaultGenome,
@@ -493,17 +748,33 @@ def runNeatBestTime():
         configFile
     )
     global population
-    if racingConfigWindow.usingExistingNetwork:
+    seedRandom()
+    carColors.seed(randomSeed)
+    restoredFastestGenome = None
+    if racingConfigWindow.usingExistingNetwork and racingConfigWindow.existingNetworkPath.endswith(".snap"):
+        population, restoredFastestGenome = loadSnapshot(racingConfigWindow.existingNetworkPath, config)
+        seedRandom()  # Restoring a snapshot also restores the random state it was saved with
+    elif racingConfigWindow.usingExistingNetwork:
         population = neat.Checkpointer.restore_checkpoint(racingConfigWindow.existingNetworkPath)
         if isinstance(population.population, neat.Population):
             population = population.population
+        seedRandom()  # Restoring a checkpoint also restores the random state it was saved with
     else:
         population = neat.Population(config)
     population.add_reporter(neat.StdOutReporter(True))
     stats = neat.StatisticsReporter()
     population.add_reporter(stats)
+    if recordDigestPath is not None or verifyDigestPath is not None:
+        population.add_reporter(DigestReporter(recordDigestPath, verifyDigestPath))
+    # Immigrants are swapped in before the checkpoints and snapshots save the population
+    if island is not None:
+        population.add_reporter(MigrationReporter(island, population, lambda: [fastestGenome], lambda: (bestLap, bestFirstLap)))
     if capturingCheckpoints:
-        population.add_reporter(neat.Checkpointer(checkpointFrequency, filename_prefix='checkpoints/'))
+        population.add_reporter(neat.Checkpointer(checkpointFrequency, filename_prefix='checkpoints/' if island is None else f'checkpoints/island-{island.index}-'))
+    snapshotWriter = None
+    if snapshotPath is not None:
+        snapshotWriter = SnapshotWriter(snapshotPath, snapshotFrequency, lambda: fastestGenome)
+        population.add_reporter(snapshotWriter)
 
     # Creating text variables
     global font
@@ -526,14 +797,72 @@ def runNeatBestTime():
     )
 
     global fastestGenome
-    fastestGenome = None
+    fastestGenome = restoredFastestGenome  # Drives again as car 0, so its lap can be replayed
+
+    global parallelEvaluator
+    if headless and numberOfWorkers > 1:
+        parallelEvaluator = ParallelEvaluator(numberOfWorkers, [track] + trainingTracks, [("images/f1CarRed.png", (
+            racingConfigWindow.accelerationMult,
+            racingConfigWindow.decelerationMult,
+            racingConfigWindow.downforceMult,
+            racingConfigWindow.maxSpeedMult
+        ))])
+
+    if steadyState:
+        evolver = SteadyStateEvolver(population, submitBatch, scoreBatch, steadyStateBatch, 2 * max(numberOfWorkers, 1))
+        winner = evolver.run(numberOfGenerationsSimulated)
+    else:
+        winner = population.run(evalGenomesBestTime, numberOfGenerationsSimulated)
 
-    winner = population.run(evalGenomesBestTime, numberOfGenerationsSimulated)
+    if parallelEvaluator is not None:
+        parallelEvaluator.close()
+    if snapshotWriter is not None:
+        snapshotWriter.close()
 
     print(f"Best genome: {winner}")
     print(f"Best Lap: {bestLap[0]:.2f} Generation: {bestLap[1]} Genome ID: {bestLap[2]}")
     print(f"Best First Lap: {bestFirstLap[0]:.2f} Generation: {bestFirstLap[1]} Genome ID: {bestFirstLap[2]}")
 
+def runIsland(island):
+    """
+    Runs Best Time mode as one island, in the island's own process. Every island has its own seed, configuration
+    file, digest files and checkpoints.
+
+    Args:
+        island: The Island to evolve on.
+    """
+    global randomSeed, configFile, recordDigestPath, verifyDigestPath, snapshotPath
+    if randomSeed is not None:
+        randomSeed += island.index
+    if islandConfigFiles:
+        configFile = islandConfigFiles[island.index % len(islandConfigFiles)]
+    if recordDigestPath is not None:
+        recordDigestPath = f"{recordDigestPath}.island-{island.index}"
+    if verifyDigestPath is not None:
+        verifyDigestPath = f"{verifyDigestPath}.island-{island.index}"
+    if snapshotPath is not None:
+        snapshotRoot, snapshotExtension = os.path.splitext(snapshotPath)
+        snapshotPath = f"{snapshotRoot}.island-{island.index}{snapshotExtension}"  # Keeps the .snap extension that resuming looks for
+    runNeatBestTime(island)
+
+def runNeatIslands():
+    """
+    Runs Best Time mode on several islands at once and reports every new best lap across all of them.
+    """
+    processes, reports, inboxes = startIslands(numberOfIslands, runIsland, migrationInterval, islandMigrants)
+    globalBestLap = (math.inf, 0, 0, 0)
+    globalBestFirstLap = (math.inf, 0, 0, 0)
+    for islandIndex, generation, (islandBestLap, islandBestFirstLap) in collectReports(processes, reports, inboxes):
+        if islandBestLap[0] < globalBestLap[0]:
+            globalBestLap = (*islandBestLap, islandIndex)
+            print(f"Global Best Lap: {globalBestLap[0]:.2f} Island: {islandIndex} Generation: {globalBestLap[1]} Genome ID: {globalBestLap[2]}")
+        if islandBestFirstLap[0] < globalBestFirstLap[0]:
+            globalBestFirstLap = (*islandBestFirstLap, islandIndex)
+            print(f"Global Best First Lap: {globalBestFirstLap[0]:.2f} Island: {islandIndex} Generation: {globalBestFirstLap[1]} Genome ID: {globalBestFirstLap[2]}")
+
+    print(f"Global Best Lap: {globalBestLap[0]:.2f} Island: {globalBestLap[3]} Generation: {globalBestLap[1]} Genome ID: {globalBestLap[2]}")
+    print(f"Global Best First Lap: {globalBestFirstLap[0]:.2f} Island: {globalBestFirstLap[3]} Generation: {globalBestFirstLap[1]} Genome ID: {globalBestFirstLap[2]}")
+
 def runNeatHeadToHead():
     """
     Runs the NEAT algorithm with two populations (Red vs Green) concurrently.
@@ -548,6 +877,7 @@ def runNeatHeadToHead():
 
     # Initialize populations for both teams
     global populationRed, populationGreen
+    seedRandom()
     populationRed = neat.Population(config)
     populationGreen = neat.Population(config)
 
@@ -577,6 +907,10 @@ def runNeatHeadToHead():
         (2, 106, 55)
     )
 
+    global parallelEvaluator
+    if headless and numberOfWorkers > 1:
+        multipliersRed, multipliersGreen = headToHeadMultipliers()
+        parallelEvaluator = ParallelEvaluator(numberOfWorkers, [track], [("images/f1CarRed.png", multipliersRed), ("images/f1CarGreen.png", multipliersGreen)])
 
     # Run evaluation for both populations
     while True:
@@ -615,6 +949,9 @@ def runNeatHeadToHead():
         populationRed.generation += 1
         populationGreen.generation += 1
 
+    if parallelEvaluator is not None:
+        parallelEvaluator.close()
+
 def drawingEvent():
     """
     Handles the drawing event where the user can draw the track.
@@ -624,6 +961,8 @@ def drawingEvent():
     drawing = False
     lastPos = None
     brushRadius = 50
+    dirtyRects = []  # Every part of the track drawn on, so only those parts of the masks are rebuilt
+    rebuildTrack = track is None  # The whole track is built again after it is cleared or resized
 
     screen.blit(userTrack, (0,0))
     startButton = pygame.image.load("images/StartButton.png")
@@ -661,12 +1000,14 @@ def drawingEvent():
                 finishLineY = screenHeight * 0.9 - 50  # 50 = finishLine.height // 2
                 initialCarX = screenWidth / 2 - 23
                 initialCarY =  screenHeight * 0.9
+                rebuildTrack = True
 
                 
 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_c:
                     screen.fill(white)
+                    rebuildTrack = True
                 elif event.key == pygame.K_1:
                     brushRadius = 10
                 elif event.key == pygame.K_2:
@@ -695,7 +1036,9 @@ def drawingEvent():
             if event.type == pygame.MOUSEMOTION and drawing:
                 currentPos = event.pos
                 if lastPos:
-                    drawCircle(screen, drawingColor, lastPos, currentPos, brushRadius)
+                    drawnRect = drawCircle(screen, drawingColor, lastPos, currentPos, brushRadius)
+                    if drawnRect is not None:
+                        dirtyRects.append(drawnRect)
                 lastPos = currentPos
         drawFinishLine(finishLineX-15, finishLineY, 30, 100, 3)
         screen.blit(startButton, (startButtonX, startButtonY))
@@ -708,13 +1051,107 @@ def drawingEvent():
 
     userTrack = screen.copy()  # Use user's drawn track
     screen = pygame.display.set_mode((screenWidth, screenHeight))
-    createMasks()
+    if rebuildTrack or userTrack.get_size() != (track.width, track.height):
+        createMasks()
+    else:
+        # The finish line and start button are drawn over whatever was there too
+        dirtyRects.append(pygame.Rect(finishLineX - 15, finishLineY, 30, 100).inflate(2, 2))
+        dirtyRects.append(startButton.get_rect(topleft=(startButtonX, startButtonY)).inflate(2, 2))
+        track.update(userTrack, dirtyRects)
 
     return True
 
 if __name__ == "__main__":
-    racingConfigWindow = RacingConfig()
-    racingConfigWindow.run()
+    parser = argparse.ArgumentParser(description="Racing Line Simulation")
+    parser.add_argument("--headless", action="store_true", help="train without opening a window, advancing in fixed simulated timesteps")
+    parser.add_argument("--track", help="track image used in headless mode (ex. images/hardTest.png)")
+    parser.add_argument("--headToHead", action="store_true", help="run Head-to-Head mode instead of Best Time in headless mode")
+    parser.add_argument("--network", help="checkpoint or snapshot file to continue from in headless mode (ex. checkpoints/129-6.43)")
+    parser.add_argument("--generations", type=int, default=numberOfGenerationsSimulated, help="number of generations to simulate")
+    parser.add_argument("--workers", type=int, default=numberOfWorkers, help="worker processes used to evaluate each generation in headless mode")
+    parser.add_argument("--timestep", type=float, default=simulationTimestep, help="simulated seconds per fixed step (ex. 0.05 with --integrator arc)")
+    parser.add_argument("--integrator", choices=integrators, default=physicsIntegrator, help="how the cars are moved between steps, arc stays accurate at larger timesteps")
+    parser.add_argument("--trainTracks", nargs="+", default=trainingTrackPaths, help="in headless Best Time mode, also score every genome on these tracks (ex. images/hardTest.png)")
+    parser.add_argument("--trackFitness", choices=("mean", "worst"), default=trackFitness, help="combine a genome's fitness on every track by its mean or its worst")
+    parser.add_argument("--steadyState", action="store_true", help="in headless Best Time mode, breed from a rolling pool as batches of genomes come back instead of waiting for whole generations")
+    parser.add_argument("--steadyStateBatch", type=int, default=steadyStateBatch, help="genomes simulated together in a steady state batch")
+    parser.add_argument("--islands", type=int, default=numberOfIslands, help="in headless Best Time mode, evolve this many populations in their own processes that swap their best genomes")
+    parser.add_argument("--migrationInterval", type=int, default=migrationInterval, help="generations between migrations of the islands' best genomes")
+    parser.add_argument("--migrants", type=int, default=islandMigrants, help="genomes each island sends to the next one every migration")
+    parser.add_argument("--islandConfigs", nargs="+", default=islandConfigFiles, help="NEAT configuration file of every island in turn (ex. configFiles/config.txt)")
+    parser.add_argument("--fitnessCache", type=int, default=fitnessCacheSize, help="in headless Best Time mode, carry up to this many unchanged genomes on from where their cars got to in earlier generations instead of simulating them from the start")
+    parser.add_argument("--finishAfterLaps", type=int, default=lapsToFinish, help="take a car off the track once it completes this many laps")
+    parser.add_argument("--stallSeconds", type=float, default=stallSeconds, help="stop a car that doesn't move stallDistance pixels in this many seconds")
+    parser.add_argument("--endAfterFinishers", type=int, default=finishersToEnd, help="end the generation once this many cars have finished, needs --finishAfterLaps")
+    parser.add_argument("--snapshots", default=snapshotPath, help="in Best Time mode, append a compact snapshot of every changed genome to this file in the background (ex. checkpoints/run.snap)")
+    parser.add_argument("--snapshotEvery", type=int, default=snapshotFrequency, help="generations between snapshots")
+    parser.add_argument("--seed", type=int, default=randomSeed, help="seed every random number generator and use a fixed timestep so the run can be repeated")
+    parser.add_argument("--recordDigests", default=recordDigestPath, help="write the fitness digest of every Best Time generation to this file")
+    parser.add_argument("--verifyDigests", default=verifyDigestPath, help="stop if a Best Time generation's fitness digest differs from this recorded file")
+    parser.add_argument("--profile", action="store_true", help="time every stage of each frame and show the times below the best lap")
+    parser.add_argument("--trace", default=profileTraceDirectory, help="directory a CSV of every frame's stage times is written to after each generation")
+    parser.add_argument("--watch", action="store_true", help="simulate as fast as possible and only redraw the window now and then")
+    parser.add_argument("--renderFPS", type=float, default=renderFPS, help="most redraws per second in watch mode")
+    parser.add_argument("--renderEvery", type=int, help="in watch mode, redraw every this many steps instead of capping the redraws per second")
+    parser.add_argument("--leaderboard", type=int, default=leaderboardSize, help="cars shown on the live leaderboard, 0 hides it")
+    parser.add_argument("--spotlight", type=int, default=spotlightCars, help="only draw the fastest genome and this many of the fittest cars of each team")
+    args = parser.parse_args()
+    headless = headless or args.headless
+    numberOfGenerationsSimulated = args.generations
+    numberOfWorkers = args.workers
+    fitnessCacheSize = args.fitnessCache
+    trainingTrackPaths = args.trainTracks
+    trackFitness = args.trackFitness
+    if trainingTrackPaths and not headless:
+        parser.error("--trainTracks needs --headless")
+    steadyState = steadyState or args.steadyState
+    steadyStateBatch = args.steadyStateBatch
+    if steadyState and (not headless or args.headToHead or trainingTrackPaths or args.islands > 1):
+        parser.error("--steadyState needs --headless Best Time mode on one track without islands")
+    numberOfIslands = args.islands
+    migrationInterval = args.migrationInterval
+    islandMigrants = args.migrants
+    islandConfigFiles = args.islandConfigs
+    if numberOfIslands > 1 and (not headless or args.headToHead):
+        parser.error("--islands needs --headless Best Time mode")
+    if numberOfIslands > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        parser.error("--islands needs processes to be forked, which this platform can't do")
+    if fitnessCacheSize is not None:
+        fitnessCache = FitnessCache(fitnessCacheSize)
+    simulationTimestep = args.timestep
+    physicsIntegrator = args.integrator
+    lapsToFinish = args.finishAfterLaps
+    stallSeconds = args.stallSeconds
+    finishersToEnd = args.endAfterFinishers
+    if finishersToEnd is not None and lapsToFinish is None:
+        parser.error("--endAfterFinishers needs --finishAfterLaps")
+    if lapsToFinish is not None or stallSeconds is not None:
+        evaluationPolicy = EvaluationPolicy(lapsToFinish, stallSeconds, stallDistance, finishersToEnd)
+    snapshotPath = args.snapshots
+    snapshotFrequency = args.snapshotEvery
+    randomSeed = args.seed
+    recordDigestPath = args.recordDigests
+    verifyDigestPath = args.verifyDigests
+    profileTraceDirectory = args.trace
+    watchMode = watchMode or args.watch
+    renderFPS = args.renderFPS
+    if args.renderEvery is not None:
+        renderEvery = args.renderEvery
+        renderFPS = None
+    spotlightCars = args.spotlight
+    leaderboardSize = args.leaderboard
+    profiling = profiling or args.profile or profileTraceDirectory is not None
+    if profiling:
+        stageTimer = StageTimer(tracing=profileTraceDirectory is not None)
+
+    if headless:
+        if args.track is None:
+            parser.error("--track is required in headless mode")
+        racingConfigWindow = HeadlessConfig(args.headToHead, args.track, args.network)
+        os.environ["SDL_VIDEODRIVER"] = "dummy"  # Nothing is shown, but the track still needs a display format
+    else:
+        racingConfigWindow = RacingConfig()
+        racingConfigWindow.run()
 
     # Initialize Pygame
     pygame.init()
@@ -780,17 +1217,21 @@ if __name__ == "__main__":
         simulating = drawingEvent()  # Flag if the user wants to simulate
 
     if racingConfigWindow.usingExistingTrack:
-        userTrack = pygame.image.load(racingConfigWindow.existingTrackPath)  # Use existing track
+        compiledTrack = racingConfigWindow.existingTrackPath.endswith(".track")
+        if compiledTrack:
+            track = loadCompiledTrack(racingConfigWindow.existingTrackPath)  # Everything is already built
+            userTrack = track.surface
+        else:
+            userTrack = pygame.image.load(racingConfigWindow.existingTrackPath)  # Use existing track
         screen = pygame.display.set_mode((userTrack.get_width(), userTrack.get_height()))
         screenWidth, screenHeight = userTrack.get_width(), userTrack.get_height()
         finishLineX = screenWidth / 2
         finishLineY = screenHeight * 0.9 - 50  # 50 = finishLine.height // 2
         initialCarX = screenWidth / 2 - 23
         initialCarY =  screenHeight * 0.9
-
-    global trackMaskSurface, pixelArray, outOfBoundsMask, finishLineMask
-    if racingConfigWindow.usingExistingTrack:
-        createMasks()
+        if not compiledTrack:
+            createMasks()
+    trainingTracks = [loadTrack(path) for path in trainingTrackPaths]
 
     # Simulating
     if simulating:
@@ -799,8 +1240,9 @@ if __name__ == "__main__":
             runNeatHeadToHead()
         else:
             configFile = "configFiles/config.txt"
-            runNeatBestTime()
-
+            if numberOfIslands > 1:
+                runNeatIslands()
+            else:
+                runNeatBestTime()
 
-    del pixelArray
     pygame.quit()
\ No newline at end of file
@@ -0,0 +1,246 @@
+import math
+import copy
+import multiprocessing
+from car import loadCarImage
+from simulation import Simulation
+
+# Set once in every worker process by initWorker
+workerTracks = []
+workerTeams = []  # (car image, multipliers) of every team
+
+def initWorker(tracks, teams):
+    """
+    Loads the tracks' masks and every team's car image once per worker process.
+
+    Args:
+        tracks: List of the tracks the genomes are evaluated on.
+        teams: List of (carImagePath, multipliers) for every team, where carImagePath is the image used for the team's
+            cars and multipliers are the (acceleration, deceleration, downforce, max speed) multipliers applied to them.
+    """
+    global workerTracks, workerTeams
+    workerTracks = tracks
+    workerTeams = [(loadCarImage(carImagePath), multipliers) for carImagePath, multipliers in teams]
+
+def simulateGenomes(genomes, config, track, carImage, multipliers, timeLimit, dt, integrator="euler", policy=None, timer=None, states=None):
+    """
+    Simulates genomes headless until none are driving or the time limit is reached.
+
+    Args:
+        genomes: List of (genome_id, genome) pairs to evaluate.
+        config: NEAT configuration.
+        track: The track being driven.
+        carImage: Pygame surface used for every car.
+        multipliers: (acceleration, deceleration, downforce, max speed) multipliers applied to every car.
+        timeLimit: Simulated seconds before the generation is stopped.
+        dt: Simulated time step in seconds.
+        integrator: Name of the fleet integrator that moves the cars.
+        policy: Optional EvaluationPolicy for stopping cars and the generation early.
+        timer: Optional StageTimer that every step reports the time of each stage to.
+        states: Optional list with a state this function returned for an earlier, shorter run of the genome, or None
+            to start at the start line, for every genome. The cars carry on from their states.
+
+    Returns:
+        Tuple of the fitness of each genome, a list of (step, genomeID, lapTime) for every completed lap and the
+        state of each genome's car before the time limit's bonuses were credited, which carries on from there when
+        passed back in.
+    """
+    simulation = Simulation(genomes, config, track, carImage, multipliers, timer, integrator, policy, states)
+
+    carLaps = [list(state["laps"]) if state is not None else [] for state in states or [None] * len(genomes)]
+    while simulation.running(timeLimit):
+        if timer is not None:
+            timer.start()
+        for car, _, lapTime in simulation.step(dt):
+            carLaps[car.row].append((simulation.steps - 1, lapTime))
+        if timer is not None:
+            timer.endFrame()
+    endStates = [{**simulation.saveCar(row), "laps": carLaps[row], "timeLimit": timeLimit} for row in range(len(genomes))]
+    simulation.finish(timeLimit, dt)
+
+    laps = sorted((step, idx, lapTime) for idx, rowLaps in enumerate(carLaps) for step, lapTime in rowLaps)
+    return [genome.fitness for _, genome in simulation.cars], [(step, genomes[idx][0], lapTime) for step, idx, lapTime in laps], endStates
+
+def simulateShard(shard):
+    """
+    Simulates one worker's share of the genomes.
+
+    Args:
+        shard: Tuple of (genomes, config, timeLimit, dt, integrator, policy, team, trackIndex, states), where team is
+            the index of the genomes' team, trackIndex the index of the track they drive and states the states their
+            cars carry on from, as simulateGenomes takes them.
+
+    Returns:
+        Tuple returned by simulateGenomes.
+    """
+    genomes, config, timeLimit, dt, integrator, policy, team, trackIndex, states = shard
+    carImage, multipliers = workerTeams[team]
+    return simulateGenomes(genomes, config, workerTracks[trackIndex], carImage, multipliers, timeLimit, dt, integrator, policy, states=states)
+
+class ParallelEvaluator:
+    """
+    Evaluates a generation headless by splitting the genomes across a pool of worker processes. Teams that race on
+    the same track without touching each other, like Head-to-Head's Red and Green, and the same genomes driving
+    several tracks are split across the same pool.
+    """
+
+    def __init__(self, numWorkers, tracks, teams):
+        """
+        Starts the worker pool. Each worker attaches to the tracks once and keeps them for every generation.
+        A track that wasn't loaded from a compiled file is first copied to shared memory, so the workers map the
+        same wall grid, distance field and pixels instead of each building their own.
+
+        Args:
+            numWorkers: Number of worker processes.
+            tracks: List of the tracks the genomes are evaluated on.
+            teams: List of (carImagePath, multipliers) for every team, where carImagePath is the image used for the
+                team's cars and multipliers are the (acceleration, deceleration, downforce, max speed) multipliers
+                applied to them.
+        """
+        self.numWorkers = numWorkers
+        self.numTracks = len(tracks)
+        self.sharedTracks = []  # Copies of the tracks that were moved to shared memory
+        workerTracks = []
+        for track in tracks:
+            if track.path is None:
+                track = track.share()
+                self.sharedTracks.append(track)
+            workerTracks.append(track)
+        self.pool = multiprocessing.Pool(numWorkers, initializer=initWorker, initargs=(workerTracks, teams))
+
+    def evaluate(self, genomes, config, timeLimit, dt, integrator="euler", policy=None):
+        """
+        Simulates every genome of the first team on the first track and sets its fitness.
+
+        Returns:
+            Tuple returned by evaluateTeams for the team.
+        """
+        return self.evaluateTeams([genomes], config, timeLimit, dt, integrator, policy)[0]
+
+    def evaluateTeams(self, teamGenomes, config, timeLimit, dt, integrator="euler", policy=None):
+        """
+        Simulates every genome of every team on the first track and sets its fitness. The teams are evaluated at the
+        same time.
+
+        Args:
+            teamGenomes: List of the (genome_id, genome) pairs to evaluate for every team, in the order the teams were
+                given to the constructor.
+            config: NEAT configuration.
+            timeLimit: Simulated seconds before the generation is stopped.
+            dt: Simulated time step in seconds.
+            integrator: Name of the fleet integrator that moves the cars.
+            policy: Optional EvaluationPolicy for stopping cars and the generation early, applied to each team on its
+                own.
+
+        Returns:
+            List with a tuple for every team of a list of (step, index, lapTime) for every completed lap, in the order
+            the laps would have been completed by a single process simulating the whole team, where index is the
+            genome's position in the team's genomes, and the state of each genome's car.
+        """
+        races = [(genomes, team, 0, None) for team, genomes in enumerate(teamGenomes)]
+        teamResults = []
+        for genomes, (fitnesses, laps, states) in zip(teamGenomes, self.simulateRaces(races, config, timeLimit, dt, integrator, policy)):
+            for (_, genome), genomeFitness in zip(genomes, fitnesses):
+                genome.fitness = genomeFitness
+            teamResults.append((laps, states))
+        return teamResults
+
+    def evaluateTracks(self, genomes, config, timeLimit, dt, integrator="euler", policy=None, trackStates=None):
+        """
+        Simulates every genome of the first team on every track, with every track evaluated at the same time. The
+        genomes' fitness isn't set, since it is up to the caller how the tracks' fitnesses are combined.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs to evaluate.
+            config: NEAT configuration.
+            timeLimit: Simulated seconds before the generation is stopped.
+            dt: Simulated time step in seconds.
+            integrator: Name of the fleet integrator that moves the cars.
+            policy: Optional EvaluationPolicy for stopping cars and the generation early, applied to each track on
+                its own.
+            trackStates: Optional list with the states the genomes' cars carry on from on every track, as
+                simulateGenomes takes them.
+
+        Returns:
+            List with a tuple for every track, in the order the tracks were given to the constructor, of the fitness
+            of each genome, its laps and its car's state, as simulateRaces returns them.
+        """
+        if trackStates is None:
+            trackStates = [None] * self.numTracks
+        races = [(genomes, 0, trackIndex, states) for trackIndex, states in enumerate(trackStates)]
+        return self.simulateRaces(races, config, timeLimit, dt, integrator, policy)
+
+    def submit(self, genomes, config, timeLimit, dt, integrator="euler", policy=None):
+        """
+        Hands genomes of the first team on the first track to the next free worker without waiting for them.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs to evaluate.
+            config: NEAT configuration.
+            timeLimit: Simulated seconds before the cars are stopped.
+            dt: Simulated time step in seconds.
+            integrator: Name of the fleet integrator that moves the cars.
+            policy: Optional EvaluationPolicy for stopping cars and the batch early.
+
+        Returns:
+            Function that waits for the worker and returns the tuple simulateGenomes returns.
+        """
+        return self.pool.apply_async(simulateShard, ((genomes, config, timeLimit, dt, integrator, policy, 0, 0, None),)).get
+
+    def simulateRaces(self, races, config, timeLimit, dt, integrator="euler", policy=None):
+        """
+        Simulates several groups of genomes that don't touch each other. Each group is split across all the workers
+        and every group's shards are handed out together.
+
+        Args:
+            races: List of (genomes, team, trackIndex, states) for every group, where genomes is a list of
+                (genome_id, genome) pairs and states the states their cars carry on from, as simulateGenomes takes
+                them.
+            config: NEAT configuration.
+            timeLimit: Simulated seconds before the generation is stopped.
+            dt: Simulated time step in seconds.
+            integrator: Name of the fleet integrator that moves the cars.
+            policy: Optional EvaluationPolicy for stopping cars and the generation early, applied to each group on its
+                own. The workers don't see each other's cars, so each one ends its share of a group's generation once
+                its share of the finishers is reached.
+
+        Returns:
+            List with a tuple for every group of the fitness of each genome, a list of (step, index, lapTime) for
+            every completed lap, in the order the laps would have been completed by a single process simulating the
+            whole group, where index is the genome's position in the group's genomes, and the state of each genome's
+            car.
+        """
+        if policy is not None and policy.finishersToEnd is not None:
+            policy = copy.copy(policy)
+            policy.finishersToEnd = math.ceil(policy.finishersToEnd / self.numWorkers)
+
+        # Interleave the genomes so every worker gets a similar mix of fast and slow cars
+        shards = [
+            (genomes[worker::self.numWorkers], config, timeLimit, dt, integrator, policy, team, trackIndex,
+             states[worker::self.numWorkers] if states is not None else None)
+            for genomes, team, trackIndex, states in races for worker in range(self.numWorkers)
+        ]
+        results = self.pool.map(simulateShard, shards, chunksize=1)
+
+        raceResults = [([None] * len(genomes), [], [None] * len(genomes)) for genomes, *_ in races]
+        positions = [{genome_id: idx for idx, (genome_id, _) in enumerate(genomes)} for genomes, *_ in races]
+        for shardIndex, (fitnesses, shardLaps, shardStates) in enumerate(results):
+            race = shardIndex // self.numWorkers
+            raceFitnesses, laps, states = raceResults[race]
+            for (genome_id, _), genomeFitness, state in zip(shards[shardIndex][0], fitnesses, shardStates):
+                raceFitnesses[positions[race][genome_id]] = genomeFitness
+                states[positions[race][genome_id]] = state
+            for step, genome_id, lapTime in shardLaps:
+                laps.append((step, positions[race][genome_id], lapTime))
+
+        for _, laps, _ in raceResults:
+            laps.sort()
+        return raceResults
+
+    def close(self):
+        """
+        Stops the worker processes and frees the shared tracks.
+        """
+        self.pool.close()
+        self.pool.join()
+        for track in self.sharedTracks:
+            track.sharedMemory.unlink()
@@ -0,0 +1,94 @@
+import csv
+import time
+from collections import deque
+
+class StageTimer:
+    """
+    Accumulates the wall time spent in each stage of a simulation step. Stages are timed back to back, so each mark
+    only costs one clock read.
+    When frames are ended with endFrame, the timer also keeps a rolling window of every stage's time per frame and,
+    if tracing, every frame of the generation so it can be written to a trace file.
+    """
+
+    def __init__(self, window=240, tracing=False):
+        """
+        Args:
+            window: Number of recent frames the rolling averages and percentiles are taken over.
+            tracing: Whether every frame is kept until the trace is written.
+        """
+        self.totals = {}  # Stage name -> seconds
+        self.last = time.perf_counter()
+        self.window = window
+        self.tracing = tracing
+        self.frame = {}  # Stage name -> seconds in the current frame
+        self.history = {}  # Stage name -> deque of seconds in the recent frames
+        self.trace = []  # Dictionary of stage name -> seconds for every frame since the trace was written
+        self.frameCount = 0
+
+    def start(self):
+        """
+        Starts timing the first stage.
+        """
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        """
+        Adds the time since the last mark to a stage.
+
+        Args:
+            stage: Name of the stage that just finished.
+        """
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.totals[stage] = self.totals.get(stage, 0) + elapsed
+        self.frame[stage] = self.frame.get(stage, 0) + elapsed
+        self.last = now
+
+    def endFrame(self):
+        """
+        Moves the current frame's stage times into the rolling window and the trace. The sum of the stages is kept
+        as the "total" stage.
+        """
+        self.frame["total"] = sum(self.frame.values())
+        for stage in self.frame:
+            if stage not in self.history:
+                self.history[stage] = deque(maxlen=self.window)
+        for stage, frameTimes in self.history.items():
+            frameTimes.append(self.frame.get(stage, 0))
+        if self.tracing:
+            self.trace.append(self.frame)
+        self.frame = {}
+        self.frameCount += 1
+
+    def summary(self):
+        """
+        Summarizes the rolling window.
+
+        Returns:
+            Dictionary of stage name -> (mean, median, 95th percentile) in milliseconds per frame.
+        """
+        summary = {}
+        for stage, frameTimes in self.history.items():
+            ordered = sorted(frameTimes)
+            summary[stage] = (
+                sum(ordered) / len(ordered) * 1000,
+                ordered[len(ordered) // 2] * 1000,
+                ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000
+            )
+        return summary
+
+    def writeTrace(self, path):
+        """
+        Writes every traced frame to a CSV file, one row per frame and one column per stage in milliseconds,
+        then starts a new trace.
+
+        Args:
+            path: Path of the CSV file.
+        """
+        stages = list(self.history)
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["frame"] + stages)
+            for frame, frameTimes in enumerate(self.trace):
+                writer.writerow([frame] + [f"{frameTimes.get(stage, 0) * 1000:.4f}" for stage in stages])
+        self.trace = []
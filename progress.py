@@ -0,0 +1,299 @@
+import numpy as np
+
+# Offsets of the 8 neighbors of a pixel
+neighborX = np.array([-1, -1, -1, 0, 0, 1, 1, 1])
+neighborY = np.array([-1, 0, 1, -1, 1, -1, 0, 1])
+
+def cutAcrossTrack(wallGrid, finishLineGrid):
+    """
+    Finds the pixels that separate the end of a lap from its start: the finish line, extended up and down each of its
+    columns to the walls so a lap can't go around the ends of a finish line drawn narrower than the track.
+
+    Args:
+        wallGrid: Boolean array indexed [x, y] that is True on walls.
+        finishLineGrid: Boolean array indexed [x, y] that is True on the finish line.
+
+    Returns:
+        Boolean array indexed [x, y] that is True on the cut.
+    """
+    cut = finishLineGrid & ~wallGrid
+    for x in np.nonzero(cut.any(axis=1))[0].tolist():
+        rows = np.nonzero(cut[x])[0]
+        wallsAbove = np.nonzero(wallGrid[x, :rows.min()])[0]
+        wallsBelow = np.nonzero(wallGrid[x, rows.max() + 1:])[0]
+        top = wallsAbove.max() + 1 if len(wallsAbove) else 0
+        bottom = rows.max() + wallsBelow.min() if len(wallsBelow) else wallGrid.shape[1] - 1
+        cut[x, top:bottom + 1] = True
+    return cut
+
+def createProgressField(wallGrid, finishLineGrid):
+    """
+    Builds the progress field of a track: for every pixel, how far along the lap it is, measured as the distance a car
+    has to drive from the finish line to reach it. Laps run in the direction of increasing x across the finish line,
+    the direction Simulation counts laps in. The distance is found with a breadth first search over the open pixels
+    that starts on the far side of the finish line and is not allowed to cross it, so it has to go all the way around.
+
+    Args:
+        wallGrid: Boolean array indexed [x, y] that is True on walls.
+        finishLineGrid: Boolean array indexed [x, y] that is True on the finish line.
+
+    Returns:
+        Tuple of a float array indexed [x, y] with the fraction of the lap completed at each pixel (0 on the finish
+        line, 1 or a little more at the end of the lap and -1 on walls and pixels a lap never reaches) and the lap
+        length in pixels (0 if the track has no lap).
+    """
+    cut = cutAcrossTrack(wallGrid, finishLineGrid)
+    blocked = padGrid(wallGrid | cut, True)
+    distance = padGrid(np.full(wallGrid.shape, -1, dtype=np.int32), -1)
+
+    # A lap starts on the open pixels right after the cut
+    start = np.zeros(wallGrid.shape, dtype=bool)
+    start[1:] = cut[:-1] & ~wallGrid[1:] & ~cut[1:]
+    startX, startY = np.nonzero(start)
+    startPixels = toPadded(startX, startY, wallGrid.shape)
+    distance.ravel()[startPixels] = 0
+
+    searchLap(blocked, distance, startPixels, np.zeros(len(startPixels), dtype=np.int32))
+    return progressFromDistance(distance[1:-1, 1:-1], cut, blocked[1:-1, 1:-1])
+
+def updateProgressField(progressField, lapLength, wallGrid, finishLineGrid, left, top, right, bottom):
+    """
+    Repairs a progress field after the walls inside a rectangle changed, only searching again where the distances
+    changed. Pixels that were reached through pixels that are now walls lose their distance, level by level, unless
+    another neighbor one step closer still holds. The search is then resumed from the neighbors of those pixels and of
+    the pixels that opened, and only continues into pixels it brings closer. Open pixels have many equally short
+    paths, so most changes only reach a little past the rectangle, but one that makes the way around longer or shorter
+    for every later pixel searches the rest of the lap again. A change across the finish line's columns moves the
+    cut, so the whole field is built again then.
+
+    Args:
+        progressField: Field from createProgressField, built before the walls changed.
+        lapLength: Lap length the field was built with.
+        wallGrid: Boolean array indexed [x, y] that is True on walls, after the change.
+        finishLineGrid: Boolean array indexed [x, y] that is True on the finish line, after the change.
+        left, top, right, bottom: Rectangle of the pixels that changed, right and bottom exclusive.
+
+    Returns:
+        Tuple of the new progress field and lap length, as createProgressField returns.
+    """
+    finishColumns = np.nonzero(finishLineGrid.any(axis=1))[0]
+    if lapLength == 0 or len(finishColumns) == 0 or (left <= finishColumns.max() + 1 and right >= finishColumns.min()):
+        return createProgressField(wallGrid, finishLineGrid)
+    cut = cutAcrossTrack(wallGrid, finishLineGrid)
+    cutColumns = np.nonzero(cut.any(axis=1))[0]
+    if len(cutColumns) == 0:
+        return createProgressField(wallGrid, finishLineGrid)
+
+    blocked = padGrid(wallGrid | cut, True)
+    distance = padGrid(np.where(progressField >= 0, np.rint(progressField * lapLength), -1).astype(np.int32), -1)
+    distance[1:-1, 1:-1][cut] = -1
+
+    # Pixels reached before that are walls now, and open pixels that weren't reached
+    region = (slice(left + 1, right + 1), slice(top + 1, bottom + 1))
+    closedX, closedY = np.nonzero(blocked[region] & (distance[region] >= 0))
+    closed = toPadded(closedX + left, closedY + top, wallGrid.shape)
+    openedX, openedY = np.nonzero(~blocked[region] & (distance[region] < 0))
+    opened = toPadded(openedX + left, openedY + top, wallGrid.shape)
+
+    lost = invalidateDistances(distance, closed)
+    seeds = np.concatenate((lost, opened))
+    seedLevels = closestNeighbor(distance, seeds) + 1
+    reachable = seedLevels > 0
+    seeds = seeds[reachable]
+    seedLevels = seedLevels[reachable]
+    distance.ravel()[seeds] = seedLevels
+    found = searchLap(blocked, distance, seeds, seedLevels)
+
+    # The fractions only have to be worked out again where the distance changed, unless the lap length did too
+    endColumns = slice(max(cutColumns.min() - 1, 0), cutColumns.max() + 1)
+    end = np.zeros(cut[endColumns].shape, dtype=bool)
+    end[:-1] = cut[endColumns][1:] & ~blocked[1:-1, 1:-1][endColumns][:-1]
+    reachedEnd = distance[1:-1, 1:-1][endColumns][end]
+    reachedEnd = reachedEnd[reachedEnd >= 0]
+    if len(reachedEnd) == 0 or int(reachedEnd.max()) + 1 != lapLength:
+        return progressFromDistance(distance[1:-1, 1:-1], cut, blocked[1:-1, 1:-1])
+    changed = np.concatenate((closed, lost, found))
+    changedX, changedY = fromPadded(changed, wallGrid.shape)
+    changedDistance = distance.ravel()[changed]
+    progressField = progressField.copy()
+    progressField[changedX, changedY] = np.where(changedDistance >= 0, changedDistance / lapLength, -1).astype(np.float32)
+    return progressField, lapLength
+
+def padGrid(grid, border):
+    """
+    Returns:
+        Copy of a grid with a border of one pixel set to border around it, so every pixel of the grid has 8
+        neighbors and they can be found by adding neighborOffsets to its index in the flattened copy.
+    """
+    padded = np.full((grid.shape[0] + 2, grid.shape[1] + 2), border, dtype=grid.dtype)
+    padded[1:-1, 1:-1] = grid
+    return padded
+
+def neighborOffsets(shape):
+    """
+    Returns:
+        Offsets of the 8 neighbors of a pixel in a flattened grid of the shape padded by padGrid.
+    """
+    return neighborX * (shape[1] + 2) + neighborY
+
+def toPadded(pixelsX, pixelsY, shape):
+    """
+    Returns:
+        Indices of pixels of a grid of the shape in its flattened padded copy.
+    """
+    return ((pixelsX + 1) * (shape[1] + 2) + pixelsY + 1).astype(np.int64)
+
+def fromPadded(pixels, shape):
+    """
+    Returns:
+        Tuple of the x and y in a grid of the shape of indices into its flattened padded copy.
+    """
+    return pixels // (shape[1] + 2) - 1, pixels % (shape[1] + 2) - 1
+
+def uniquePixels(pixels, seen):
+    """
+    Drops repeated indices without sorting them.
+
+    Args:
+        pixels: Integer array of flattened indices.
+        seen: Integer scratch array the size of the flattened grid.
+
+    Returns:
+        The indices, each kept once.
+    """
+    order = np.arange(len(pixels))
+    seen[pixels] = order
+    return pixels[seen[pixels] == order]
+
+def closestNeighbor(distance, pixels):
+    """
+    Returns:
+        Integer array of the smallest distance of a reached neighbor of each pixel, -1 if none was reached.
+    """
+    unreached = np.iinfo(np.int32).max
+    neighborDistance = distance.ravel()[pixels[:, np.newaxis] + neighborOffsets((distance.shape[0] - 2, distance.shape[1] - 2))]
+    closest = np.where(neighborDistance >= 0, neighborDistance, unreached).min(axis=1, initial=unreached)
+    return np.where(closest < unreached, closest, -1)
+
+def invalidateDistances(distance, closed):
+    """
+    Clears the distance of the pixels that closed and of every pixel that was only reached through them. The pixels
+    one step farther than a cleared pixel are checked in order of distance, so by the time a pixel is checked every
+    neighbor one step closer has already been cleared if it was going to be.
+
+    Args:
+        distance: Padded integer array of the distances before the change, updated in place.
+        closed: Flattened padded indices of the pixels that are walls now.
+
+    Returns:
+        Flattened padded indices of the open pixels that were cleared.
+    """
+    flatDistance = distance.ravel()
+    offsets = neighborOffsets((distance.shape[0] - 2, distance.shape[1] - 2))
+    seen = np.zeros(flatDistance.size, dtype=np.int64)
+
+    neighbors = closed[:, np.newaxis] + offsets
+    following = flatDistance[neighbors] == flatDistance[closed][:, np.newaxis] + 1
+    pending = neighbors[following]
+    pendingLevels = flatDistance[pending]
+    flatDistance[closed] = -1
+
+    order = np.argsort(pendingLevels, kind="stable")
+    pending = pending[order]
+    pendingLevels = pendingLevels[order]
+    lost = []
+    frontier = pending[:0]
+    level = 0
+    nextPending = 0
+    while len(frontier) or nextPending < len(pending):
+        if len(frontier) == 0:
+            level = pendingLevels[nextPending]
+        last = np.searchsorted(pendingLevels, level, side="right")
+        frontier = np.concatenate((frontier, pending[nextPending:last]))
+        nextPending = last
+        frontier = uniquePixels(frontier[flatDistance[frontier] == level], seen)
+
+        supported = (flatDistance[frontier[:, np.newaxis] + offsets] == level - 1).any(axis=1)
+        frontier = frontier[~supported]
+        lost.append(frontier)
+        flatDistance[frontier] = -1
+        neighbors = (frontier[:, np.newaxis] + offsets).ravel()
+        frontier = neighbors[flatDistance[neighbors] == level + 1]
+        level += 1
+    return np.concatenate(lost) if lost else closed[:0]
+
+def searchLap(blocked, distance, seeds, seedLevels):
+    """
+    Breadth first search over the open pixels, one ring of neighbors at a time. Every seed joins the search once it
+    reaches the seed's distance, and the search only enters pixels that weren't reached or that it brings closer.
+
+    Args:
+        blocked: Padded boolean array of the pixels the search can't enter, True on the border.
+        distance: Padded integer array of the distance of every pixel reached so far (-1 elsewhere), filled in
+            place. The seeds already hold their distance.
+        seeds: Flattened padded indices of the pixels the search starts from.
+        seedLevels: Integer array of the distance of every seed.
+
+    Returns:
+        Flattened padded indices of every pixel given a distance, some more than once.
+    """
+    flatBlocked = blocked.ravel()
+    flatDistance = distance.ravel()
+    offsets = neighborOffsets((distance.shape[0] - 2, distance.shape[1] - 2))
+    seen = np.zeros(flatDistance.size, dtype=np.int64)
+
+    order = np.argsort(seedLevels, kind="stable")
+    seeds = seeds[order]
+    seedLevels = seedLevels[order]
+    found = [seeds]
+    frontier = seeds[:0]
+    step = 0
+    nextSeed = 0
+    while len(frontier) or nextSeed < len(seeds):
+        if len(frontier) == 0:
+            step = seedLevels[nextSeed]
+        last = np.searchsorted(seedLevels, step, side="right")
+        joining = seeds[nextSeed:last]
+        frontier = np.concatenate((frontier, joining[flatDistance[joining] == step]))
+        nextSeed = last
+
+        neighbors = (frontier[:, np.newaxis] + offsets).ravel()
+        neighborDistance = flatDistance[neighbors]
+        neighbors = neighbors[~flatBlocked[neighbors] & ((neighborDistance < 0) | (neighborDistance > step + 1))]
+        step += 1
+        flatDistance[neighbors] = step
+        frontier = uniquePixels(neighbors, seen)
+        found.append(frontier)
+    return np.concatenate(found)
+
+def progressFromDistance(distance, cut, blocked):
+    """
+    Converts the distances found by searchLap to fractions of the lap.
+
+    Returns:
+        Tuple of the progress field and lap length, as createProgressField returns.
+    """
+    # A lap ends on the open pixels right before the cut
+    end = np.zeros(distance.shape, dtype=bool)
+    end[:-1] = cut[1:] & ~blocked[:-1]
+    reachedEnd = distance[end]
+    reachedEnd = reachedEnd[reachedEnd >= 0]
+    if len(reachedEnd) == 0:
+        return np.full(distance.shape, -1, dtype=np.float32), 0
+    lapLength = int(reachedEnd.max()) + 1
+
+    progressField = np.where(distance >= 0, distance / lapLength, -1).astype(np.float32)
+    progressField[cut] = 0
+    return progressField, lapLength
+
+def lookupProgress(progressField, carX, carY):
+    """
+    Returns:
+        Array of the progress field at the pixel each car is on, or -1 for cars off the screen.
+    """
+    pixelX = carX.astype(np.int64)
+    pixelY = carY.astype(np.int64)
+    onScreen = (carX >= 0) & (pixelX < progressField.shape[0]) & (carY >= 0) & (pixelY < progressField.shape[1])
+    progress = np.full(len(carX), -1, dtype=np.float64)
+    progress[onScreen] = progressField[pixelX[onScreen], pixelY[onScreen]]
+    return progress
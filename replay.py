@@ -0,0 +1,58 @@
+import hashlib
+import neat
+
+def fitnessDigest(population):
+    """
+    Hashes the exact fitness of every genome in a generation. Two runs with the same seed and timestep produce the
+    same digest for every generation, so a single differing bit in any fitness shows up as a different digest.
+
+    Args:
+        population: Dictionary of genome_id to genome.
+
+    Returns:
+        Hex string of the digest.
+    """
+    digest = hashlib.sha256()
+    for genome_id in sorted(population):
+        digest.update(f"{genome_id}:{float(population[genome_id].fitness).hex()};".encode())
+    return digest.hexdigest()
+
+class DigestReporter(neat.reporting.BaseReporter):
+    """
+    Records the fitness digest of every generation to a file, or checks every generation against a file recorded
+    by an earlier run.
+    """
+
+    def __init__(self, recordPath=None, verifyPath=None):
+        """
+        Args:
+            recordPath: File the digests are written to, one "generation digest" line per generation, started over if
+                it exists.
+            verifyPath: File of digests recorded by an earlier run to compare against.
+        """
+        self.generation = 0
+        self.recordPath = recordPath
+        if recordPath is not None:
+            open(recordPath, "w").close()
+        self.recorded = {}
+        if verifyPath is not None:
+            with open(verifyPath) as file:
+                for line in file:
+                    generation, digest = line.split()
+                    self.recorded[int(generation)] = digest
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        digest = fitnessDigest(population)
+        print(f"Generation: {self.generation} Fitness digest: {digest}")
+
+        # Opened for every digest, so each one is on disk even if the run is killed
+        if self.recordPath is not None:
+            with open(self.recordPath, "a") as file:
+                file.write(f"{self.generation} {digest}\n")
+
+        recorded = self.recorded.get(self.generation)
+        if recorded is not None and recorded != digest:
+            raise RuntimeError(f"Generation {self.generation} fitness digest {digest} does not match the recorded {recorded}")
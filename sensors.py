@@ -0,0 +1,230 @@
+import math
+import numpy as np
+
+# Sensor angle offsets from the car's heading and their maximum distances, in the order the networks take them:
+# front, left, right, left 30, right 30, left 45, right 45
+sensorOffsets = np.array([0, math.radians(-90), math.radians(90), math.radians(-30), math.radians(30), math.radians(-45), math.radians(45)])
+sensorRanges = np.array([500, 300, 300, 300, 300, 300, 300])
+
+coarseStep = 10  # Coarse step of the ray march in pixels
+truncationSlack = 2  # Pixels a sample can move by when its position is truncated to the grid
+
+def createDistanceField(wallGrid, maxDistance=512):
+    """
+    Builds a distance field of the track: for every pixel, the chessboard distance to the closest wall or to the edge
+    of the screen, capped at maxDistance. The chessboard distance is never larger than the straight-line distance, so
+    a ray can move that far without ever jumping over a wall.
+    Each pixel binary searches the largest wall free square around it, which is counted in constant time with a summed
+    area table, so the whole field only takes a few passes over the grid.
+
+    Args:
+        wallGrid: Boolean array indexed [x, y] that is True on walls.
+        maxDistance: Largest distance stored in the field.
+
+    Returns:
+        Integer array indexed [x, y] with the distance to the closest wall (0 on walls).
+    """
+    width, height = wallGrid.shape
+    distanceField = np.zeros((width, height), dtype=np.int32)
+    openX, openY = np.nonzero(~wallGrid)
+    distanceField[openX, openY] = wallFreeRadius(paddedWallCount(wallGrid), openX, openY, maxDistance) + 1
+    return distanceField
+
+def updateDistanceField(distanceField, wallGrid, left, top, right, bottom, maxDistance=512):
+    """
+    Updates a distance field in place after the walls inside a rectangle changed. A pixel's distance can only change
+    if the square it was measured with reaches the rectangle, so only the pixels closer to the rectangle than the
+    largest distance in the field, plus one, are measured again.
+
+    Args:
+        distanceField: Field from createDistanceField, built before the walls changed.
+        wallGrid: Boolean array indexed [x, y] that is True on walls, after the change.
+        left, top, right, bottom: Rectangle of the pixels that changed, right and bottom exclusive.
+        maxDistance: Largest distance stored in the field.
+    """
+    width, height = wallGrid.shape
+    reach = int(distanceField.max()) + 1
+    left = max(left - reach, 0)
+    top = max(top - reach, 0)
+    right = min(right + reach, width)
+    bottom = min(bottom + reach, height)
+
+    region = wallGrid[left:right, top:bottom]
+    openX, openY = np.nonzero(~region)
+    distanceField[left:right, top:bottom] = 0
+
+    # The squares are counted in a window around the region, whose sides count as walls. A square that reaches a
+    # side that isn't the edge of the screen might have been cut short, so those pixels are counted on the whole grid.
+    windowLeft = max(left - reach, 0)
+    windowTop = max(top - reach, 0)
+    windowRight = min(right + reach, width)
+    windowBottom = min(bottom + reach, height)
+    windowX = openX + left - windowLeft
+    windowY = openY + top - windowTop
+    radius = wallFreeRadius(paddedWallCount(wallGrid[windowLeft:windowRight, windowTop:windowBottom]), windowX, windowY, maxDistance)
+    cutShort = (
+        ((windowLeft > 0) & (windowX - radius <= 0)) |
+        ((windowTop > 0) & (windowY - radius <= 0)) |
+        ((windowRight < width) & (windowX + radius >= windowRight - windowLeft - 1)) |
+        ((windowBottom < height) & (windowY + radius >= windowBottom - windowTop - 1))
+    )
+    openX += left
+    openY += top
+    if cutShort.any():
+        radius[cutShort] = wallFreeRadius(paddedWallCount(wallGrid), openX[cutShort], openY[cutShort], maxDistance)
+    distanceField[openX, openY] = radius + 1
+
+def paddedWallCount(wallGrid):
+    """
+    Returns:
+        Summed area table of the wall grid surrounded by a border of walls, so the edge of the screen counts as one.
+    """
+    width, height = wallGrid.shape
+    paddedWalls = np.ones((width + 2, height + 2), dtype=np.int32)
+    paddedWalls[1:-1, 1:-1] = wallGrid
+    wallCount = np.zeros((width + 3, height + 3), dtype=np.int32)
+    wallCount[1:, 1:] = paddedWalls.cumsum(axis=0).cumsum(axis=1)
+    return wallCount
+
+def wallFreeRadius(wallCount, openX, openY, maxDistance):
+    """
+    Binary searches the largest wall free square radius around open pixels.
+
+    Args:
+        wallCount: Summed area table from paddedWallCount.
+        openX, openY: Integer arrays of the open pixels.
+        maxDistance: Largest distance stored in the field.
+
+    Returns:
+        Integer array of the largest radius around each pixel that holds no walls.
+    """
+    width = wallCount.shape[0] - 3
+    height = wallCount.shape[1] - 3
+    openX = openX + 1
+    openY = openY + 1
+
+    low = np.zeros(len(openX), dtype=np.int32)
+    high = np.full(len(openX), maxDistance - 1, dtype=np.int32)
+    while np.any(low < high):
+        radius = (low + high + 1) // 2
+        left = np.maximum(openX - radius, 0)
+        right = np.minimum(openX + radius, width + 1) + 1
+        top = np.maximum(openY - radius, 0)
+        bottom = np.minimum(openY + radius, height + 1) + 1
+        walls = wallCount[right, bottom] - wallCount[left, bottom] - wallCount[right, top] + wallCount[left, top]
+        empty = walls == 0
+        low = np.where(empty, radius, low)
+        high = np.where(empty, high, radius - 1)
+    return low
+
+def wallHits(wallGrid, startX, startY, directionX, directionY, distances):
+    """
+    Samples the wall grid along rays, truncating the sample positions the same way Car.castLine does.
+
+    Args:
+        wallGrid: Boolean array indexed [x, y] that is True on walls.
+        startX, startY: Ray origins, shape (R, 1).
+        directionX, directionY: Ray directions, shape (R, 1).
+        distances: Distances to sample along each ray, shape (R, K) or (K,).
+
+    Returns:
+        Boolean array of shape (R, K) that is True where a sample is on a wall or off the track.
+    """
+    width, height = wallGrid.shape
+    currentX = np.trunc(startX + directionX * distances).astype(np.int64)
+    currentY = np.trunc(startY + directionY * distances).astype(np.int64)
+
+    inBounds = (currentX >= 0) & (currentX < width) & (currentY >= 0) & (currentY < height)
+    hits = ~inBounds
+    hits[inBounds] = wallGrid[currentX[inBounds], currentY[inBounds]]
+    return hits
+
+def marchRays(wallGrid, distanceField, startX, startY, directionX, directionY, maxDistance):
+    """
+    Finds the first multiple of the coarse step that lands on a wall along each ray, like the coarse pass of
+    Car.castLine, but sphere traces the distance field to skip every step that is guaranteed to be clear of walls.
+
+    Args:
+        wallGrid: Boolean array indexed [x, y] that is True on walls.
+        distanceField: Distance field built by createDistanceField.
+        startX, startY: Ray origins, shape (R,).
+        directionX, directionY: Ray directions, shape (R,).
+        maxDistance: Maximum distance of each ray, shape (R,).
+
+    Returns:
+        Array of shape (R,) with the first coarse distance that hits, or the max distance if none does.
+    """
+    width, height = wallGrid.shape
+    result = maxDistance.copy()
+    distance = np.zeros(len(maxDistance), dtype=np.int64)
+
+    # How far a ray moves in chessboard distance for every pixel it travels
+    stretch = np.maximum(np.abs(directionX), np.abs(directionY))
+
+    active = np.arange(len(maxDistance))
+    while active.size:
+        currentDistance = distance[active]
+        currentX = np.trunc(startX[active] + directionX[active] * currentDistance).astype(np.int64)
+        currentY = np.trunc(startY[active] + directionY[active] * currentDistance).astype(np.int64)
+
+        inBounds = (currentX >= 0) & (currentX < width) & (currentY >= 0) & (currentY < height)
+        clearance = np.zeros(len(active), dtype=np.int64)
+        clearance[inBounds] = distanceField[currentX[inBounds], currentY[inBounds]]
+        hits = clearance == 0
+        result[active[hits]] = currentDistance[hits]
+
+        # Every step closer than the clearance (less the truncation slack) can't be on a wall
+        safeSteps = np.floor((clearance - truncationSlack) / stretch[active] / coarseStep).astype(np.int64)
+        nextDistance = currentDistance + coarseStep * np.maximum(safeSteps + 1, 1)
+        distance[active] = nextDistance
+        active = active[~hits & (nextDistance < maxDistance[active])]
+
+    return result
+
+def castRays(wallGrid, carX, carY, carAngle, distanceField=None):
+    """
+    Casts every sensor of every car at once. This is a batched version of Car.castLine: the rays are marched in
+    steps of 10 pixels until one lands on a wall, then the 10 pixels before it are checked one by one, so the
+    distances are identical to the ones returned by Car.castLines.
+    When a distance field is given, the coarse pass skips straight past the steps the field shows are clear of walls.
+
+    Args:
+        wallGrid: Boolean array indexed [x, y] that is True on walls.
+        carX: Array of the cars' x-coordinates, shape (N,).
+        carY: Array of the cars' y-coordinates, shape (N,).
+        carAngle: Array of the cars' headings in radians, shape (N,).
+        distanceField: Optional distance field built by createDistanceField to speed up the coarse pass.
+
+    Returns:
+        Array of shape (N, 7) with the distances measured by each sensor, in the order of sensorOffsets.
+    """
+    carX = np.asarray(carX, dtype=np.float64)
+    carY = np.asarray(carY, dtype=np.float64)
+    carAngle = np.asarray(carAngle, dtype=np.float64)
+    numCars = carX.shape[0]
+
+    # One row per ray
+    adjustedAngle = (carAngle[:, None] + sensorOffsets[None, :]).ravel()
+    directionX = np.cos(adjustedAngle)[:, None]
+    directionY = np.sin(adjustedAngle)[:, None]
+    startX = np.repeat(carX, len(sensorOffsets))[:, None]
+    startY = np.repeat(carY, len(sensorOffsets))[:, None]
+    maxDistance = np.tile(sensorRanges, numCars)
+
+    # Coarse pass: the first multiple of the step that hits, or the max distance if none does
+    if distanceField is not None:
+        distance = marchRays(wallGrid, distanceField, startX[:, 0], startY[:, 0], directionX[:, 0], directionY[:, 0], maxDistance)
+    else:
+        coarseDistances = np.arange(0, sensorRanges.max(), coarseStep)
+        coarseHits = wallHits(wallGrid, startX, startY, directionX, directionY, coarseDistances)
+        coarseHits &= coarseDistances[None, :] < maxDistance[:, None]
+        coarseFound = coarseHits.any(axis=1)
+        distance = np.where(coarseFound, coarseHits.argmax(axis=1) * coarseStep, maxDistance)
+
+    # Refine the edge detection by checking the last few pixels
+    refineDistances = np.maximum(distance[:, None] - coarseStep + np.arange(coarseStep)[None, :], 0)
+    refineHits = wallHits(wallGrid, startX, startY, directionX, directionY, refineDistances)
+    refineFound = refineHits.any(axis=1)
+    distance = np.where(refineFound, refineDistances[np.arange(len(distance)), refineHits.argmax(axis=1)], distance)
+
+    return distance.reshape(numCars, len(sensorOffsets))
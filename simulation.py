@@ -0,0 +1,428 @@
+import copy
+import numpy as np
+from car import Car
+from fleet import CarFleet
+from sensors import castRays
+from batchNetwork import BatchNetwork
+from collision import getFootprints, checkFleetCollisions
+from progress import lookupProgress
+
+# What saveCar keeps of a car besides its row of the fleet
+trackingArrays = ("distance", "progress", "lastProgress", "wrongWay", "stallProgress", "stallX", "stallY", "stallTime")
+carStateAttributes = ("crashed", "crashTime", "hitFinishLine", "leftFinishLine", "lapStart", "totalLaps", "finished", "finishTime")
+
+def checkCollisionWithWhitePixels(car, track):
+    """
+    Checks if the car has collided with white pixels (off-track areas).
+    Simulation.step checks every car at once with collision.checkFleetCollisions, which gives the same result.
+
+    Args:
+        car: The car object.
+        track: The track being driven.
+    """
+    carX, carY = car.carX, car.carY
+    rotatedCarImage, carMask = car.rotatedCar()
+    rotatedCarRect = rotatedCarImage.get_rect(center=(carX, carY))
+    offsetX = rotatedCarRect.left
+    offsetY = rotatedCarRect.top
+    overlap = track.outOfBoundsMask.overlap(carMask, (offsetX, offsetY))
+
+    if overlap or carX > track.width or carX < 0 or carY > track.height or carY < 0:
+        car.crashed = True
+
+def checkCollisionWithFinishLine(car, track):
+    """
+    Checks if the car has crossed the finish line.
+
+    Args:
+        car: The car object.
+        track: The track being driven.
+
+    Returns:
+        Boolean indicating if the car has hit the finish line.
+    """
+    rotatedCarImage, carMask = car.rotatedCar()
+    rotatedCarRect = rotatedCarImage.get_rect(center=(car.carX, car.carY))
+    offsetX = rotatedCarRect.left
+    offsetY = rotatedCarRect.top
+    overlap = track.finishLineMask.overlap(carMask, (offsetX, offsetY))
+    if overlap:
+        car.hitFinishLine = True
+    else:
+        car.hitFinishLine = False
+    return car.hitFinishLine
+
+def fitness(genome, car, dt):
+    """
+    Calculates and updates the fitness of a genome based on the car's performance.
+    From extensive testing, this simple fitness function seems to promote the fastest lap times because the main contributing factor are its lap times themselves.
+    However, the velocity bonus is needed so the cars are promoted to completed their first lap fast or else the ones that complete the first lap will go slowly and then
+    they will breed only slow cars giving an endless cycle. The other is a simple survival bonus needed because withtout it, the cars run into a wall endlessly or until one luckily
+    turns the corner.
+
+    Args:
+        genome: The genome being evaluated.
+        car: The car object.
+        dt: Delta time since last frame.
+    """
+
+    genome.fitness += car.velocity * dt * 0.01
+    genome.fitness += 10
+
+    if car.completedLap:
+        genome.fitness += 10000 / car.totalLaps[-1]
+        car.completedLap = False
+
+class EvaluationPolicy:
+    """
+    Rules for taking cars off the track, or ending a generation, before the time limit. A car that is stopped while
+    still driving is credited what fitness() would most likely have given it by the time limit, so its fitness stays
+    comparable with a full evaluation. A car that stalls earns nothing more, as if it had crashed.
+    """
+
+    def __init__(self, lapsToFinish=None, stallSeconds=None, stallDistance=100, finishersToEnd=None):
+        """
+        Args:
+            lapsToFinish: Laps after which a car is finished and stops driving, or None to keep driving.
+            stallSeconds: Seconds a car has to drive stallDistance pixels around the lap in before it is stopped, or
+                None to never stop it. Cars circling in place or driving the wrong way stall.
+            stallDistance: Pixels a car has to drive around the lap every stallSeconds.
+            finishersToEnd: Finished cars after which the generation ends, or None to wait for the time limit.
+        """
+        self.lapsToFinish = lapsToFinish
+        self.stallSeconds = stallSeconds
+        self.stallDistance = stallDistance
+        self.finishersToEnd = finishersToEnd
+
+class Simulation:
+    """
+    Simulates a team of cars on a track. Time is counted in simulated seconds, so the results only depend on the
+    timesteps passed to step() and not on how fast the machine renders frames.
+    """
+
+    def __init__(self, genomes, config, track, carImage, multipliers, timer=None, integrator="euler", policy=None, states=None):
+        """
+        Creates a car and a network for every genome.
+
+        Args:
+            genomes: List of (genome_id, genome) pairs to evaluate.
+            config: NEAT configuration.
+            track: The track being driven.
+            carImage: Pygame surface used for every car.
+            multipliers: (acceleration, deceleration, downforce, max speed) multipliers applied to every car.
+            timer: Optional StageTimer that every step marks the time of each stage in. The caller starts the timer
+                and ends its frames, so the time it spends around the steps is counted too.
+            integrator: Name of the fleet integrator that moves the cars, "arc" stays accurate at larger timesteps.
+            policy: Optional EvaluationPolicy for stopping cars and the generation early.
+            states: Optional list with a state from saveCar, or None to start at the start line, for every genome. A
+                saved car that was still driving waits and joins the others when the simulation reaches the step it
+                was saved at.
+        """
+        self.track = track
+        self.timer = timer
+        self.policy = policy
+        self.time = 0  # Simulated seconds since the start of the generation
+        self.steps = 0
+        self.ended = False  # Set once enough cars have finished for the policy to end the generation
+        self.finishers = 0
+        self.cars = []
+        self.waiting = {}  # Row -> (time, steps) of every restored car that joins once the simulation reaches its step
+        self.network = BatchNetwork(genomes, config)
+        self.fleet = CarFleet(len(genomes), track.startX, track.startY, integrator)
+        self.distance = np.zeros(len(genomes))  # Pixels each car has driven
+        self.progress = np.zeros(len(genomes))  # Laps each car has driven around the track, counting part laps
+        self.lastProgress = lookupProgress(track.progressField, self.fleet.carX, self.fleet.carY)  # Progress field under each car
+        self.wrongWay = np.zeros(len(genomes), dtype=bool)  # Cars that went backwards around the lap in their last step
+        self.stallProgress = np.zeros(len(genomes))  # Progress of each car when its stall check last started
+        self.stallX = self.fleet.carX.copy()  # Where each car was then, for tracks without a lap
+        self.stallY = self.fleet.carY.copy()
+        self.stallTime = np.zeros(len(genomes))
+        self.footprints = getFootprints(carImage)  # The color variants of a car share its shape, so collisions use this one
+
+        for row, (genome_id, genome) in enumerate(genomes):
+            genome.fitness = 0
+            car = Car(track.startX, track.startY, carImage, self.fleet, row)
+            car.genomeID = genome_id
+            car.lapStart = self.time
+            self.cars.append((car, genome))
+
+        accelerationMult, decelerationMult, downforceMult, maxSpeedMult = multipliers
+        self.fleet.acceleration *= accelerationMult
+        self.fleet.deceleration *= decelerationMult
+        self.fleet.downforceNewtons *= downforceMult
+        self.fleet.maxVelocity *= maxSpeedMult
+
+        for row, state in enumerate(states or []):
+            if state is not None:
+                self.restoreCar(row, state)
+
+    def saveCar(self, row):
+        """
+        Saves everything about a car that changes how it drives from here on, so restoreCar can carry on driving it
+        in another simulation and end up exactly where it would have if it had never stopped.
+
+        Args:
+            row: The car's row.
+
+        Returns:
+            Dictionary of the car's state, its genome's fitness and the simulated time and steps it was saved at.
+        """
+        car, genome = self.cars[row]
+        time, steps = self.waiting.get(row, (self.time, self.steps))
+        return {
+            "time": time,
+            "steps": steps,
+            "fitness": genome.fitness,
+            "fleet": {name: values.item(row) for name, values in vars(self.fleet).items() if isinstance(values, np.ndarray)},
+            "tracking": {name: getattr(self, name).item(row) for name in trackingArrays},
+            "car": {name: copy.copy(getattr(car, name)) for name in carStateAttributes}
+        }
+
+    def restoreCar(self, row, state):
+        """
+        Puts a car back in the state saveCar saved. A car that is still driving waits until the simulation reaches
+        the step it was saved at, so it must be restored before the first step.
+
+        Args:
+            row: The car's row.
+            state: Dictionary returned by saveCar.
+        """
+        car, genome = self.cars[row]
+        genome.fitness = state["fitness"]
+        for name, value in state["fleet"].items():
+            getattr(self.fleet, name)[row] = value
+        for name, value in state["tracking"].items():
+            getattr(self, name)[row] = value
+        for name, value in state["car"].items():
+            setattr(car, name, copy.copy(value))
+        if not car.crashed and not car.finished:
+            self.waiting[row] = (state["time"], state["steps"])
+
+    def alive(self):
+        """
+        Returns:
+            Number of cars that have not crashed or finished, not counting restored cars waiting to join.
+        """
+        return sum(not car.crashed and not car.finished for car, _ in self.cars) - len(self.waiting)
+
+    def running(self, timeLimit):
+        """
+        Args:
+            timeLimit: Simulated seconds before the generation is stopped.
+
+        Returns:
+            Boolean indicating if any car is still driving and the generation hasn't ended.
+        """
+        waitingToDrive = any(time < timeLimit for time, _ in self.waiting.values())
+        return not self.ended and self.time < timeLimit and (self.alive() > 0 or waitingToDrive)
+
+    def finish(self, timeLimit, dt=None):
+        """
+        Credits the cars that the policy stopped before the time limit without crashing with the survival, velocity
+        and lap bonuses they would have earned until it at their own pace. Called once after the last step.
+
+        Args:
+            timeLimit: Simulated seconds the generation would have lasted.
+            dt: Simulated time step in seconds if every step was the same, so each car's credit doesn't depend on
+                how long the others drove, or None to use the mean step.
+        """
+        if self.policy is None or (dt is None and self.steps == 0):
+            return
+        stepTime = dt if dt is not None else self.time / self.steps
+        for row, (car, genome) in enumerate(self.cars):
+            if car.crashed or row in self.waiting:  # Restored cars still waiting were saved after the time limit
+                continue
+            stopTime = car.finishTime if car.finished else self.time
+            remaining = timeLimit - stopTime
+            if remaining <= 0:
+                continue
+            genome.fitness += 10 * remaining / stepTime
+            genome.fitness += self.distance[row] / stopTime * remaining * 0.01
+            if car.totalLaps:
+                lapTime = car.totalLaps[-1]
+                genome.fitness += remaining / lapTime * 10000 / lapTime
+
+    def step(self, dt):
+        """
+        Advances every car that has not crashed by dt simulated seconds.
+
+        Args:
+            dt: Simulated time step in seconds.
+
+        Returns:
+            List of (car, genome, lapTime) for every lap completed during this step.
+        """
+        if self.waiting:
+            self.joinWaitingCars()
+        stepStart = self.time
+        self.time += dt
+        completedLaps = []
+
+        liveIndices = np.array([idx for idx, (car, _) in enumerate(self.cars) if not car.crashed and not car.finished and idx not in self.waiting], dtype=np.int64)
+        if len(liveIndices) == 0 or self.ended:
+            return completedLaps
+        self.steps += 1
+        fleet = self.fleet
+        timer = self.timer
+
+        # Cast the sensors of every live car in one pass
+        distances = castRays(
+            self.track.wallGrid,
+            fleet.carX[liveIndices],
+            fleet.carY[liveIndices],
+            fleet.carAngle[liveIndices],
+            self.track.distanceField
+        )
+        if timer is not None:
+            timer.mark("sensors")
+
+        # Activate every live car's network in one pass
+        inputs = np.column_stack((
+            distances,
+            fleet.velocity[liveIndices],
+            fleet.maxWheelAngle[liveIndices],
+            fleet.currentWheelAngle[liveIndices]
+        ))
+        outputs = self.network.activate(inputs, liveIndices)
+        if timer is not None:
+            timer.mark("network")
+
+        # Initial acceleration and steering limitations
+        if self.time < 2:
+            fleet.throttlePosition[liveIndices] = 0.55
+            fleet.currentWheelAngle[liveIndices] = (outputs[:, 1] * 2 - 1) * fleet.maxWheelAngle[liveIndices] * 0.2
+        else:
+            fleet.throttlePosition[liveIndices] = outputs[:, 0]
+            fleet.currentWheelAngle[liveIndices] = (outputs[:, 1] * 2 - 1) * fleet.maxWheelAngle[liveIndices]
+
+        # Update every live car in one pass
+        previousX = fleet.carX[liveIndices]
+        previousY = fleet.carY[liveIndices]
+        previousAngle = fleet.carAngle[liveIndices]
+        fleet.advance(dt, liveIndices)
+        self.distance[liveIndices] += fleet.velocity[liveIndices] * dt
+        if timer is not None:
+            timer.mark("physics")
+
+        # Check every live car for collisions, including on the way from its last pose, and finish line contact in one pass
+        carAngle = fleet.carAngle[liveIndices]
+        crashed, hitFinishLine = checkFleetCollisions(
+            self.track,
+            self.footprints,
+            fleet.carX[liveIndices],
+            fleet.carY[liveIndices],
+            carAngle,
+            previousX,
+            previousY,
+            previousAngle
+        )
+        facingForward = np.cos(carAngle) > 0
+        self.updateProgress(liveIndices)
+        stalled = self.checkStalls(liveIndices)
+        if timer is not None:
+            timer.mark("collision")
+
+        liveCars = [self.cars[idx] for idx in liveIndices.tolist()]
+        for (car, genome), carDistances, carCrashed, carFacingForward, carHitFinishLine in zip(liveCars, distances.tolist(), (crashed | stalled).tolist(), facingForward.tolist(), hitFinishLine.tolist()):
+            car.frontCast, car.leftCast, car.rightCast, car.left30AngleCast, car.right30AngleCast, car.left45AngleCast, car.right45AngleCast = carDistances
+            if carCrashed:
+                car.crashed = True
+                car.crashTime = stepStart
+
+            # Check for finish line crossing, the finish line is only checked while the car faces forward
+            if carFacingForward:
+                car.hitFinishLine = carHitFinishLine
+            if carFacingForward and carHitFinishLine and car.leftFinishLine and self.time - car.lapStart >= 2:
+                lapTime = self.time - car.lapStart
+                car.totalLaps.append(lapTime)
+                car.lapStart = self.time
+                car.leftFinishLine = False
+                car.completedLap = True  # Set the flag
+                completedLaps.append((car, genome, lapTime))
+                if self.policy is not None and self.policy.lapsToFinish is not None and len(car.totalLaps) >= self.policy.lapsToFinish:
+                    car.finished = True
+                    car.finishTime = self.time
+                    self.finishers += 1
+
+            if not car.hitFinishLine and not car.leftFinishLine:
+                car.leftFinishLine = True
+
+            # Calculate fitness
+            fitness(genome, car, dt)
+        if timer is not None:
+            timer.mark("finishLine")
+
+        if self.policy is not None and self.policy.finishersToEnd is not None and self.finishers >= self.policy.finishersToEnd:
+            self.ended = True
+        return completedLaps
+
+    def joinWaitingCars(self):
+        """
+        Lets the restored cars that were saved at the current step drive. If no other car is driving, the simulation
+        skips ahead to the earliest step a waiting car was saved at, which lands on exactly the same time as
+        stepping there would have.
+        """
+        if self.alive() == 0:
+            self.time, self.steps = min(self.waiting.values(), key=lambda saved: saved[1])
+        for row, (_, steps) in list(self.waiting.items()):
+            if steps == self.steps:
+                del self.waiting[row]
+
+    def updateProgress(self, liveIndices):
+        """
+        Adds how far around the lap each car drove this step to its progress, with one lookup in the track's
+        progress field per car. A step across the finish line wraps from the end of the lap to the start, so the
+        change is taken as the shortest way around. Cars on a pixel the field doesn't cover keep their progress.
+
+        Args:
+            liveIndices: Indices of the cars driving this step.
+        """
+        progress = lookupProgress(self.track.progressField, self.fleet.carX[liveIndices], self.fleet.carY[liveIndices])
+        lastProgress = self.lastProgress[liveIndices]
+        change = np.where((progress >= 0) & (lastProgress >= 0), progress - lastProgress, 0)
+        change -= np.round(change)
+        self.progress[liveIndices] += change
+        self.wrongWay[liveIndices] = change < 0
+        self.lastProgress[liveIndices] = np.where(progress >= 0, progress, lastProgress)
+
+    def leaderboard(self, count):
+        """
+        Args:
+            count: Number of cars to rank.
+
+        Returns:
+            List of (car, genome, progress, wrongWay) for the cars that have driven farthest around the track,
+            farthest first, where progress counts laps and part laps.
+        """
+        order = np.argsort(-self.progress, kind="stable")[:count]
+        return [(*self.cars[row], self.progress[row], self.wrongWay[row]) for row in order.tolist()]
+
+    def checkStalls(self, liveIndices):
+        """
+        Finds the cars that haven't driven the policy's stall distance around the lap since their stall check started.
+        Each car is checked every stallSeconds, and a car that passes starts its next check where it is. On a track
+        without a lap the distance is measured in a straight line instead.
+
+        Args:
+            liveIndices: Indices of the cars driving this step.
+
+        Returns:
+            Boolean array that is True for every live car that stalled.
+        """
+        stalled = np.zeros(len(liveIndices), dtype=bool)
+        if self.policy is None or self.policy.stallSeconds is None:
+            return stalled
+        due = self.time - self.stallTime[liveIndices] >= self.policy.stallSeconds
+        rows = liveIndices[due]
+        if self.track.lapLength > 0:
+            progress = self.progress[rows]
+            stalled[due] = (progress - self.stallProgress[rows]) * self.track.lapLength < self.policy.stallDistance
+            self.stallProgress[rows] = progress
+        else:
+            carX = self.fleet.carX[rows]
+            carY = self.fleet.carY[rows]
+            stalled[due] = np.hypot(carX - self.stallX[rows], carY - self.stallY[rows]) < self.policy.stallDistance
+            self.stallX[rows] = carX
+            self.stallY[rows] = carY
+        self.stallTime[rows] = self.time
+        return stalled
@@ -0,0 +1,360 @@
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import gzip
+import pickle
+import random
+import queue
+import threading
+from itertools import count
+import numpy as np
+import neat
+
+# Snapshot files start with this, then one record per snapshot: the length of the compressed record and the record
+snapshotFileMagic = b"RLSNAP\x01"
+
+# Arrays of every record, in the order they are stored
+recordArrays = {
+    "genomeKeys": np.int64,  # Genomes first stored in this record
+    "nodeCounts": np.int32,
+    "connectionCounts": np.int32,
+    "nodeKeys": np.int64,
+    "nodeBias": np.float64,
+    "nodeResponse": np.float64,
+    "nodeActivation": np.uint8,  # Index into the record's activations
+    "nodeAggregation": np.uint8,  # Index into the record's aggregations
+    "connectionInput": np.int64,
+    "connectionOutput": np.int64,
+    "connectionWeight": np.float64,
+    "connectionEnabled": np.bool_,
+    "populationKeys": np.int64,  # Every genome in the population, stored in this record or an earlier one
+    "populationFitness": np.float64,  # NaN for genomes that haven't been evaluated
+    "randomState": np.uint32  # Internal state of the random module
+}
+
+class SnapshotWriter(neat.reporting.BaseReporter):
+    """
+    Appends a snapshot of the population to a file every few generations. Genomes never change once they are bred,
+    so a snapshot only stores the genomes that aren't in an earlier snapshot of the file, as flat arrays of their
+    node and connection genes. The loop only takes the population's keys, species and random state. The genomes are
+    encoded, compressed and written by a background thread while the next generation is simulated.
+    """
+
+    def __init__(self, path, frequency=1, fastestGenome=None):
+        """
+        Args:
+            path: File the snapshots are appended to, started over if it exists.
+            frequency: Generations between snapshots.
+            fastestGenome: Optional function returning the genome that set the best lap, stored with its fitness
+                in every snapshot so it can be replayed and keep earning fitness.
+        """
+        self.path = path
+        self.frequency = frequency
+        self.fastestGenome = fastestGenome
+        self.generation = 0
+        self.written = set()  # Keys of every genome stored in the file
+        self.recordSizes = []
+        self.captureSeconds = 0
+        self.writeSeconds = 0
+
+        with open(path, "wb") as file:
+            file.write(snapshotFileMagic)
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.writeSnapshots, daemon=True)
+        self.thread.start()
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def end_generation(self, config, population, species_set):
+        if (self.generation + 1) % self.frequency != 0:
+            return
+        start = time.perf_counter()
+
+        fastest = self.fastestGenome() if self.fastestGenome is not None else None
+        genomes = [genome for genome in population.values() if genome.key not in self.written]
+        if fastest is not None and fastest.key not in self.written and fastest.key not in population:
+            genomes.append(fastest)
+        self.written.update(genome.key for genome in genomes)
+
+        # Peeking at the species indexer uses up its next id, so it is started again from that id
+        nextSpeciesId = next(species_set.indexer)
+        species_set.indexer = count(nextSpeciesId)
+        metadata = {
+            "generation": self.generation + 1,  # The population has been bred for the next generation
+            "fastestGenome": fastest.key if fastest is not None else None,
+            "fastestFitness": fastest.fitness if fastest is not None else None,  # Kept for when it has left the population
+            "nextSpeciesId": nextSpeciesId,
+            "species": [
+                {
+                    "key": species.key,
+                    "created": species.created,
+                    "lastImproved": species.last_improved,
+                    "fitness": species.fitness,
+                    "adjustedFitness": species.adjusted_fitness,
+                    "fitnessHistory": species.fitness_history,
+                    "representative": species.representative.key,
+                    "members": sorted(species.members)
+                }
+                for species in species_set.species.values()
+            ],
+        }
+        version, randomState, gauss = random.getstate()
+        metadata["randomVersion"] = version
+        metadata["randomGauss"] = gauss
+        populationKeys = np.array(sorted(population), dtype=np.int64)
+        populationFitness = np.array([np.nan if population[key].fitness is None else population[key].fitness for key in populationKeys.tolist()], dtype=np.float64)
+        self.queue.put((metadata, genomes, populationKeys, populationFitness, randomState))
+        self.captureSeconds += time.perf_counter() - start
+
+    def writeSnapshots(self):
+        """
+        Encodes and appends every snapshot put on the queue, until it gets None.
+        """
+        while True:
+            snapshot = self.queue.get()
+            if snapshot is None:
+                return
+            start = time.perf_counter()
+            record = zlib.compress(encodeRecord(*snapshot), 6)
+            with open(self.path, "ab") as file:
+                file.write(len(record).to_bytes(8, "little"))
+                file.write(record)
+            self.recordSizes.append(8 + len(record))
+            self.writeSeconds += time.perf_counter() - start
+
+    def close(self):
+        """
+        Waits for the snapshots still being written and stops the background thread.
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+def encodeRecord(metadata, genomes, populationKeys, populationFitness, randomState):
+    """
+    Lays a snapshot out as a JSON header followed by the raw bytes of every array in recordArrays.
+
+    Args:
+        metadata: Dictionary of the snapshot's generation, species and random state.
+        genomes: List of the genomes first stored in this snapshot.
+        populationKeys: Integer array of the key of every genome in the population.
+        populationFitness: Float array of the fitness of every genome in the population.
+        randomState: Tuple of the integers in the random module's state.
+
+    Returns:
+        Bytes of the record before compression.
+    """
+    activations = sorted({node.activation for genome in genomes for node in genome.nodes.values()})
+    aggregations = sorted({node.aggregation for genome in genomes for node in genome.nodes.values()})
+    activationIndex = {name: idx for idx, name in enumerate(activations)}
+    aggregationIndex = {name: idx for idx, name in enumerate(aggregations)}
+
+    nodes = [node for genome in genomes for node in genome.nodes.values()]
+    connections = [connection for genome in genomes for connection in genome.connections.values()]
+    arrays = {
+        "genomeKeys": [genome.key for genome in genomes],
+        "nodeCounts": [len(genome.nodes) for genome in genomes],
+        "connectionCounts": [len(genome.connections) for genome in genomes],
+        "nodeKeys": [node.key for node in nodes],
+        "nodeBias": [node.bias for node in nodes],
+        "nodeResponse": [node.response for node in nodes],
+        "nodeActivation": [activationIndex[node.activation] for node in nodes],
+        "nodeAggregation": [aggregationIndex[node.aggregation] for node in nodes],
+        "connectionInput": [connection.key[0] for connection in connections],
+        "connectionOutput": [connection.key[1] for connection in connections],
+        "connectionWeight": [connection.weight for connection in connections],
+        "connectionEnabled": [connection.enabled for connection in connections],
+        "populationKeys": populationKeys,
+        "populationFitness": populationFitness,
+        "randomState": randomState
+    }
+    header = dict(metadata, activations=activations, aggregations=aggregations, counts={name: len(values) for name, values in arrays.items()})
+    headerBytes = json.dumps(header).encode()
+
+    record = io.BytesIO()
+    record.write(len(headerBytes).to_bytes(4, "little"))
+    record.write(headerBytes)
+    for name, dtype in recordArrays.items():
+        record.write(np.asarray(arrays[name], dtype=dtype).tobytes())
+    return record.getvalue()
+
+def readRecords(path):
+    """
+    Reads every complete snapshot of a file. A record cut short by a crash while it was written is ignored.
+
+    Args:
+        path: Path of the snapshot file.
+
+    Yields:
+        Tuple of the record's header and a dictionary of its arrays.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(snapshotFileMagic)) != snapshotFileMagic:
+            raise ValueError(f"{path} is not a snapshot file")
+        while True:
+            length = file.read(8)
+            if len(length) < 8:
+                return
+            compressed = file.read(int.from_bytes(length, "little"))
+            try:
+                record = zlib.decompress(compressed)
+            except zlib.error:
+                return
+
+            headerLength = int.from_bytes(record[:4], "little")
+            header = json.loads(record[4:4 + headerLength])
+            offset = 4 + headerLength
+            arrays = {}
+            for name, dtype in recordArrays.items():
+                size = header["counts"][name] * np.dtype(dtype).itemsize
+                arrays[name] = np.frombuffer(record, dtype=dtype, count=header["counts"][name], offset=offset)
+                offset += size
+            yield header, arrays
+
+def decodeGenomes(header, arrays, keys, genomeConfig, genomeType):
+    """
+    Builds the genomes of a record that are in keys.
+
+    Args:
+        header: Header of the record.
+        arrays: Arrays of the record.
+        keys: Set of the keys of the genomes to build.
+        genomeConfig: NEAT genome configuration.
+        genomeType: Genome class, like neat.DefaultGenome.
+
+    Returns:
+        Dictionary of key -> genome.
+    """
+    genomes = {}
+    nodeStarts = np.concatenate(([0], np.cumsum(arrays["nodeCounts"]))).tolist()
+    connectionStarts = np.concatenate(([0], np.cumsum(arrays["connectionCounts"]))).tolist()
+    nodeKeys = arrays["nodeKeys"].tolist()
+    nodeBias = arrays["nodeBias"].tolist()
+    nodeResponse = arrays["nodeResponse"].tolist()
+    nodeActivation = arrays["nodeActivation"].tolist()
+    nodeAggregation = arrays["nodeAggregation"].tolist()
+    connectionInput = arrays["connectionInput"].tolist()
+    connectionOutput = arrays["connectionOutput"].tolist()
+    connectionWeight = arrays["connectionWeight"].tolist()
+    connectionEnabled = arrays["connectionEnabled"].tolist()
+    for idx, key in enumerate(arrays["genomeKeys"].tolist()):
+        if key not in keys:
+            continue
+        genome = genomeType(key)
+        for node in range(nodeStarts[idx], nodeStarts[idx + 1]):
+            gene = genomeConfig.node_gene_type(nodeKeys[node])
+            gene.bias = nodeBias[node]
+            gene.response = nodeResponse[node]
+            gene.activation = header["activations"][nodeActivation[node]]
+            gene.aggregation = header["aggregations"][nodeAggregation[node]]
+            genome.nodes[gene.key] = gene
+        for connection in range(connectionStarts[idx], connectionStarts[idx + 1]):
+            gene = genomeConfig.connection_gene_type((connectionInput[connection], connectionOutput[connection]))
+            gene.weight = connectionWeight[connection]
+            gene.enabled = connectionEnabled[connection]
+            genome.connections[gene.key] = gene
+        genomes[key] = genome
+    return genomes
+
+def loadSnapshot(path, config, generation=None):
+    """
+    Restores a population from a snapshot file, like neat.Checkpointer.restore_checkpoint. Only the genomes of the
+    chosen snapshot are built, from whichever record first stored them. The random state is restored and the genome,
+    node and species indexers continue after the largest ids in the file.
+
+    Args:
+        path: Path of the snapshot file.
+        config: NEAT configuration the population continues with.
+        generation: Generation to restore, or None for the last snapshot.
+
+    Returns:
+        Tuple of the neat.Population and the fastest genome stored with the snapshot, or None.
+    """
+    records = []
+    for header, arrays in readRecords(path):
+        records.append((header, arrays))
+        if header["generation"] == generation:
+            break
+    if not records or (generation is not None and records[-1][0]["generation"] != generation):
+        raise ValueError(f"{path} has no snapshot of generation {generation}")
+    header, arrays = records[-1]
+
+    keys = set(arrays["populationKeys"].tolist())
+    keys.update(species["representative"] for species in header["species"])
+    if header["fastestGenome"] is not None:
+        keys.add(header["fastestGenome"])
+    genomes = {}
+    for recordHeader, recordArrays in records:
+        genomes.update(decodeGenomes(recordHeader, recordArrays, keys, config.genome_config, config.genome_type))
+    for key, fitness in zip(arrays["populationKeys"].tolist(), arrays["populationFitness"].tolist()):
+        genomes[key].fitness = None if np.isnan(fitness) else fitness
+    population = {key: genomes[key] for key in arrays["populationKeys"].tolist()}
+    if header["fastestGenome"] is not None and header["fastestGenome"] not in population:
+        genomes[header["fastestGenome"]].fitness = header["fastestFitness"]
+
+    speciesSet = config.species_set_type(config.species_set_config, neat.reporting.ReporterSet())
+    for speciesHeader in header["species"]:
+        species = neat.species.Species(speciesHeader["key"], speciesHeader["created"])
+        species.last_improved = speciesHeader["lastImproved"]
+        species.fitness = speciesHeader["fitness"]
+        species.adjusted_fitness = speciesHeader["adjustedFitness"]
+        species.fitness_history = speciesHeader["fitnessHistory"]
+        species.representative = genomes[speciesHeader["representative"]]
+        species.members = {key: population[key] for key in speciesHeader["members"]}
+        speciesSet.species[species.key] = species
+        for key in species.members:
+            speciesSet.genome_to_species[key] = species.key
+    speciesSet.indexer = count(header["nextSpeciesId"])
+
+    restored = neat.Population(config, (population, speciesSet, header["generation"]))
+    speciesSet.reporters = restored.reporters
+    restored.reproduction.genome_indexer = count(max(int(recordArrays["genomeKeys"].max(initial=0)) for _, recordArrays in records) + 1)
+    config.genome_config.node_indexer = count(max(max(genome.nodes) for genome in genomes.values()) + 1)
+    random.setstate((header["randomVersion"], tuple(arrays["randomState"].tolist()), header["randomGauss"]))
+    return restored, genomes.get(header["fastestGenome"])
+
+def compareWithCheckpoint(checkpointPath, snapshotPath):
+    """
+    Writes the population of a neat.Checkpointer file in both formats and prints their size and write and load
+    times.
+
+    Args:
+        checkpointPath: Path of a checkpoint written by neat.Checkpointer.
+        snapshotPath: Path the snapshot file is written to.
+    """
+    with gzip.open(checkpointPath) as file:
+        generation, config, population, speciesSet, randomState = pickle.load(file)
+    random.setstate(randomState)
+
+    start = time.perf_counter()
+    neat.Checkpointer(filename_prefix=snapshotPath + ".checkpoint-").save_checkpoint(config, population, speciesSet, generation)
+    checkpointWrite = time.perf_counter() - start
+    start = time.perf_counter()
+    neat.Checkpointer.restore_checkpoint(f"{snapshotPath}.checkpoint-{generation}")
+    checkpointLoad = time.perf_counter() - start
+
+    # The second snapshot is what every later generation costs when its genomes are already in the file
+    writer = SnapshotWriter(snapshotPath)
+    for snapshotGeneration in (generation - 1, generation):
+        writer.start_generation(snapshotGeneration)
+        writer.end_generation(config, population, speciesSet)
+    writer.close()
+    start = time.perf_counter()
+    loadSnapshot(snapshotPath, config, generation)
+    snapshotLoad = time.perf_counter() - start
+
+    checkpointSize = os.path.getsize(f"{snapshotPath}.checkpoint-{generation}")
+    print(f"neat.Checkpointer: {checkpointSize / 1024:.1f} KB, written in {checkpointWrite * 1000:.1f} ms, loaded in {checkpointLoad * 1000:.1f} ms")
+    print(f"Snapshot:          {writer.recordSizes[0] / 1024:.1f} KB, written in {writer.writeSeconds / 2 * 1000:.1f} ms in the background "
+          f"and {writer.captureSeconds / 2 * 1000:.1f} ms in the loop, loaded in {snapshotLoad * 1000:.1f} ms")
+    print(f"Next snapshot:     {writer.recordSizes[1] / 1024:.1f} KB when no genome changed")
+
+if __name__ == "__main__":
+    # Compares the formats on a checkpoint: python snapshots.py checkpoints/129-6.43 /tmp/129.snap
+    if len(sys.argv) != 3:
+        print("Usage: python snapshots.py <neat checkpoint> <snapshot file>")
+        sys.exit(1)
+    compareWithCheckpoint(sys.argv[1], sys.argv[2])
@@ -0,0 +1,162 @@
+import math
+import random
+from collections import deque
+
+class SteadyStateEvolver:
+    """
+    Evolves a population without generation barriers, like rtNEAT. Genomes are simulated in small batches that are
+    handed out as soon as a worker is free. Whenever a batch comes back its genomes join a rolling pool, the worst
+    genomes of the pool are removed and as many children are bred from the pool and handed out, so the workers never
+    wait for the slowest car of a generation. Results are taken in the order the batches were handed out, which keeps
+    a seeded run repeatable while the workers keep simulating the batches behind it.
+    Every time as many genomes have been evaluated as the population holds counts as a generation: the pool is
+    speciated again and the population's reporters see it as the generation's population.
+    """
+
+    def __init__(self, population, submit, score, batchSize=25, maxPending=4):
+        """
+        Args:
+            population: The neat.Population whose configuration, genomes, species and reporters are used.
+            submit: Function that starts simulating a list of (genome_id, genome) pairs and returns a function
+                that waits for and returns the result.
+            score: Function called with each batch and its result, in the order the batches were handed out, that
+                sets the genomes' fitness.
+            batchSize: Genomes simulated together in a batch.
+            maxPending: Batches handed out at once, enough to keep every worker busy.
+        """
+        self.population = population
+        self.submit = submit
+        self.score = score
+        self.batchSize = batchSize
+        self.maxPending = maxPending
+        self.pool = {}  # genome_id -> genome of every evaluated genome still in the population
+        self.parentSpecies = {}  # genome_id -> species of the parents of every child bred since the pool was last speciated
+        self.pending = deque()  # (batch, result) of every batch handed out, in order
+        self.evaluations = 0
+
+    def run(self, numGenerations):
+        """
+        Evaluates as many genomes as numGenerations generations of the population hold.
+
+        Args:
+            numGenerations: Number of generations.
+
+        Returns:
+            The fittest genome evaluated.
+        """
+        population = self.population
+        config = population.config
+        popSize = config.pop_size
+        totalEvaluations = numGenerations * popSize
+        unevaluated = list(population.population.items())
+        submitted = 0
+
+        population.reporters.start_generation(population.generation)
+        while submitted < totalEvaluations or self.pending:
+            # Keep enough batches handed out, starting with the initial genomes and then children of the pool
+            while submitted < totalEvaluations and len(self.pending) < self.maxPending and (unevaluated or self.pool):
+                size = min(self.batchSize, totalEvaluations - submitted)
+                if unevaluated:
+                    batch, unevaluated = unevaluated[:size], unevaluated[size:]
+                else:
+                    batch = [self.breed() for _ in range(size)]
+                self.pending.append((batch, self.submit(batch)))
+                submitted += len(batch)
+
+            batch, result = self.pending.popleft()
+            self.score(batch, result())
+            self.pool.update(batch)
+            self.removeWorst(len(self.pool) - popSize)
+
+            generationBefore = self.evaluations // popSize
+            self.evaluations += len(batch)
+            if self.evaluations // popSize > generationBefore:
+                self.endGeneration()
+        return population.best_genome
+
+    def endGeneration(self):
+        """
+        Speciates the pool and reports it to the population's reporters as a finished generation.
+        """
+        population = self.population
+        population.species.speciate(population.config, self.pool, population.generation)
+        self.parentSpecies.clear()
+        best = max(self.pool.values(), key=lambda genome: genome.fitness)
+        population.reporters.post_evaluate(population.config, self.pool, population.species, best)
+        if population.best_genome is None or best.fitness > population.best_genome.fitness:
+            population.best_genome = best
+        population.population = dict(self.pool)
+        population.reporters.end_generation(population.config, population.population, population.species)
+        population.generation += 1
+        population.reporters.start_generation(population.generation)
+
+    def removeWorst(self, count):
+        """
+        Removes the genomes with the lowest fitness shared with their species, so a young species isn't wiped out
+        by one large species of fit genomes. Children bred since the pool was last speciated share with the species
+        of their parents, so every genome is ranked on the same scale.
+
+        Args:
+            count: Number of genomes to remove.
+        """
+        if count <= 0:
+            return
+        poolSpecies = {genome_id: self.speciesOf(genome_id) for genome_id in self.pool}
+        speciesSizes = {}
+        for speciesId in poolSpecies.values():
+            speciesSizes[speciesId] = speciesSizes.get(speciesId, 0) + 1
+
+        def sharedFitness(genome_id):
+            speciesId = poolSpecies[genome_id]
+            return self.pool[genome_id].fitness / (speciesSizes[speciesId] if speciesId is not None else 1)
+
+        for genome_id in sorted(self.pool, key=sharedFitness)[:count]:
+            del self.pool[genome_id]
+            self.parentSpecies.pop(genome_id, None)
+
+    def speciesOf(self, genome_id):
+        """
+        Args:
+            genome_id: Key of a genome in the pool.
+
+        Returns:
+            Key of the genome's species, its parents' species if it was bred since the pool was last speciated, or
+            None if it has neither.
+        """
+        speciesId = self.population.species.genome_to_species.get(genome_id)
+        return speciesId if speciesId is not None else self.parentSpecies.get(genome_id)
+
+    def breed(self):
+        """
+        Breeds a child from a species picked in proportion to the mean fitness of its members in the pool, by
+        crossing two of the species' fittest genomes and mutating the result.
+
+        Returns:
+            Tuple of the child's (genome_id, genome).
+        """
+        config = self.population.config
+        reproduction = self.population.reproduction
+        speciesMembers = []
+        for species in self.population.species.species.values():
+            members = [self.pool[genome_id] for genome_id in species.members if genome_id in self.pool]
+            if members:
+                speciesMembers.append((species.key, members))
+        if not speciesMembers:
+            speciesMembers = [(None, list(self.pool.values()))]
+
+        meanFitnesses = [sum(genome.fitness for genome in members) / len(members) for _, members in speciesMembers]
+        lowest = min(meanFitnesses)
+        speciesId, members = random.choices(speciesMembers, weights=[fitness - lowest + 1 for fitness in meanFitnesses])[0]
+        members = sorted(members, key=lambda genome: genome.fitness, reverse=True)
+        parents = members[:max(2, math.ceil(config.reproduction_config.survival_threshold * len(members)))]
+        parent1 = random.choice(parents)
+        parent2 = random.choice(parents)
+
+        key = next(reproduction.genome_indexer)
+        child = config.genome_type(key)
+        child.configure_crossover(parent1, parent2, config.genome_config)
+        child.mutate(config.genome_config)
+        reproduction.ancestors[key] = (parent1.key, parent2.key)
+        if speciesId is not None:
+            self.parentSpecies[key] = speciesId
+        return key, child
@@ -0,0 +1,55 @@
+import os
+import random
+import numpy as np
+import neat
+import pytest
+from batchNetwork import BatchNetwork
+
+def loadConfig(name):
+    return neat.config.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        os.path.join(os.path.dirname(__file__), "..", "configFiles", name)
+    )
+
+def mutatedGenomes(config, numGenomes, mutations):
+    genomes = []
+    for key in range(numGenomes):
+        genome = config.genome_type(key)
+        genome.configure_new(config.genome_config)
+        for _ in range(mutations):
+            genome.mutate(config.genome_config)
+        genomes.append((key, genome))
+    return genomes
+
+def checkMatchesActivate(configName, numGenomes, mutations):
+    random.seed(3)
+    config = loadConfig(configName)
+    genomes = mutatedGenomes(config, numGenomes, mutations)
+    network = BatchNetwork(genomes, config)
+    inputs = np.random.default_rng(3).uniform(-2, 2, (numGenomes, len(config.genome_config.input_keys)))
+    rows = list(range(0, numGenomes, 2))  # Only some of the cars are still driving
+
+    outputs = network.activate(inputs[rows], rows)
+    for position, row in enumerate(rows):
+        expected = neat.nn.FeedForwardNetwork.create(genomes[row][1], config).activate(inputs[row].tolist())
+        np.testing.assert_allclose(outputs[position], expected, rtol=1e-9, atol=1e-12)
+
+def test_matchesActivateBestTime():
+    checkMatchesActivate("config.txt", 60, 30)
+
+def test_matchesActivateHeadToHeadWithHiddenNodes():
+    checkMatchesActivate("configHeadToHead.txt", 60, 60)
+
+def test_rejectsAggregationsOtherThanSum():
+    config = loadConfig("configHeadToHead.txt")
+    genomes = mutatedGenomes(config, 4, 20)
+    genomes[2][1].nodes[0].aggregation = "product"
+    with pytest.raises(ValueError):
+        BatchNetwork(genomes, config)
+
+    config.genome_config.aggregation_options = ["sum", "max"]
+    with pytest.raises(ValueError):
+        BatchNetwork(mutatedGenomes(config, 4, 0), config)
@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import pytest
+from car import Car, loadCarImage, cacheRotations
+from track import loadTrack
+from collision import getFootprints, checkFleetCollisions
+from simulation import checkCollisionWithWhitePixels, checkCollisionWithFinishLine
+
+def repoPath(*parts):
+    return os.path.join(os.path.dirname(__file__), "..", *parts)
+
+@pytest.mark.parametrize("trackName", ["easyTest.png", "hardTest.png"])
+def test_fleetCollisionsMatchMaskChecks(trackName):
+    track = loadTrack(repoPath("images", trackName))
+    carImage = loadCarImage(repoPath("images", "f1CarRed.png"))
+    cacheRotations(carImage)
+
+    # Poses all over the track, a little past its edges and around the finish line
+    rng = np.random.default_rng(4)
+    finishX, finishY = np.nonzero(track.finishLineGrid())
+    carX = np.concatenate((rng.uniform(-20, track.width + 20, 400), rng.uniform(finishX.min() - 40, finishX.max() + 40, 200)))
+    carY = np.concatenate((rng.uniform(-20, track.height + 20, 400), rng.uniform(finishY.min() - 40, finishY.max() + 40, 200)))
+    carAngle = rng.uniform(-np.pi, np.pi, len(carX))
+
+    expectedCrashed = []
+    expectedFinishLine = []
+    for x, y, angle in zip(carX.tolist(), carY.tolist(), carAngle.tolist()):
+        car = Car(x, y, carImage)
+        car.carAngle = angle
+        checkCollisionWithWhitePixels(car, track)
+        expectedCrashed.append(car.crashed)
+        expectedFinishLine.append(checkCollisionWithFinishLine(car, track))
+
+    crashed, hitFinishLine = checkFleetCollisions(track, getFootprints(carImage), carX, carY, carAngle)
+    assert crashed.tolist() == expectedCrashed
+    assert hitFinishLine.tolist() == expectedFinishLine
+    assert any(expectedCrashed) and not all(expectedCrashed) and any(expectedFinishLine)
@@ -0,0 +1,53 @@
+import os
+from itertools import count
+import neat
+from islands import renumberGenome, startIslands, collectReports
+
+def loadConfig():
+    return neat.config.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        os.path.join(os.path.dirname(__file__), "..", "configFiles", "configHeadToHead.txt")
+    )
+
+def test_renumberGenomeWithHiddenIdsPastTheCounter():
+    senderConfig = loadConfig()
+    genome = senderConfig.genome_type(1)
+    genome.configure_new(senderConfig.genome_config)
+    genome.mutate_add_node(senderConfig.genome_config)
+    hiddenIds = sorted(set(genome.nodes) - set(senderConfig.genome_config.output_keys))
+    assert len(hiddenIds) >= 2
+
+    # The receiver's counter hands out an id the immigrant already uses for a hidden node
+    receiverConfig = loadConfig()
+    receiverConfig.genome_config.node_indexer = count(hiddenIds[1])
+    weights = {key: connection.weight for key, connection in genome.connections.items()}
+    renumberGenome(genome, receiverConfig.genome_config, 7)
+
+    assert genome.key == 7
+    newHiddenIds = sorted(set(genome.nodes) - set(receiverConfig.genome_config.output_keys))
+    assert newHiddenIds == list(range(hiddenIds[1], hiddenIds[1] + len(hiddenIds)))
+    assert all(node.key == nodeId for nodeId, node in genome.nodes.items())
+    assert all(connection.key == key for key, connection in genome.connections.items())
+    assert sorted(connection.weight for connection in genome.connections.values()) == sorted(weights.values())
+    inputKeys = set(receiverConfig.genome_config.input_keys)
+    assert all(inputId in inputKeys or inputId in genome.nodes for inputId, _ in genome.connections)
+    assert all(outputId in genome.nodes for _, outputId in genome.connections)
+
+    # A receiver that never handed out a hidden id starts after the immigrant's ids
+    genome = senderConfig.genome_type(2)
+    genome.configure_new(senderConfig.genome_config)
+    receiverConfig = loadConfig()
+    renumberGenome(genome, receiverConfig.genome_config, 8)
+    assert min(set(genome.nodes) - set(receiverConfig.genome_config.output_keys)) > 1
+
+def waitForMigrants(island):
+    # Island 0 stops before its first migration, island 1 waits for its migrants
+    if island.index == 1:
+        island.reports.put((island.index, 0, island.receive()))
+
+def test_islandStopsWaitingWhenThePreviousIslandStops():
+    processes, reports, inboxes = startIslands(2, waitForMigrants, 1, 2)
+    assert list(collectReports(processes, reports, inboxes)) == [(1, 0, None)]
@@ -0,0 +1,34 @@
+import os
+import numpy as np
+import pytest
+from track import loadTrack
+from progress import createProgressField, updateProgressField
+
+def repoPath(*parts):
+    return os.path.join(os.path.dirname(__file__), "..", *parts)
+
+def editAround(wallGrid, pixel, radius, wall):
+    x, y = pixel
+    left, top = max(x - radius, 0), max(y - radius, 0)
+    right, bottom = min(x + radius, wallGrid.shape[0]), min(y + radius, wallGrid.shape[1])
+    edited = wallGrid.copy()
+    edited[left:right, top:bottom] = wall
+    return edited, (left, top, right, bottom)
+
+@pytest.mark.parametrize("trackName", ["easyTest.png", "hardTest.png"])
+@pytest.mark.parametrize("lapFraction, radius, wall", [(0.5, 8, True), (0.3, 12, False), (0.7, 40, True)])
+def test_updateMatchesRebuild(trackName, lapFraction, radius, wall):
+    track = loadTrack(repoPath("images", trackName))
+    finishLineGrid = track.finishLineGrid()
+
+    # Edit around the pixel of the road closest to the fraction of the lap, a wall block or an opening in the walls
+    road = np.where(track.progressField >= 0, np.abs(track.progressField - lapFraction), np.inf)
+    pixel = np.unravel_index(np.argmin(road), road.shape)
+    edited, rect = editAround(track.wallGrid, pixel, radius, wall)
+    edited &= ~finishLineGrid
+    assert (edited != track.wallGrid).any()
+
+    progressField, lapLength = updateProgressField(track.progressField, track.lapLength, edited, finishLineGrid, *rect)
+    expectedField, expectedLength = createProgressField(edited, finishLineGrid)
+    assert lapLength == expectedLength
+    np.testing.assert_array_equal(progressField, expectedField)
@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import pytest
+from car import Car, loadCarImage
+from track import loadTrack
+from sensors import castRays
+
+def repoPath(*parts):
+    return os.path.join(os.path.dirname(__file__), "..", *parts)
+
+def randomPoses(track, numPoses, seed):
+    rng = np.random.default_rng(seed)
+    return (
+        rng.uniform(0, track.width, numPoses),
+        rng.uniform(0, track.height, numPoses),
+        rng.uniform(-np.pi, np.pi, numPoses)
+    )
+
+def castLines(track, carImage, carX, carY, carAngle):
+    distances = []
+    for x, y, angle in zip(carX.tolist(), carY.tolist(), carAngle.tolist()):
+        car = Car(x, y, carImage)
+        car.carAngle = angle
+        car.castLines(track.trackMaskSurface, track.pixelArray)
+        distances.append([car.frontCast, car.leftCast, car.rightCast, car.left30AngleCast, car.right30AngleCast, car.left45AngleCast, car.right45AngleCast])
+    return np.array(distances)
+
+@pytest.mark.parametrize("trackName", ["easyTest.png", "hardTest.png"])
+def test_castRaysMatchesCastLines(trackName):
+    track = loadTrack(repoPath("images", trackName))
+    carX, carY, carAngle = randomPoses(track, 300, 2)
+    expected = castLines(track, loadCarImage(repoPath("images", "f1CarRed.png")), carX, carY, carAngle)
+    np.testing.assert_array_equal(castRays(track.wallGrid, carX, carY, carAngle), expected)
+
+@pytest.mark.parametrize("trackName", ["easyTest.png", "hardTest.png"])
+def test_distanceFieldMatchesCastLines(trackName):
+    track = loadTrack(repoPath("images", trackName))
+    carX, carY, carAngle = randomPoses(track, 300, 3)
+    expected = castLines(track, loadCarImage(repoPath("images", "f1CarRed.png")), carX, carY, carAngle)
+    np.testing.assert_array_equal(castRays(track.wallGrid, carX, carY, carAngle, track.distanceField), expected)
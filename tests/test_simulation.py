@@ -0,0 +1,45 @@
+import os
+import random
+import neat
+from car import loadCarImage
+from track import loadTrack
+from parallel import simulateGenomes
+
+def repoPath(*parts):
+    return os.path.join(os.path.dirname(__file__), "..", *parts)
+
+def loadConfig(name):
+    return neat.config.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        repoPath("configFiles", name)
+    )
+
+def newGenomes(config, numGenomes):
+    genomes = []
+    for key in range(numGenomes):
+        genome = config.genome_type(key)
+        genome.configure_new(config.genome_config)
+        genomes.append((key, genome))
+    return genomes
+
+def test_carriedOnCarsMatchDrivingFromTheStart():
+    random.seed(5)
+    config = loadConfig("config.txt")
+    genomes = newGenomes(config, 40)
+    track = loadTrack(repoPath("images", "easyTest.png"))
+    carImage = loadCarImage(repoPath("images", "f1CarRed.png"))
+    multipliers = (1, 1, 1, 1)
+    dt = 1 / 80
+
+    expectedFitnesses, expectedLaps, _ = simulateGenomes(genomes, config, track, carImage, multipliers, 6, dt)
+    _, _, states = simulateGenomes(genomes, config, track, carImage, multipliers, 3, dt)
+    assert any(not state["car"]["crashed"] for state in states)  # Some cars are still driving at the shorter limit
+
+    # Every other car starts from the start line again
+    states = [state if idx % 2 == 0 else None for idx, state in enumerate(states)]
+    fitnesses, laps, _ = simulateGenomes(genomes, config, track, carImage, multipliers, 6, dt, states=states)
+    assert fitnesses == expectedFitnesses
+    assert laps == expectedLaps
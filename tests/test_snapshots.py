@@ -0,0 +1,47 @@
+import os
+import random
+import neat
+from main import creditFastestGenome
+from snapshots import SnapshotWriter, loadSnapshot
+
+def loadConfig(name):
+    return neat.config.Config(
+        neat.DefaultGenome,
+        neat.DefaultReproduction,
+        neat.DefaultSpeciesSet,
+        neat.DefaultStagnation,
+        os.path.join(os.path.dirname(__file__), "..", "configFiles", name)
+    )
+
+# Scores genomes at random and credits the first car to the fastest genome like Best Time mode. The worst genome of
+# the first generation is made the fastest, so it has left the population by the snapshot.
+class FastestGenomeRace:
+    def __init__(self, fastest=None):
+        self.fastest = fastest
+
+    def evaluate(self, genomes, config):
+        for _, genome in genomes:
+            genome.fitness = random.random()
+        if self.fastest is None:
+            self.fastest = min((genome for _, genome in genomes), key=lambda genome: genome.fitness)
+            return
+        creditFastestGenome(genomes, self.fastest)
+
+def test_resumeWithFastestGenomeOutsideThePopulation(tmp_path):
+    random.seed(7)
+    config = loadConfig("config.txt")
+    population = neat.Population(config)
+    race = FastestGenomeRace()
+    path = str(tmp_path / "run.snap")
+    writer = SnapshotWriter(path, 1, lambda: race.fastest)
+    population.add_reporter(writer)
+    population.run(race.evaluate, 3)
+    writer.close()
+
+    restored, fastest = loadSnapshot(path, loadConfig("config.txt"))
+    assert fastest.key == race.fastest.key
+    assert fastest.key not in restored.population
+    assert fastest.fitness == race.fastest.fitness
+
+    # The first generation after resuming credits the restored fastest genome
+    restored.run(FastestGenomeRace(fastest).evaluate, 1)
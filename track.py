@@ -0,0 +1,492 @@
+import sys
+import json
+from multiprocessing import shared_memory
+import pygame
+import numpy as np
+from sensors import createDistanceField, updateDistanceField
+from progress import createProgressField, updateProgressField
+
+# Compiled track files start with this, then the length of a JSON header, the header and the arrays it describes
+trackFileMagic = b"RLTRACK\x02"
+trackFileAlignment = 64  # Every array starts on a multiple of this many bytes
+
+class Track:
+    """
+    Holds a drawn track and the masks derived from it for collisions and sensors.
+    """
+
+    def __init__(self, surface, startX, startY):
+        """
+        Initializes the track from a drawn surface and the cars' starting position.
+
+        Args:
+            surface: Pygame surface the track was drawn on.
+            startX: Initial x-coordinate of every car.
+            startY: Initial y-coordinate of every car.
+        """
+        self.surface = surface
+        self.width = surface.get_width()
+        self.height = surface.get_height()
+        self.startX = startX
+        self.startY = startY
+        self.path = None  # Compiled track file the track was loaded from
+        self.sharedMemory = None  # Shared memory block the track's arrays live in
+        self.cachedPixelArray = None
+        self.cachedCollisionGrids = None
+        self.cachedFinishLineGrid = None
+
+        self.createMasks()
+
+    def __getstate__(self):
+        """
+        Pickles the track so it can be sent to worker processes. A track loaded from a compiled file only sends the
+        path and a shared track only sends the name of its shared memory, so every worker maps the same arrays.
+        Any other track is sent as raw RGBA pixels.
+        """
+        if self.path is not None:
+            return {"path": self.path}
+        if self.sharedMemory is not None:
+            return {"sharedMemory": self.sharedMemory.name, "header": self.header()}
+        return {
+            "pixels": pygame.image.tostring(self.surface, "RGBA"),
+            "size": (self.width, self.height),
+            "start": (self.startX, self.startY)
+        }
+
+    def __setstate__(self, state):
+        """
+        Rebuilds the track and its masks from the pickled pixels or compiled file.
+        """
+        if "path" in state:
+            self.__dict__.update(loadCompiledTrack(state["path"]).__dict__)
+            return
+        if "sharedMemory" in state:
+            self.__dict__.update(attachSharedTrack(state["sharedMemory"], state["header"]).__dict__)
+            return
+        surface = pygame.image.fromstring(state["pixels"], state["size"], "RGBA")
+        self.__init__(surface, *state["start"])
+
+    @property
+    def pixelArray(self):
+        """
+        Pixel array of the track surface, only built the first time something reads pixels directly.
+        """
+        if self.cachedPixelArray is None:
+            self.cachedPixelArray = pygame.surfarray.array2d(self.trackMaskSurface)
+        return self.cachedPixelArray
+
+    def finishLineGrid(self):
+        """
+        Returns:
+            Boolean array indexed [x, y] that is True on the finish line, converted from its mask the first time it
+            is needed.
+        """
+        if self.cachedFinishLineGrid is None:
+            self.cachedFinishLineGrid = maskToGrid(self.finishLineMask)
+        return self.cachedFinishLineGrid
+
+    def collisionGrids(self):
+        """
+        Builds the grids collisions are checked against in bulk the first time they are needed.
+
+        Returns:
+            Tuple of the out-of-bounds row prefix sums, the out-of-bounds summed area table, the distance field to the
+            closest out-of-bounds pixel, the finish-line row prefix sums and the finish line's bounding box
+            (left, top, right, bottom), or None if the track has no finish line.
+        """
+        if self.cachedCollisionGrids is None:
+            outOfBoundsGrid = maskToGrid(self.outOfBoundsMask)
+            # The sensors' walls are almost always the same pixels, so their distance field can be reused
+            if np.array_equal(outOfBoundsGrid, self.wallGrid):
+                outOfBoundsField = self.distanceField
+            else:
+                outOfBoundsField = createDistanceField(outOfBoundsGrid)
+
+            finishLineGrid = self.finishLineGrid()
+            finishLineBox = None
+            if finishLineGrid.any():
+                finishX, finishY = np.nonzero(finishLineGrid)
+                finishLineBox = (finishX.min(), finishY.min(), finishX.max(), finishY.max())
+            self.cachedCollisionGrids = (
+                rowPrefixSums(outOfBoundsGrid),
+                summedAreaTable(outOfBoundsGrid),
+                outOfBoundsField,
+                rowPrefixSums(finishLineGrid),
+                finishLineBox
+            )
+        return self.cachedCollisionGrids
+
+    def createMasks(self):
+        """
+        Builds the wall grid and distance field used by the sensors, the masks used for collisions and the progress
+        field used to tell how far around the lap a car is.
+        """
+        self.createMaskSurface()
+
+        # Opaque white pixels are walls, indexed [x, y] like the pixel array
+        self.wallGrid = np.all(pygame.surfarray.array3d(self.trackMaskSurface) == 255, axis=2) & (pygame.surfarray.array_alpha(self.trackMaskSurface) == 255)
+        self.distanceField = createDistanceField(self.wallGrid)
+
+        self.outOfBoundsMask = pygame.mask.from_threshold(
+            self.trackMaskSurface, (255, 255, 255, 255), (1, 1, 1, 255)
+        )
+        self.finishLineMask = pygame.mask.from_threshold(
+            self.trackMaskSurface, (144, 238, 144, 255), (1, 1, 1, 255)
+        )
+        self.progressField, self.lapLength = createProgressField(self.wallGrid, self.finishLineGrid())
+
+    def update(self, surface, rects):
+        """
+        Updates the track after it was drawn on, rebuilding only the parts of the masks, grids and fields the drawing
+        could have changed instead of calling createMasks again. The result is the same as building a new track from
+        the surface.
+
+        Args:
+            surface: Pygame surface the track was drawn on, the same size as before.
+            rects: List of pygame rects holding every pixel that was drawn on.
+        """
+        if self.path is not None or self.sharedMemory is not None:
+            # Compiled and shared arrays are read only or seen by other processes
+            self.wallGrid = self.wallGrid.copy()
+            self.distanceField = self.distanceField.copy()
+            self.progressField = self.progressField.copy()
+            if self.cachedFinishLineGrid is not None:
+                self.cachedFinishLineGrid = self.cachedFinishLineGrid.copy()
+            self.path = None
+            self.sharedMemory = None
+        self.surface = surface
+        if pygame.display.get_surface() is None:
+            self.trackMaskSurface = surface
+        rect = pygame.Rect(rects[0]).unionall(rects[1:]).clip(surface.get_rect()) if rects else pygame.Rect(0, 0, 0, 0)
+        if rect.width == 0 or rect.height == 0:
+            return
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        if self.trackMaskSurface is not surface:
+            # Adding onto cleared pixels copies them exactly, where a normal blit would blend them by their alpha
+            self.trackMaskSurface.fill((0, 0, 0, 0), rect)
+            self.trackMaskSurface.blit(surface.subsurface(rect).convert_alpha(), rect, special_flags=pygame.BLEND_RGBA_ADD)
+        region = self.trackMaskSurface.subsurface(rect)
+
+        self.wallGrid[left:right, top:bottom] = np.all(pygame.surfarray.array3d(region) == 255, axis=2) & (pygame.surfarray.array_alpha(region) == 255)
+        updateDistanceField(self.distanceField, self.wallGrid, left, top, right, bottom)
+
+        erased = pygame.Mask(rect.size, fill=True)
+        outOfBounds = pygame.mask.from_threshold(region, (255, 255, 255, 255), (1, 1, 1, 255))
+        self.outOfBoundsMask.erase(erased, rect.topleft)
+        self.outOfBoundsMask.draw(outOfBounds, rect.topleft)
+        finishLine = pygame.mask.from_threshold(region, (144, 238, 144, 255), (1, 1, 1, 255))
+        self.finishLineMask.erase(erased, rect.topleft)
+        self.finishLineMask.draw(finishLine, rect.topleft)
+        finishLineRegion = maskToGrid(finishLine)
+        if self.cachedFinishLineGrid is not None:
+            self.cachedFinishLineGrid[left:right, top:bottom] = finishLineRegion
+        finishLineGrid = self.finishLineGrid()
+
+        if self.cachedPixelArray is not None:
+            self.cachedPixelArray[left:right, top:bottom] = pygame.surfarray.array2d(region)
+        if self.cachedCollisionGrids is not None:
+            self.updateCollisionGrids(maskToGrid(outOfBounds), finishLineRegion, finishLineGrid, rect)
+
+        self.progressField, self.lapLength = updateProgressField(self.progressField, self.lapLength, self.wallGrid, finishLineGrid, left, top, right, bottom)
+
+    def updateCollisionGrids(self, outOfBoundsRegion, finishLineRegion, finishLineGrid, rect):
+        """
+        Updates the cached collision grids after the pixels in a rect changed. Only the rows of the prefix sums that
+        cross the rect and the columns of the summed area table from its top down are counted again.
+
+        Args:
+            outOfBoundsRegion: Boolean array of the out-of-bounds pixels in the rect.
+            finishLineRegion: Boolean array of the finish-line pixels in the rect.
+            finishLineGrid: Boolean array of every finish-line pixel.
+            rect: Pygame rect that changed.
+        """
+        outOfBoundsRowSums, outOfBoundsAreaSums, outOfBoundsField, finishLineRowSums, finishLineBox = self.cachedCollisionGrids
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        if outOfBoundsField is not self.distanceField or not np.array_equal(outOfBoundsRegion, self.wallGrid[left:right, top:bottom]):
+            # The out-of-bounds pixels have their own distance field, which is rare enough to just build again
+            self.cachedCollisionGrids = None
+            return
+
+        for rowSums, region in ((outOfBoundsRowSums, outOfBoundsRegion), (finishLineRowSums, finishLineRegion)):
+            before = rowSums[right, top:bottom] - rowSums[left, top:bottom]
+            rowSums[left + 1:right + 1, top:bottom] = rowSums[left, top:bottom] + np.cumsum(region, axis=0, dtype=np.int32)
+            rowSums[right + 1:, top:bottom] += rowSums[right, top:bottom] - rowSums[left, top:bottom] - before
+        np.cumsum(outOfBoundsRowSums[:, top:], axis=1, out=outOfBoundsAreaSums[:, top + 1:])
+        outOfBoundsAreaSums[:, top + 1:] += outOfBoundsAreaSums[:, top:top + 1]
+
+        finishLineBox = None
+        if finishLineGrid.any():
+            finishX, finishY = np.nonzero(finishLineGrid)
+            finishLineBox = (finishX.min(), finishY.min(), finishX.max(), finishY.max())
+        self.cachedCollisionGrids = (outOfBoundsRowSums, outOfBoundsAreaSums, outOfBoundsField, finishLineRowSums, finishLineBox)
+
+    def createMaskSurface(self):
+        """
+        Creates the surface the masks and pixel array are read from.
+        """
+        # Worker processes have no display to convert to, but an unpickled track already has an alpha channel
+        if pygame.display.get_surface() is not None:
+            self.trackMaskSurface = self.surface.convert_alpha()
+        else:
+            self.trackMaskSurface = self.surface
+        self.cachedPixelArray = None
+        self.cachedCollisionGrids = None
+        self.cachedFinishLineGrid = None
+
+    def arrays(self):
+        """
+        Returns:
+            Dictionary of every array a compiled or shared track is built from: the RGBA pixels, wall grid,
+            distance field, the out-of-bounds and finish-line bitmaps and the progress field.
+        """
+        return {
+            "pixels": np.frombuffer(pygame.image.tostring(self.surface, "RGBA"), dtype=np.uint8).reshape(self.height, self.width, 4),
+            "wallGrid": self.wallGrid,
+            "distanceField": self.distanceField,
+            "outOfBounds": maskToGrid(self.outOfBoundsMask),
+            "finishLine": self.finishLineGrid(),
+            "progress": self.progressField
+        }
+
+    def header(self):
+        """
+        Returns:
+            Dictionary of the track's size, start position, lap length and where each of its arrays is stored.
+        """
+        header = {"width": self.width, "height": self.height, "startX": self.startX, "startY": self.startY, "lapLength": self.lapLength, "arrays": {}}
+        offset = 0
+        for name, (dtype, shape) in arrayLayouts(self.width, self.height).items():
+            header["arrays"][name] = {"dtype": dtype.str, "shape": shape, "offset": offset}
+            offset += alignedSize(dtype.itemsize * int(np.prod(shape)))
+        header["size"] = offset
+        return header
+
+    def save(self, path):
+        """
+        Compiles the track to a file holding its pixels, start position, wall grid, distance field, collision
+        bitmaps and progress field, so it can be loaded with loadCompiledTrack without decoding an image or building anything.
+
+        Args:
+            path: Path of the compiled track file.
+        """
+        header = self.header()
+        headerBytes = json.dumps(header).encode()
+        dataStart = alignedSize(len(trackFileMagic) + 4 + len(headerBytes))
+        with open(path, "wb") as file:
+            file.write(trackFileMagic)
+            file.write(len(headerBytes).to_bytes(4, "little"))
+            file.write(headerBytes)
+            for name, array in self.arrays().items():
+                file.seek(dataStart + header["arrays"][name]["offset"])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.truncate(dataStart + header["size"])
+
+    def share(self):
+        """
+        Copies the track's arrays into one shared memory block. The returned track is backed by the block, and
+        pickling it only sends the block's name, so worker processes attach to the same arrays without copying them.
+        The caller frees the block with sharedMemory.unlink() once no process needs it.
+
+        Returns:
+            The shared track.
+        """
+        header = self.header()
+        memory = shared_memory.SharedMemory(create=True, size=max(header["size"], 1))
+        buffer = np.ndarray(header["size"], dtype=np.uint8, buffer=memory.buf)
+        arrays = self.arrays()
+        for name, array in viewArrays(buffer, header).items():
+            array[...] = arrays[name]
+
+        track = trackFromArrays(viewArrays(buffer, header), header)
+        track.sharedMemory = memory
+        return track
+
+def alignedSize(size):
+    """
+    Rounds a number of bytes up to a multiple of trackFileAlignment.
+    """
+    return -(-size // trackFileAlignment) * trackFileAlignment
+
+def arrayLayouts(width, height):
+    """
+    Returns:
+        Dictionary of every stored array's name -> (dtype, shape) for a track of the given size.
+    """
+    return {
+        "pixels": (np.dtype(np.uint8), (height, width, 4)),
+        "wallGrid": (np.dtype(bool), (width, height)),
+        "distanceField": (np.dtype(np.int32), (width, height)),
+        "outOfBounds": (np.dtype(bool), (width, height)),
+        "finishLine": (np.dtype(bool), (width, height)),
+        "progress": (np.dtype(np.float32), (width, height))
+    }
+
+def viewArrays(buffer, header):
+    """
+    Creates array views of the stored arrays without copying them.
+
+    Args:
+        buffer: Array of bytes the arrays are stored in, starting with the first array.
+        header: Dictionary returned by Track.header.
+
+    Returns:
+        Dictionary of name -> array view.
+    """
+    arrays = {}
+    for name, layout in header["arrays"].items():
+        dtype = np.dtype(layout["dtype"])
+        start = layout["offset"]
+        count = int(np.prod(layout["shape"]))
+        arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(layout["shape"])
+    return arrays
+
+def trackFromArrays(arrays, header):
+    """
+    Creates a track whose surface, wall grid and distance field are the given arrays, without building anything.
+
+    Args:
+        arrays: Dictionary returned by viewArrays.
+        header: Dictionary returned by Track.header.
+
+    Returns:
+        The track.
+    """
+    track = Track.__new__(Track)
+    track.surface = pygame.image.frombuffer(arrays["pixels"], (header["width"], header["height"]), "RGBA")
+    track.width = header["width"]
+    track.height = header["height"]
+    track.startX = header["startX"]
+    track.startY = header["startY"]
+    track.path = None
+    track.sharedMemory = None
+    track.createMaskSurface()
+    track.wallGrid = arrays["wallGrid"]
+    track.distanceField = arrays["distanceField"]
+    track.outOfBoundsMask = gridToMask(arrays["outOfBounds"])
+    track.finishLineMask = gridToMask(arrays["finishLine"])
+    track.cachedFinishLineGrid = arrays["finishLine"]
+    track.progressField = arrays["progress"]
+    track.lapLength = header["lapLength"]
+    return track
+
+def maskToGrid(mask):
+    """
+    Converts a pygame mask to a boolean array.
+
+    Args:
+        mask: The pygame mask.
+
+    Returns:
+        Boolean array indexed [x, y] that is True where the mask is set.
+    """
+    return pygame.surfarray.array_red(mask.to_surface()) == 255
+
+def rowPrefixSums(grid):
+    """
+    Counts the set pixels of a grid before every position of each row.
+
+    Args:
+        grid: Boolean array indexed [x, y].
+
+    Returns:
+        Integer array of shape (width + 1, height) where [x, y] is the number of set pixels in grid[:x, y].
+    """
+    rowSums = np.zeros((grid.shape[0] + 1, grid.shape[1]), dtype=np.int32)
+    np.cumsum(grid, axis=0, out=rowSums[1:])
+    return rowSums
+
+def summedAreaTable(grid):
+    """
+    Counts the set pixels of a grid above and to the left of every position.
+
+    Args:
+        grid: Boolean array indexed [x, y].
+
+    Returns:
+        Integer array of shape (width + 1, height + 1) where [x, y] is the number of set pixels in grid[:x, :y].
+    """
+    areaSums = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(grid, axis=0, dtype=np.int32), axis=1, out=areaSums[1:, 1:])
+    return areaSums
+
+def gridToMask(grid):
+    """
+    Converts a boolean array to a pygame mask.
+
+    Args:
+        grid: Boolean array indexed [x, y].
+
+    Returns:
+        Pygame mask that is set where the grid is True.
+    """
+    surface = pygame.surfarray.make_surface(grid.astype(np.uint8))
+    surface.set_colorkey(0)
+    return pygame.mask.from_surface(surface)
+
+def loadCompiledTrack(path):
+    """
+    Loads a track compiled by Track.save. The file is memory mapped, so the pixels, wall grid and distance field are
+    only read from disk as they are used and every process that loads the same file shares them.
+
+    Args:
+        path: Path of the compiled track file.
+
+    Returns:
+        The track.
+    """
+    with open(path, "rb") as file:
+        magic = file.read(len(trackFileMagic))
+        if magic[:-1] == trackFileMagic[:-1] and magic != trackFileMagic:
+            raise ValueError(f"{path} was compiled by another version, compile the track image again")
+        if magic != trackFileMagic:
+            raise ValueError(f"{path} is not a compiled track file")
+        headerLength = int.from_bytes(file.read(4), "little")
+        header = json.loads(file.read(headerLength))
+    dataStart = alignedSize(len(trackFileMagic) + 4 + headerLength)
+
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=dataStart, shape=header["size"])
+    track = trackFromArrays(viewArrays(data, header), header)
+    track.path = path
+    return track
+
+def attachSharedTrack(name, header):
+    """
+    Attaches to a track shared by Track.share in another process, without copying its arrays.
+
+    Args:
+        name: Name of the shared memory block.
+        header: Dictionary returned by Track.header.
+
+    Returns:
+        The track.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    buffer = np.ndarray(header["size"], dtype=np.uint8, buffer=memory.buf)
+    track = trackFromArrays(viewArrays(buffer, header), header)
+    track.sharedMemory = memory
+    return track
+
+def loadTrack(path):
+    """
+    Loads a compiled track file or a track image. A track image starts the cars where main.py places them on a
+    drawn track.
+
+    Args:
+        path: Path of a compiled track file (.track) or a track image.
+
+    Returns:
+        The track.
+    """
+    if path.endswith(".track"):
+        return loadCompiledTrack(path)
+    surface = pygame.image.load(path)
+    return Track(surface, surface.get_width() / 2 - 23, surface.get_height() * 0.9)
+
+if __name__ == "__main__":
+    # Compiles a track image: python track.py images/hardTest.png images/hardTest.track
+    if len(sys.argv) != 3:
+        print("Usage: python track.py <track image> <compiled track>")
+        sys.exit(1)
+    pygame.init()
+    loadTrack(sys.argv[1]).save(sys.argv[2])
+    print(f"Compiled {sys.argv[1]} to {sys.argv[2]}")